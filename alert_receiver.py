@@ -0,0 +1,122 @@
+"""
+Local stand-in for alert receivers: prints what the dashboard's webhook
+and SMTP sinks deliver.
+
+  python alert_receiver.py                       # webhook :9009, SMTP :2525
+  python alert_receiver.py --fail-rate 0.5       # answer half the webhooks with 503
+
+Point the server at it with
+  DASHBOARD_ALERT_WEBHOOK_URL=http://127.0.0.1:9009/alerts
+  DASHBOARD_ALERT_SMTP_HOST=127.0.0.1 DASHBOARD_ALERT_SMTP_PORT=2525 DASHBOARD_ALERT_SMTP_TO=staff@example.org
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import socketserver
+import threading
+from email import message_from_bytes
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+
+def make_webhook_handler(fail_rate: float):
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self) -> None:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if random.random() < fail_rate:
+                print("[webhook] answering 503")
+                self.send_response(503)
+                self.end_headers()
+                return
+            try:
+                n = json.loads(body)
+                print(f"[webhook] {n['location_tag'] or 'No location'}: {len(n['events'])} events")
+                for e in n["events"]:
+                    print(f"  {e['timestamp_utc']}  {e['device_id']}  {e['event']}: {e['status']} {e['reasons']}")
+            except (ValueError, KeyError, TypeError):
+                print(f"[webhook] unexpected body: {body[:200]!r}")
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+    return WebhookHandler
+
+
+class SmtpHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib.send_message (no auth, no TLS)."""
+
+    def reply(self, line: str) -> None:
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self) -> None:
+        self.reply("220 alert-receiver ready")
+        rcpts: List[str] = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line.decode("utf-8", "replace").strip()
+            verb = cmd.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 alert-receiver")
+            elif verb == "MAIL":
+                rcpts = []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                rcpts.append(cmd.split(":", 1)[-1].strip())
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk in (b".\r\n", b".\n"):
+                        break
+                    # Undo dot-stuffing
+                    data.append(chunk[1:] if chunk.startswith(b"..") else chunk)
+                msg = message_from_bytes(b"".join(data))
+                print(f"[smtp] to {', '.join(rcpts)}: {msg['Subject']}")
+                for text in msg.get_payload(decode=True).decode("utf-8", "replace").splitlines():
+                    print(f"  {text}")
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            elif verb in ("RSET", "NOOP"):
+                self.reply("250 OK")
+            else:
+                self.reply("502 Command not implemented")
+
+
+class ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python alert_receiver.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--http-port", type=int, default=9009)
+    parser.add_argument("--smtp-port", type=int, default=2525)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of webhooks answered with 503")
+    args = parser.parse_args(argv)
+
+    smtp = ThreadingTCPServer((args.host, args.smtp_port), SmtpHandler)
+    threading.Thread(target=smtp.serve_forever, daemon=True).start()
+    http = ThreadingHTTPServer((args.host, args.http_port), make_webhook_handler(args.fail_rate))
+    print(f"Webhook: http://{args.host}:{args.http_port}/  SMTP: {args.host}:{args.smtp_port}")
+    try:
+        http.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        http.server_close()
+        smtp.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,533 @@
+"""
+Alerts on device status transitions.
+
+Stored check-ins are fed to AlertEngine.observe() from the ingest path
+(no scans of checkins). Per device it keeps whether the device is
+alerting (its status is one of DASHBOARD_ALERT_STATUSES) and changes that
+only after raise_after / clear_after consecutive check-ins agree, so one
+odd report doesn't page anyone. While alerting, a new status or set of
+reasons that holds for raise_after check-ins is sent as "changed". A
+device that changes alert state flap_threshold times within
+flap_window_s is flapping: one "flapping" event is sent, then nothing
+until it has been stable for the window, when its current state is sent.
+
+Events are handed to one worker thread per sink (webhook, SMTP, file).
+Each collects events for group_window_s, sends one notification per
+location_tag, retries failures with exponential backoff and holds to a
+per-sink rate limit. Ingest only appends to the workers' queues; a full
+queue drops its oldest events. On shutdown the queues are sent without
+waiting for the group window, for up to drain_s.
+"""
+from __future__ import annotations
+
+import json
+import os
+import smtplib
+import threading
+import time
+import urllib.request
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from email.message import EmailMessage
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from app import metrics
+from app.db import load_alert_state
+from app.timeutil import from_epoch_ms
+
+
+@dataclass
+class AlertSettings:
+    # Statuses that count as alerting
+    statuses: Tuple[str, ...] = ("red",)
+    # Consecutive check-ins needed to raise / clear an alert
+    raise_after: int = 3
+    clear_after: int = 2
+    # Alert state changes within flap_window_s (check-in time) that make a
+    # device flapping
+    flap_threshold: int = 4
+    flap_window_s: float = 3600.0
+    # Events are collected this long, then sent as one notification per location
+    group_window_s: float = 30.0
+    # Notifications per minute per sink (bursts up to the same number)
+    rate_per_min: float = 20.0
+    # Delivery attempts per notification; the wait doubles from retry_backoff_s
+    max_attempts: int = 5
+    retry_backoff_s: float = 2.0
+    # Undelivered events kept per sink; beyond this the oldest are dropped
+    queue_size: int = 10000
+    timeout_s: float = 10.0
+    # On shutdown, keep delivering queued events for up to this long
+    drain_s: float = 10.0
+
+    # Sinks; with none configured alerting is off
+    webhook_url: Optional[str] = None
+    file_path: Optional[str] = None
+    smtp_host: Optional[str] = None
+    smtp_port: int = 25
+    smtp_from: str = "dashboard@localhost"
+    smtp_to: Tuple[str, ...] = ()
+
+    @classmethod
+    def from_env(cls) -> "AlertSettings":
+        """DASHBOARD_ALERT_* environment variables override the defaults."""
+        env = os.environ
+        d = cls()
+
+        def names(key: str, default: Tuple[str, ...]) -> Tuple[str, ...]:
+            value = env.get(key)
+            if value is None:
+                return default
+            return tuple(v.strip() for v in value.split(",") if v.strip())
+
+        return cls(
+            statuses=names("DASHBOARD_ALERT_STATUSES", d.statuses),
+            raise_after=int(env.get("DASHBOARD_ALERT_RAISE_AFTER", d.raise_after)),
+            clear_after=int(env.get("DASHBOARD_ALERT_CLEAR_AFTER", d.clear_after)),
+            flap_threshold=int(env.get("DASHBOARD_ALERT_FLAP_THRESHOLD", d.flap_threshold)),
+            flap_window_s=float(env.get("DASHBOARD_ALERT_FLAP_WINDOW_S", d.flap_window_s)),
+            group_window_s=float(env.get("DASHBOARD_ALERT_GROUP_WINDOW_S", d.group_window_s)),
+            rate_per_min=float(env.get("DASHBOARD_ALERT_RATE_PER_MIN", d.rate_per_min)),
+            max_attempts=int(env.get("DASHBOARD_ALERT_MAX_ATTEMPTS", d.max_attempts)),
+            retry_backoff_s=float(env.get("DASHBOARD_ALERT_RETRY_BACKOFF_S", d.retry_backoff_s)),
+            queue_size=int(env.get("DASHBOARD_ALERT_QUEUE_SIZE", d.queue_size)),
+            timeout_s=float(env.get("DASHBOARD_ALERT_TIMEOUT_S", d.timeout_s)),
+            drain_s=float(env.get("DASHBOARD_ALERT_DRAIN_S", d.drain_s)),
+            webhook_url=env.get("DASHBOARD_ALERT_WEBHOOK_URL") or None,
+            file_path=env.get("DASHBOARD_ALERT_FILE") or None,
+            smtp_host=env.get("DASHBOARD_ALERT_SMTP_HOST") or None,
+            smtp_port=int(env.get("DASHBOARD_ALERT_SMTP_PORT", d.smtp_port)),
+            smtp_from=env.get("DASHBOARD_ALERT_SMTP_FROM", d.smtp_from),
+            smtp_to=names("DASHBOARD_ALERT_SMTP_TO", d.smtp_to),
+        )
+
+    def validate(self) -> None:
+        if self.raise_after < 1 or self.clear_after < 1:
+            raise ValueError("DASHBOARD_ALERT_RAISE_AFTER / CLEAR_AFTER must be >= 1")
+        if self.flap_threshold < 2:
+            raise ValueError("DASHBOARD_ALERT_FLAP_THRESHOLD must be >= 2")
+        if self.rate_per_min <= 0 or self.max_attempts < 1:
+            raise ValueError("DASHBOARD_ALERT_RATE_PER_MIN must be > 0 and MAX_ATTEMPTS >= 1")
+        if self.smtp_host and not self.smtp_to:
+            raise ValueError("DASHBOARD_ALERT_SMTP_TO is required with DASHBOARD_ALERT_SMTP_HOST")
+
+
+# -------------------------
+# Sinks
+# -------------------------
+def notification_subject(notification: Dict[str, Any]) -> str:
+    counts: Dict[str, int] = {}
+    for e in notification["events"]:
+        counts[e["event"]] = counts.get(e["event"], 0) + 1
+    what = ", ".join(f"{n} {event}" for event, n in counts.items())
+    return f"[PC dashboard] {notification['location_tag'] or 'No location'}: {what}"
+
+
+def notification_text(notification: Dict[str, Any]) -> str:
+    lines = []
+    for e in notification["events"]:
+        reasons = f" ({'; '.join(e['reasons'])})" if e["reasons"] else ""
+        lines.append(f"{e['timestamp_utc']}  {e['device_id']}  {e['event']}: {e['status']}{reasons}")
+    return "\n".join(lines) + "\n"
+
+
+class AlertSink:
+    """Delivers notifications; send() raises to have one retried."""
+
+    name = "sink"
+
+    def send(self, notification: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+
+class WebhookSink(AlertSink):
+    """POSTs the notification as JSON; any non-2xx answer is a failure."""
+
+    name = "webhook"
+
+    def __init__(self, url: str, timeout_s: float = 10.0) -> None:
+        self.url = url
+        self.timeout_s = timeout_s
+
+    def send(self, notification: Dict[str, Any]) -> None:
+        req = urllib.request.Request(
+            self.url,
+            data=json.dumps(notification, ensure_ascii=False).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        # urlopen raises HTTPError for 4xx / 5xx
+        with urllib.request.urlopen(req, timeout=self.timeout_s) as resp:
+            resp.read()
+
+
+class SmtpSink(AlertSink):
+    name = "smtp"
+
+    def __init__(self, host: str, port: int, sender: str, to: Iterable[str], timeout_s: float = 10.0) -> None:
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.to = tuple(to)
+        self.timeout_s = timeout_s
+
+    def send(self, notification: Dict[str, Any]) -> None:
+        msg = EmailMessage()
+        msg["Subject"] = notification_subject(notification)
+        msg["From"] = self.sender
+        msg["To"] = ", ".join(self.to)
+        msg.set_content(notification_text(notification))
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout_s) as smtp:
+            smtp.send_message(msg)
+
+
+class FileSink(AlertSink):
+    """Appends one JSON line per notification."""
+
+    name = "file"
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def send(self, notification: Dict[str, Any]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(notification, ensure_ascii=False) + "\n")
+
+
+def sinks_from_settings(settings: AlertSettings) -> List[AlertSink]:
+    sinks: List[AlertSink] = []
+    if settings.webhook_url:
+        sinks.append(WebhookSink(settings.webhook_url, settings.timeout_s))
+    if settings.smtp_host:
+        sinks.append(SmtpSink(
+            settings.smtp_host, settings.smtp_port, settings.smtp_from, settings.smtp_to, settings.timeout_s
+        ))
+    if settings.file_path:
+        sinks.append(FileSink(settings.file_path))
+    return sinks
+
+
+# -------------------------
+# Delivery
+# -------------------------
+def group_events(events: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """One notification per location_tag, in order of each location's first event."""
+    groups: "OrderedDict[Optional[str], List[Dict[str, Any]]]" = OrderedDict()
+    for e in events:
+        groups.setdefault(e["location_tag"], []).append(e)
+    return [{"location_tag": loc, "events": evs} for loc, evs in groups.items()]
+
+
+class SinkWorker:
+    """Queue and delivery thread for one sink."""
+
+    def __init__(self, sink: AlertSink, settings: AlertSettings) -> None:
+        self.sink = sink
+        self.settings = settings
+        self._events: Deque[Dict[str, Any]] = deque()
+        self._first = 0.0  # monotonic time the oldest queued event arrived
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._drain_deadline = float("inf")
+        # Token bucket for the rate limit
+        self._tokens = settings.rate_per_min
+        self._refilled = time.monotonic()
+        self._stats = {"sent": 0, "failed": 0, "retries": 0, "dropped": 0, "lost": 0, "rate_limited": 0}
+
+    def submit(self, events: List[Dict[str, Any]]) -> None:
+        with self._cond:
+            if not self._events:
+                self._first = time.monotonic()
+            self._events.extend(events)
+            overflow = len(self._events) - self.settings.queue_size
+            for _ in range(max(0, overflow)):
+                self._events.popleft()
+            if overflow > 0:
+                self._stats["dropped"] += overflow
+            self._cond.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {**self._stats, "queued": len(self._events)}
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name=f"alerts-{self.sink.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Deliver what is queued (for up to drain_s), then end the thread."""
+        with self._cond:
+            self._stopping = True
+            self._drain_deadline = time.monotonic() + self.settings.drain_s
+            self._cond.notify()
+        if self._thread is not None:
+            # A send already under way may run timeout_s past the deadline
+            self._thread.join(self.settings.drain_s + self.settings.timeout_s + 1)
+        with self._cond:
+            lost = self._stats["lost"] + len(self._events)
+        if lost:
+            print(f"[alerts] {self.sink.name}: {lost} events not delivered at shutdown")
+
+    def _wait(self, seconds: float) -> bool:
+        """Sleep, cut short by the drain deadline; False once that has passed."""
+        end = time.monotonic() + seconds
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self._stopping and now >= self._drain_deadline:
+                    return False
+                left = min(end, self._drain_deadline) - now
+                if left <= 0:
+                    return True
+                self._cond.wait(left)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._events and not self._stopping:
+                    self._cond.wait()
+                # Let the group window fill up (a stop sends what's queued now)
+                while not self._stopping:
+                    left = self._first + self.settings.group_window_s - time.monotonic()
+                    if left <= 0:
+                        break
+                    self._cond.wait(left)
+                if not self._events:
+                    return
+                events = list(self._events)
+                self._events.clear()
+
+            notifications = group_events(events)
+            for i, notification in enumerate(notifications):
+                if not self._deliver(notification):
+                    with self._cond:
+                        self._stats["lost"] += sum(len(n["events"]) for n in notifications[i:])
+                    return
+
+    def _take_token(self) -> bool:
+        per_s = self.settings.rate_per_min / 60
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.settings.rate_per_min, self._tokens + (now - self._refilled) * per_s)
+            self._refilled = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            with self._cond:
+                self._stats["rate_limited"] += 1
+            if not self._wait((1 - self._tokens) / per_s):
+                return False
+
+    def _deliver(self, notification: Dict[str, Any]) -> bool:
+        """Send with retries; False if stop()'s drain deadline cut it short."""
+        s = self.settings
+        name = self.sink.name
+        for attempt in range(s.max_attempts):
+            if not self._take_token():
+                return False
+            try:
+                self.sink.send(notification)
+            except Exception as e:
+                error = e
+            else:
+                with self._cond:
+                    self._stats["sent"] += 1
+                metrics.alert_notifications.inc(sink=name, result="sent")
+                return True
+            if attempt + 1 < s.max_attempts:
+                with self._cond:
+                    self._stats["retries"] += 1
+                metrics.alert_notifications.inc(sink=name, result="retry")
+                if not self._wait(s.retry_backoff_s * 2 ** attempt):
+                    return False
+
+        with self._cond:
+            self._stats["failed"] += 1
+        metrics.alert_notifications.inc(sink=name, result="failed")
+        print(
+            f"[alerts] {name}: giving up on {notification['location_tag']!r} "
+            f"after {s.max_attempts} attempts: {error!r}"
+        )
+        return True
+
+
+# -------------------------
+# Transitions
+# -------------------------
+class _DeviceAlert:
+    __slots__ = ("ts", "location", "alerting", "streak", "flips", "flapping", "notified", "pending", "pending_n")
+
+    def __init__(
+        self,
+        ts: int,
+        location: Optional[str],
+        alerting: bool,
+        notified: Optional[Tuple[Any, Any]] = None,
+    ) -> None:
+        self.ts = ts                # latest check-in timestamp_utc (epoch ms)
+        self.location = location
+        self.alerting = alerting
+        self.streak = 0             # consecutive check-ins disagreeing with alerting
+        self.flips: Deque[int] = deque()  # check-in times of recent alert state changes
+        self.flapping = False
+        # While alerting: (status, reasons JSON) last sent, and a different
+        # one with the number of consecutive check-ins that reported it
+        self.notified = notified
+        self.pending: Optional[Tuple[Any, Any]] = None
+        self.pending_n = 0
+
+
+class AlertEngine:
+    """Edge-triggered alert state per device, fanned out to the sink workers."""
+
+    def __init__(self, settings: AlertSettings, sinks: Iterable[AlertSink]) -> None:
+        self.settings = settings
+        self.workers = [SinkWorker(sink, settings) for sink in sinks]
+        self._devices: Dict[str, _DeviceAlert] = {}
+        self._lock = threading.Lock()
+
+    def seed(self, rows: Iterable[Tuple[str, int, Optional[str], Optional[str], Optional[str]]]) -> None:
+        """
+        Load (device_id, latest timestamp_utc, location_tag, computed_status,
+        computed_reasons_json) at startup. Devices already alerting count as
+        notified, so a restart doesn't page for them again.
+        """
+        statuses = self.settings.statuses
+        with self._lock:
+            for device_id, ts, location, status, reasons in rows:
+                alerting = status in statuses
+                notified = (status, reasons) if alerting else None
+                self._devices[device_id] = _DeviceAlert(ts, location, alerting, notified)
+
+    def observe(self, rows: Iterable[Any]) -> int:
+        """
+        Stored check-ins (CheckinRecord), in order; late ones are ignored.
+        Returns the number of events queued.
+        """
+        s = self.settings
+        window_ms = s.flap_window_s * 1000
+        events: List[Dict[str, Any]] = []
+        with self._lock:
+            for r in rows:
+                ts = r.timestamp_utc
+                dev = self._devices.get(r.device_id)
+                if dev is None:
+                    dev = self._devices[r.device_id] = _DeviceAlert(ts, r.location_tag, False)
+                elif ts < dev.ts:
+                    continue
+                dev.ts = ts
+                # Check-ins may leave location_tag out; the device keeps its last one
+                dev.location = r.location_tag or dev.location
+
+                flips = dev.flips
+                while flips and flips[0] <= ts - window_ms:
+                    flips.popleft()
+
+                alerting = r.computed_status in s.statuses
+                if alerting == dev.alerting:
+                    dev.streak = 0
+                    if alerting and not dev.flapping and self._changed_while_alerting(dev, r):
+                        self._emit(events, "changed", r, dev)
+                else:
+                    dev.streak += 1
+                    if dev.streak >= (s.raise_after if alerting else s.clear_after):
+                        dev.alerting = alerting
+                        dev.streak = 0
+                        flips.append(ts)
+                        if dev.flapping:
+                            continue
+                        if len(flips) >= s.flap_threshold:
+                            dev.flapping = True
+                            self._emit(events, "flapping", r, dev)
+                        else:
+                            self._emit(events, "firing" if alerting else "resolved", r, dev)
+                        continue
+
+                if dev.flapping and not flips:
+                    # Stable for a whole window: report where it settled
+                    dev.flapping = False
+                    self._emit(events, "firing" if dev.alerting else "resolved", r, dev)
+
+        if events:
+            for worker in self.workers:
+                worker.submit(events)
+        return len(events)
+
+    def _changed_while_alerting(self, dev: _DeviceAlert, r: Any) -> bool:
+        """True once a new (status, reasons) has held for raise_after check-ins."""
+        sig = (r.computed_status, r.computed_reasons_json)
+        if sig == dev.notified:
+            dev.pending, dev.pending_n = None, 0
+            return False
+        if sig != dev.pending:
+            dev.pending, dev.pending_n = sig, 0
+        dev.pending_n += 1
+        return dev.pending_n >= self.settings.raise_after
+
+    @staticmethod
+    def _emit(events: List[Dict[str, Any]], event: str, r: Any, dev: _DeviceAlert) -> None:
+        # What a firing / changed event reports is what later ones compare with
+        dev.notified = (r.computed_status, r.computed_reasons_json) if dev.alerting else None
+        dev.pending, dev.pending_n = None, 0
+        reasons = r.computed_reasons_json
+        events.append({
+            "event": event,
+            "device_id": r.device_id,
+            "location_tag": dev.location,
+            "status": r.computed_status,
+            "reasons": json.loads(reasons) if reasons else [],
+            "timestamp_utc": from_epoch_ms(r.timestamp_utc),
+        })
+
+    def stats(self) -> Dict[str, Any]:
+        firing: Dict[str, List[str]] = {}
+        flapping = 0
+        with self._lock:
+            for device_id, dev in self._devices.items():
+                if dev.alerting:
+                    firing.setdefault(dev.location or "", []).append(device_id)
+                flapping += dev.flapping
+        return {
+            "firing": {loc: sorted(ids) for loc, ids in sorted(firing.items())},
+            "flapping": flapping,
+            "sinks": {w.sink.name: w.stats() for w in self.workers},
+        }
+
+    def start(self) -> None:
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self) -> None:
+        for worker in self.workers:
+            worker.stop()
+
+
+_engine: Optional[AlertEngine] = None
+
+
+def start_alerts(settings: AlertSettings) -> Optional[AlertEngine]:
+    """Seed alert state from device_latest and start the sink workers (None without sinks)."""
+    global _engine
+    settings.validate()
+    sinks = sinks_from_settings(settings)
+    if not sinks:
+        return None
+    engine = AlertEngine(settings, sinks)
+    engine.seed(load_alert_state())
+    engine.start()
+    _engine = engine
+    print(f"[alerts] sending to {', '.join(s.name for s in sinks)}")
+    return engine
+
+
+def get_alerts() -> Optional[AlertEngine]:
+    """The running engine, or None when alerting is off or outside the server."""
+    return _engine
+
+
+def stop_alerts() -> None:
+    global _engine
+    if _engine is not None:
+        _engine.stop()
+        _engine = None
@@ -0,0 +1,170 @@
+"""
+Maintenance commands.
+
+Usage:
+  python -m app.cli rebuild-latest
+  python -m app.cli rollup-catchup [--since ISO_TIMESTAMP]
+  python -m app.cli retention [--keep-days N] [--archive-dir DIR]
+  python -m app.cli recode-raw [--mode zlib|json|off] [--vacuum]
+  python -m app.cli reclassify [--restart] [--no-rollups]
+  python -m app.cli export [--format csv|ndjson] [--from ISO] [--to ISO] [--out FILE]
+"""
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+from app.db import DBSettings, configure, init_db, rebuild_latest
+from app.export import EXPORT_FORMATS, ExportFilter, export_columns, iter_export
+from app.main import SCHEMA_PATH
+from app.rawcodec import RAW_MODE, RAW_MODES
+from app.reclassify import reclassify_checkins
+from app.retention import (
+    RetentionPolicy,
+    enable_incremental_vacuum,
+    recode_raw_payloads,
+    run_retention,
+)
+from app.rollups import rebuild_rollups
+
+
+def cmd_rebuild_latest(args: argparse.Namespace) -> None:
+    n = rebuild_latest()
+    print(f"device_latest rebuilt for {n} devices")
+
+
+def cmd_rollup_catchup(args: argparse.Namespace) -> None:
+    n = rebuild_rollups(
+        since=args.since,
+        chunk_size=args.chunk_size,
+        progress=lambda done: print(f"  {done} check-ins rolled up"),
+    )
+    print(f"rollups rebuilt from {n} check-ins")
+
+
+def cmd_retention(args: argparse.Namespace) -> None:
+    if args.enable_incremental_vacuum:
+        print(json.dumps(enable_incremental_vacuum(), indent=2))
+        return
+
+    policy = RetentionPolicy.from_env()
+    if args.keep_days is not None:
+        policy.keep_days = args.keep_days
+    if args.batch_size is not None:
+        policy.batch_size = args.batch_size
+    if args.archive_dir is not None:
+        policy.archive_dir = Path(args.archive_dir)
+
+    print(json.dumps(run_retention(policy), indent=2))
+
+
+def cmd_recode_raw(args: argparse.Namespace) -> None:
+    report = recode_raw_payloads(
+        args.mode,
+        batch_size=args.batch_size,
+        vacuum=args.vacuum,
+        progress=lambda done: print(f"  {done} rows scanned"),
+    )
+    print(json.dumps(report, indent=2))
+
+
+def cmd_reclassify(args: argparse.Namespace) -> None:
+    report = reclassify_checkins(
+        chunk_size=args.chunk_size,
+        resume=not args.restart,
+        rollups=not args.no_rollups,
+        progress=lambda r: print(
+            f"  {r['rows_scanned']} scanned, {r['rows_changed']} changed (id {r['last_id']}/{r['max_id']})"
+        ),
+    )
+    print(json.dumps(report, indent=2))
+
+
+def cmd_export(args: argparse.Namespace) -> None:
+    flt = ExportFilter(
+        ts_from=args.ts_from,
+        ts_to=args.ts_to,
+        device_ids=args.device or (),
+        location=args.location,
+        statuses=args.status or (),
+    )
+    try:
+        flt.validate()
+        columns = export_columns(args.fields)
+    except ValueError as e:
+        sys.exit(f"export: {e}")
+
+    if args.out is None:
+        out = sys.stdout
+    elif args.out.endswith(".gz"):
+        out = gzip.open(args.out, "wt", encoding="utf-8", newline="")
+    else:
+        out = open(args.out, "w", encoding="utf-8", newline="")
+    try:
+        for chunk in iter_export(flt, args.format, columns):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("rebuild-latest", help="recompute device_latest from checkins")
+    p.set_defaults(func=cmd_rebuild_latest)
+
+    p = sub.add_parser("rollup-catchup", help="rebuild time-bucketed rollups from checkins")
+    p.add_argument("--since", help="only rebuild buckets from this ISO timestamp on")
+    p.add_argument("--chunk-size", type=int, default=5000)
+    p.set_defaults(func=cmd_rollup_catchup)
+
+    p = sub.add_parser("retention", help="delete/archive old check-ins and reclaim space")
+    p.add_argument("--keep-days", type=int)
+    p.add_argument("--batch-size", type=int)
+    p.add_argument("--archive-dir", help="write expired rows to gzip NDJSON here first")
+    p.add_argument(
+        "--enable-incremental-vacuum",
+        action="store_true",
+        help="one-time VACUUM to switch an existing database to auto_vacuum=INCREMENTAL",
+    )
+    p.set_defaults(func=cmd_retention)
+
+    p = sub.add_parser("recode-raw", help="rewrite stored raw payloads (e.g. compress old rows)")
+    p.add_argument("--mode", choices=RAW_MODES, default=RAW_MODE)
+    p.add_argument("--batch-size", type=int, default=2000)
+    p.add_argument("--vacuum", action="store_true", help="repack the database afterwards (full VACUUM)")
+    p.set_defaults(func=cmd_recode_raw)
+
+    p = sub.add_parser("reclassify", help="re-run the health rules over stored check-ins")
+    p.add_argument("--chunk-size", type=int, default=20000)
+    p.add_argument("--restart", action="store_true", help="ignore the checkpoint of an interrupted run")
+    p.add_argument("--no-rollups", action="store_true", help="leave rollup status counts as they are")
+    p.set_defaults(func=cmd_reclassify)
+
+    p = sub.add_parser("export", help="stream check-in history as CSV or NDJSON")
+    p.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    p.add_argument("--from", dest="ts_from", help="ISO timestamp (inclusive)")
+    p.add_argument("--to", dest="ts_to", help="ISO timestamp (inclusive)")
+    p.add_argument("--device", action="append", help="device_id (repeatable)")
+    p.add_argument("--location", help="location_tag")
+    p.add_argument("--status", action="append", choices=("green", "yellow", "red"), help="repeatable")
+    p.add_argument("--fields", help="columns as for ?fields= (default: all but raw_json)")
+    p.add_argument("--out", help="output file (.gz is compressed; default: stdout)")
+    p.set_defaults(func=cmd_export)
+
+    args = parser.parse_args(argv)
+
+    # Same DASHBOARD_DB_* settings as the API server
+    configure(DBSettings.from_env())
+    init_db(SCHEMA_PATH)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,142 +1,872 @@
 from __future__ import annotations
 
+import base64
 import json
+import os
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from app import metrics
+from app.health_rules import severity_of, severity_sql
+from app.rawcodec import decode_raw
+from app.timeutil import to_epoch_ms
+
+if TYPE_CHECKING:
+    from app.records import CheckinRecord
 
 
 # Database file lives at project root
 DB_PATH = Path(__file__).resolve().parent.parent / "dashboard.db"
 
+# -------------------------
+# Column projections
+# -------------------------
+# All checkins columns, in schema.sql order
+CHECKIN_COLUMNS = (
+    "id", "device_id", "timestamp_utc", "agent_version",
+    "last_boot_utc", "uptime_seconds",
+    "unexpected_shutdowns", "app_crashes", "service_restarts", "hang_indicators",
+    "disk_c_free_gb", "disk_c_free_pct", "disk_errors", "profile_errors",
+    "av_enabled", "av_sig_age_days", "pending_reboot", "update_failures",
+    "dns_ok", "gateway_ok", "backend_reachable", "network_resets",
+    "mypc_client_running",
+    "mypc_auth_attempts", "mypc_auth_successes", "mypc_auth_failures",
+    "mypc_auth_failures_by_reason_json",
+    "mypc_service_connect_failures", "mypc_time_to_service_ready_s", "mypc_last_error_category",
+    "mypc_avg_auth_ms", "mypc_p95_auth_ms", "mypc_slow_login_count",
+    "computed_status", "computed_reasons_json",
+    "raw_json",
+)
 
-def connect() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
+# Columns written on ingest (id is assigned by SQLite)
+INSERT_COLUMNS = CHECKIN_COLUMNS[1:]
+
+_INSERT_CHECKIN_SQL = (
+    f"INSERT INTO checkins ({', '.join(INSERT_COLUMNS)}) "
+    f"VALUES ({', '.join(['?'] * len(INSERT_COLUMNS))})"
+)
+
+# What dashboard.html / device.html actually render
+DEFAULT_FIELDS = (
+    "id", "device_id", "timestamp_utc",
+    "computed_status", "computed_reasons_json",
+    "disk_c_free_pct", "av_enabled",
+    "mypc_auth_failures", "mypc_auth_attempts",
+)
+
+
+def resolve_fields(spec: Optional[str]) -> Tuple[str, ...]:
+    """
+    Turn a fields= query value into a column list.
+
+      None / ""        -> DEFAULT_FIELDS
+      "all"            -> every column except raw_json
+      "a,b,raw_json"   -> exactly those (raw_json only when named)
+
+    device_id is always included. Raises ValueError on unknown names.
+    """
+    if not spec:
+        return DEFAULT_FIELDS
+
+    names: List[str] = ["device_id"]
+    for name in (n.strip() for n in spec.split(",")):
+        if not name:
+            continue
+        if name == "all":
+            names.extend(c for c in CHECKIN_COLUMNS if c != "raw_json")
+        elif name in CHECKIN_COLUMNS:
+            names.append(name)
+        else:
+            raise ValueError(f"Unknown field: {name}")
+
+    # De-duplicate, keep schema order
+    wanted = set(names)
+    return tuple(c for c in CHECKIN_COLUMNS if c in wanted)
+
+
+def row_to_dict(r: sqlite3.Row) -> Dict[str, Any]:
+    """API form of a checkins row (raw_json decoded from its stored form)."""
+    d = dict(r)
+    if "raw_json" in d:
+        d["raw_json"] = decode_raw(d["raw_json"])
+    return d
+
+
+# Stored as UTC epoch milliseconds; API reads select them as ISO 8601
+TIMESTAMP_COLUMNS = ("timestamp_utc", "last_boot_utc")
+
+
+def iso_sql(expr: str) -> str:
+    """SQL rendering epoch ms as ISO 8601, in the format of timeutil.from_epoch_ms."""
+    return f"strftime('%Y-%m-%dT%H:%M:%f+00:00', {expr} / 1000.0, 'unixepoch')"
+
+
+def _select_list(fields: Sequence[str], alias: str = "", iso: bool = True) -> str:
+    """Column list; timestamps as ISO strings unless iso=False (internal reads)."""
+    prefix = f"{alias}." if alias else ""
+    return ", ".join(
+        f"{iso_sql(prefix + f)} AS {f}" if iso and f in TIMESTAMP_COLUMNS else prefix + f
+        for f in fields
+    )
+
+
+_JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+_SYNCHRONOUS_MODES = {"OFF", "NORMAL", "FULL", "EXTRA"}
+
+
+# -------------------------
+# Connection settings
+# -------------------------
+@dataclass
+class DBSettings:
+    path: Path = DB_PATH
+    pool_size: int = 8
+    journal_mode: str = "WAL"
+    # NORMAL is durable across app crashes in WAL mode (only an OS crash can
+    # lose the last commits) and avoids an fsync on every commit.
+    synchronous: str = "NORMAL"
+    cache_size: int = -16000  # negative = KiB (~16 MB page cache per connection)
+    mmap_size: int = 256 * 1024 * 1024
+    busy_timeout_ms: int = 5000
+
+    @classmethod
+    def from_env(cls) -> "DBSettings":
+        """
+        Build settings from DASHBOARD_DB_* environment variables
+        (unset variables keep the defaults above).
+        """
+        env = os.environ
+        d = cls()
+        return cls(
+            path=Path(env.get("DASHBOARD_DB_PATH", str(d.path))),
+            pool_size=int(env.get("DASHBOARD_DB_POOL_SIZE", d.pool_size)),
+            journal_mode=env.get("DASHBOARD_DB_JOURNAL_MODE", d.journal_mode),
+            synchronous=env.get("DASHBOARD_DB_SYNCHRONOUS", d.synchronous),
+            cache_size=int(env.get("DASHBOARD_DB_CACHE_SIZE", d.cache_size)),
+            mmap_size=int(env.get("DASHBOARD_DB_MMAP_SIZE", d.mmap_size)),
+            busy_timeout_ms=int(env.get("DASHBOARD_DB_BUSY_TIMEOUT_MS", d.busy_timeout_ms)),
+        )
+
+    def validate(self) -> None:
+        if self.pool_size < 1:
+            raise ValueError("pool_size must be >= 1")
+        if self.journal_mode.upper() not in _JOURNAL_MODES:
+            raise ValueError(f"Unsupported journal_mode: {self.journal_mode}")
+        if self.synchronous.upper() not in _SYNCHRONOUS_MODES:
+            raise ValueError(f"Unsupported synchronous mode: {self.synchronous}")
+        if self.busy_timeout_ms < 0:
+            raise ValueError("busy_timeout_ms must be >= 0")
+
+
+_settings = DBSettings()
+
+
+def _open() -> sqlite3.Connection:
+    s = _settings
+    conn = sqlite3.connect(
+        s.path,
+        timeout=s.busy_timeout_ms / 1000,
+        check_same_thread=False,  # pooled connections move between worker threads
+    )
     conn.row_factory = sqlite3.Row
     return conn
 
 
+def _apply_pragmas(conn: sqlite3.Connection) -> None:
+    s = _settings
+    conn.execute(f"PRAGMA journal_mode = {s.journal_mode.upper()}")
+    conn.execute(f"PRAGMA synchronous = {s.synchronous.upper()}")
+    conn.execute(f"PRAGMA cache_size = {int(s.cache_size)}")
+    conn.execute(f"PRAGMA mmap_size = {int(s.mmap_size)}")
+    conn.execute(f"PRAGMA busy_timeout = {int(s.busy_timeout_ms)}")
+
+
+def connect() -> sqlite3.Connection:
+    """
+    Open a new connection with the configured pragmas applied.
+    Prefer connection() for request-path work; this is for one-off jobs.
+    """
+    conn = _open()
+    _apply_pragmas(conn)
+    return conn
+
+
+# -------------------------
+# Connection pool
+# -------------------------
+class ConnectionPool:
+    """
+    Bounded pool of reusable connections.
+
+    At most pool_size connections exist; each is used by one thread at a
+    time. With WAL, readers keep going while the single writer commits.
+    """
+
+    def __init__(self, settings: DBSettings) -> None:
+        self._settings = settings
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(settings.pool_size)
+        self._closed = False
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        # Waiting for a free slot follows the same busy-timeout policy as SQLite locks
+        with metrics.pool_wait.time():
+            acquired = self._slots.acquire(timeout=self._settings.busy_timeout_ms / 1000)
+        if not acquired:
+            metrics.sqlite_busy.inc()
+            raise sqlite3.OperationalError("connection pool exhausted")
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = connect()
+
+            try:
+                yield conn
+            except sqlite3.OperationalError as e:
+                metrics.count_busy(e)
+                raise
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                if self._closed:
+                    conn.close()
+                else:
+                    self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pool = ConnectionPool(_settings)
+
+
+def configure(settings: DBSettings) -> None:
+    """
+    Apply connection settings (call once at startup, before any queries).
+    Idle connections from a previous configuration are closed.
+    """
+    global _settings, _pool
+    settings.validate()
+    _pool.close()
+    _settings = settings
+    _pool = ConnectionPool(settings)
+
+
+def db_path() -> Path:
+    """Path of the configured database file."""
+    return Path(_settings.path)
+
+
+def close_pool() -> None:
+    _pool.close()
+
+
+@contextmanager
+def connection() -> Iterator[sqlite3.Connection]:
+    """
+    Borrow a pooled connection. Any transaction left open is rolled back
+    when the block exits.
+    """
+    with _pool.connection() as conn:
+        yield conn
+
+
 def init_db(schema_sql_path: Path) -> None:
     """
     Initialize database using schema.sql.
     Safe to run multiple times.
     """
-    conn = connect()
+    conn = _open()
+    # Lets retention hand freed pages back with incremental_vacuum. Only takes
+    # effect on a brand-new file, and must come before the switch to WAL
+    # (older databases: python -m app.cli retention --enable-incremental-vacuum).
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    _apply_pragmas(conn)
     try:
+        # Databases with ISO TEXT timestamps are moved aside and copied into
+        # the INTEGER tables schema.sql creates
+        legacy = _stash_text_timestamp_tables(conn)
+
         with open(schema_sql_path, "r", encoding="utf-8") as f:
             conn.executescript(f.read())
         conn.commit()
+
+        deduped = _copy_text_timestamp_tables(conn) if legacy else 0
+
+        # device_latest.liveness came later than the table itself
+        latest_columns = {r[1] for r in conn.execute("PRAGMA table_info(device_latest)")}
+        if "liveness" not in latest_columns:
+            conn.execute("ALTER TABLE device_latest ADD COLUMN liveness TEXT")
+            conn.commit()
+
+        # One-time backfill for databases created before device_latest
+        # existed; after a dedupe it may point at a deleted copy
+        has_latest = conn.execute("SELECT 1 FROM device_latest LIMIT 1").fetchone()
+        has_checkins = conn.execute("SELECT 1 FROM checkins LIMIT 1").fetchone()
+        if deduped or (has_checkins and not has_latest):
+            rebuild_latest(conn)
     finally:
         conn.close()
 
 
-def upsert_device(
-    device_id: str,
-    location_tag: Optional[str],
-    ip: Optional[str],
-    first_seen_utc: str,
-    last_seen_utc: str,
-) -> None:
-    conn = connect()
+# Tables that held ISO TEXT timestamps, and their timestamp columns
+_LEGACY_TIMESTAMPS = {
+    "devices": ("first_seen_utc", "last_seen_utc"),
+    "checkins": ("timestamp_utc", "last_boot_utc"),
+    "device_latest": ("timestamp_utc",),
+}
+
+
+def _iso_to_ms(value: Any) -> Any:
+    """Migration helper: epoch ms for an ISO string; unparseable values are kept."""
+    if value is None or isinstance(value, int):
+        return value
     try:
-        conn.execute(
-            """
-            INSERT INTO devices (
-              device_id, location_tag, last_ip, first_seen_utc, last_seen_utc
-            )
-            VALUES (?, ?, ?, ?, ?)
-            ON CONFLICT(device_id) DO UPDATE SET
-              location_tag = COALESCE(excluded.location_tag, devices.location_tag),
-              last_ip      = COALESCE(excluded.last_ip, devices.last_ip),
-              last_seen_utc = excluded.last_seen_utc
-            """,
-            (device_id, location_tag, ip, first_seen_utc, last_seen_utc),
+        return to_epoch_ms(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def _stash_text_timestamp_tables(conn: sqlite3.Connection) -> bool:
+    """
+    Rename the tables of a database with TEXT timestamps to <name>_text
+    and drop their indexes, so schema.sql creates the INTEGER versions.
+    Returns False if there is nothing to migrate.
+    """
+    types = {r[1]: r[2].upper() for r in conn.execute("PRAGMA table_info(checkins)")}
+    if types.get("timestamp_utc") != "TEXT":
+        return False
+
+    # Copies are checked by hand; foreign keys would fire mid-rename
+    conn.execute("PRAGMA foreign_keys = OFF")
+    conn.execute("BEGIN IMMEDIATE")
+    for table in _LEGACY_TIMESTAMPS:
+        for (index,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+            (table,),
+        ).fetchall():
+            conn.execute(f"DROP INDEX {index}")
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone():
+            conn.execute(f"ALTER TABLE {table} RENAME TO {table}_text")
+    conn.commit()
+    return True
+
+
+def _copy_text_timestamp_tables(conn: sqlite3.Connection) -> int:
+    """
+    Fill the new tables from the <name>_text ones with timestamps as epoch
+    ms, then drop the old tables. Check-ins that now share a
+    (device_id, timestamp_utc) keep the first stored copy. Returns the
+    number of duplicates dropped.
+    """
+    conn.create_function("iso_to_ms", 1, _iso_to_ms, deterministic=True)
+    conn.execute("PRAGMA foreign_keys = OFF")
+    conn.execute("BEGIN IMMEDIATE")
+    copied: Dict[str, int] = {}
+    for table, ts_columns in _LEGACY_TIMESTAMPS.items():
+        old = f"{table}_text"
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (old,)).fetchone():
+            continue
+        new_columns = [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+        old_columns = {r[1] for r in conn.execute(f"PRAGMA table_info({old})")}
+        columns = [c for c in new_columns if c in old_columns]
+        select = ", ".join(f"iso_to_ms({c})" if c in ts_columns else c for c in columns)
+        order = "ORDER BY id" if table == "checkins" else ""
+        copied[table] = conn.execute(
+            f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) SELECT {select} FROM {old} {order}"
+        ).rowcount
+        total = conn.execute(f"SELECT COUNT(*) FROM {old}").fetchone()[0]
+        copied[f"{table}_dropped"] = total - copied[table]
+        conn.execute(f"DROP TABLE {old}")
+    conn.commit()
+    conn.execute("PRAGMA foreign_keys = ON")
+
+    deduped = copied.get("checkins_dropped", 0)
+    print(f"[db] converted {copied.get('checkins', 0)} check-ins to epoch-ms timestamps")
+    if deduped:
+        print(
+            f"[db] removed {deduped} duplicate check-ins; rollups may still count them. "
+            "'python -m app.cli rollup-catchup' recounts every bucket retention "
+            "hasn't cut into (older ones are left as they are)"
         )
-        conn.commit()
-    finally:
-        conn.close()
+    return deduped
+
+
+_UPSERT_DEVICE_SQL = """
+INSERT INTO devices (
+  device_id, location_tag, last_ip, first_seen_utc, last_seen_utc
+)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT(device_id) DO UPDATE SET
+  location_tag = COALESCE(excluded.location_tag, devices.location_tag),
+  last_ip      = COALESCE(excluded.last_ip, devices.last_ip),
+  last_seen_utc = excluded.last_seen_utc
+"""
+
+# Late / out-of-order check-ins never replace a newer latest row; a newer
+# one means the device is reporting again
+_UPSERT_LATEST_SQL = """
+INSERT INTO device_latest (
+  device_id, checkin_id, timestamp_utc, computed_status, severity, version
+)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT(device_id) DO UPDATE SET
+  checkin_id = excluded.checkin_id,
+  timestamp_utc = excluded.timestamp_utc,
+  computed_status = excluded.computed_status,
+  severity = excluded.severity,
+  version = excluded.version,
+  liveness = NULL
+WHERE excluded.timestamp_utc >= device_latest.timestamp_utc
+"""
 
 
-def insert_checkin(row: Dict[str, Any]) -> int:
+def _bump_fleet_version(conn: sqlite3.Connection, n: int) -> int:
     """
-    Insert a flattened check-in row.
-    Returns the inserted row ID.
+    Reserve n consecutive fleet versions inside the caller's write
+    transaction. Returns the first reserved version.
     """
-    conn = connect()
-    try:
-        columns = ", ".join(row.keys())
-        placeholders = ", ".join(["?"] * len(row))
-        sql = f"INSERT INTO checkins ({columns}) VALUES ({placeholders})"
-        cur = conn.execute(sql, list(row.values()))
-        conn.commit()
-        return int(cur.lastrowid)
-    finally:
-        conn.close()
+    new_max = conn.execute(
+        "UPDATE meta SET value = value + ? WHERE key = 'fleet_version' RETURNING value",
+        (n,),
+    ).fetchall()[0][0]
+    return int(new_max) - n + 1
 
 
-def get_devices_latest() -> List[Dict[str, Any]]:
+def get_fleet_version(conn: Optional[sqlite3.Connection] = None) -> int:
     """
-    Return latest check-in per device for fleet view.
+    Monotonic counter that changes whenever any device's latest state changes.
     """
-    conn = connect()
-    try:
-        rows = conn.execute(
-            """
-            SELECT c.*
-            FROM checkins c
-            JOIN (
-              SELECT device_id, MAX(timestamp_utc) AS max_ts
-              FROM checkins
-              GROUP BY device_id
-            ) latest
-              ON c.device_id = latest.device_id
-             AND c.timestamp_utc = latest.max_ts
-            ORDER BY
-              CASE c.computed_status
-                WHEN 'red' THEN 3
-                WHEN 'yellow' THEN 2
-                ELSE 1
-              END DESC,
-              c.device_id ASC
-            """
-        ).fetchall()
-        return [dict(r) for r in rows]
-    finally:
-        conn.close()
+    if conn is None:
+        with connection() as pooled:
+            return get_fleet_version(pooled)
+
+    row = conn.execute("SELECT value FROM meta WHERE key = 'fleet_version'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def get_meta(conn: sqlite3.Connection, key: str) -> Optional[int]:
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return int(row[0]) if row else None
+
+
+def set_meta(conn: sqlite3.Connection, key: str, value: int, keep_max: bool = False) -> None:
+    """Store a meta value (keep_max: never lower an existing one)."""
+    update = "MAX(value, excluded.value)" if keep_max else "excluded.value"
+    conn.execute(
+        "INSERT INTO meta (key, value) VALUES (?, ?) "
+        f"ON CONFLICT(key) DO UPDATE SET value = {update}",
+        (key, value),
+    )
+
+
+# Stored check-ins among [row index, device_id, timestamp_utc] keys (a JSON array)
+_STORED_CHECKINS_SQL = """
+SELECT json_extract(j.value, '$[0]'), c.id, c.computed_status, c.computed_reasons_json
+FROM json_each(?) j
+JOIN checkins c
+  ON c.device_id = json_extract(j.value, '$[1]')
+ AND c.timestamp_utc = json_extract(j.value, '$[2]')
+"""
 
 
-def get_device_detail(device_id: str, limit: int = 20) -> Dict[str, Any]:
+def insert_checkins_batch(
+    devices: Sequence[Tuple[str, Optional[str], Optional[str], str, str]],
+    rows: Sequence["CheckinRecord"],
+    in_transaction: Optional[Callable[[sqlite3.Connection, List[int]], None]] = None,
+) -> Tuple[List[int], List[int]]:
     """
-    Return latest + recent history for a single device.
+    Upsert devices, insert flattened check-in rows and advance device_latest
+    in ONE transaction (one commit / fsync for the whole batch).
+
+    devices: (device_id, location_tag, ip, first_seen_utc, last_seen_utc) tuples
+    rows: classified CheckinRecord rows (see app/records.py)
+    in_transaction: extra writes (conn, indexes of the rows being inserted)
+      to commit atomically with the check-ins, e.g. rollups
+
+    A row whose (device_id, timestamp_utc) is already stored, or repeated
+    earlier in the batch, is an agent retry: nothing is written for it, and
+    its computed_status / computed_reasons_json are set to the stored
+    result. The lookup runs inside the write transaction, so the ids of
+    the inserted rows stay contiguous.
+
+    Returns (ids, inserted): the check-in id of every row, in order, and
+    the indexes of the rows this call inserted.
     """
-    conn = connect()
-    try:
-        latest = conn.execute(
-            """
-            SELECT *
+    if not rows:
+        return [], []
+
+    # First row index per key; later ones repeat it
+    first_of: Dict[Tuple[str, str], int] = {}
+    repeats: List[Tuple[int, int]] = []
+    for i, r in enumerate(rows):
+        first = first_of.setdefault((r.device_id, r.timestamp_utc), i)
+        if first != i:
+            repeats.append((i, first))
+
+    ids: List[int] = [0] * len(rows)
+    with connection() as conn:
+        # Take the write lock up front so the AUTOINCREMENT ids handed out
+        # below are contiguous and can be derived from last_insert_rowid().
+        with metrics.lock_wait.time():
+            conn.execute("BEGIN IMMEDIATE")
+
+        with metrics.stage("dedupe"):
+            keys = [[i, device_id, ts] for (device_id, ts), i in first_of.items()]
+            stored = set()
+            for i, checkin_id, status, reasons_json in conn.execute(
+                _STORED_CHECKINS_SQL, (json.dumps(keys),)
+            ):
+                stored.add(i)
+                ids[i] = checkin_id
+                rows[i].computed_status = status
+                rows[i].computed_reasons_json = reasons_json
+            inserted = [i for i in first_of.values() if i not in stored]
+
+        if inserted:
+            new_rows = [rows[i] for i in inserted]
+            with metrics.stage("upsert_device"):
+                conn.executemany(_UPSERT_DEVICE_SQL, [devices[i] for i in inserted])
+            with metrics.stage("insert_checkin"):
+                conn.executemany(_INSERT_CHECKIN_SQL, [r.insert_values() for r in new_rows])
+            last_id = int(conn.execute("SELECT last_insert_rowid()").fetchone()[0])
+            new_ids = range(last_id - len(new_rows) + 1, last_id + 1)
+            for i, checkin_id in zip(inserted, new_ids):
+                ids[i] = checkin_id
+            with metrics.stage("update_latest"):
+                first_version = _bump_fleet_version(conn, len(new_rows))
+                conn.executemany(
+                    _UPSERT_LATEST_SQL,
+                    [
+                        (
+                            r.device_id,
+                            checkin_id,
+                            r.timestamp_utc,
+                            r.computed_status,
+                            severity_of(r.computed_status),
+                            first_version + k,
+                        )
+                        for k, (checkin_id, r) in enumerate(zip(new_ids, new_rows))
+                    ],
+                )
+            if in_transaction is not None:
+                in_transaction(conn, inserted)
+            with metrics.stage("commit"):
+                conn.commit()
+        else:
+            conn.rollback()
+
+    for i, first in repeats:
+        ids[i] = ids[first]
+        rows[i].computed_status = rows[first].computed_status
+        rows[i].computed_reasons_json = rows[first].computed_reasons_json
+    return ids, inserted
+
+
+def rebuild_latest(conn: Optional[sqlite3.Connection] = None) -> int:
+    """
+    Recompute device_latest from checkins (one indexed lookup per device).
+    Returns the number of devices written.
+    """
+    if conn is None:
+        with connection() as pooled:
+            return rebuild_latest(pooled)
+
+    conn.execute("BEGIN IMMEDIATE")
+    rows = conn.execute(
+        """
+        SELECT c.device_id, c.id, c.timestamp_utc, c.computed_status
+        FROM devices d
+        JOIN checkins c
+          ON c.id = (
+            SELECT id
             FROM checkins
-            WHERE device_id = ?
-            ORDER BY timestamp_utc DESC
+            WHERE device_id = d.device_id
+            ORDER BY timestamp_utc DESC, id DESC
             LIMIT 1
+          )
+        """
+    ).fetchall()
+    # Stale / offline marks hold as long as the latest check-in is the same
+    liveness = {
+        (r[0], r[1]): r[2]
+        for r in conn.execute(
+            "SELECT device_id, timestamp_utc, liveness FROM device_latest WHERE liveness IS NOT NULL"
+        )
+    }
+    # Every rebuilt row gets one fresh version so ?since= clients refetch it
+    version = _bump_fleet_version(conn, 1)
+    latest = []
+    for r in rows:
+        state = liveness.get((r[0], r[2]))
+        latest.append((r[0], r[1], r[2], r[3], severity_of(r[3], state), version, state))
+    conn.execute("DELETE FROM device_latest")
+    conn.executemany(
+        """
+        INSERT INTO device_latest (
+          device_id, checkin_id, timestamp_utc, computed_status, severity, version, liveness
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        latest,
+    )
+    conn.commit()
+    return len(rows)
+
+
+def get_devices_latest(
+    since: Optional[int] = None,
+    fields: Sequence[str] = DEFAULT_FIELDS,
+) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    Return (fleet_version, latest check-in per device) for fleet view, worst first.
+
+    since: only return devices whose latest state changed after this version.
+    fields: checkins columns to return (see resolve_fields); liveness
+      (None / "stale" / "offline") is always added.
+    The version is read in the same snapshot as the rows.
+    """
+    where = ""
+    params: Tuple[Any, ...] = ()
+    if since is not None:
+        where = "WHERE l.version > ?"
+        params = (since,)
+
+    with connection() as conn, metrics.stage("fleet_query"):
+        conn.execute("BEGIN")
+        version = get_fleet_version(conn)
+        rows = conn.execute(
+            f"""
+            SELECT {_select_list(fields, "c")}, l.liveness
+            FROM device_latest l
+            JOIN checkins c ON c.id = l.checkin_id
+            {where}
+            ORDER BY l.severity DESC, l.device_id ASC
             """,
-            (device_id,),
-        ).fetchone()
+            params,
+        ).fetchall()
+        conn.commit()
+        devices = [row_to_dict(r) for r in rows]
+    metrics.fleet_rows.observe(len(devices))
+    return version, devices
 
-        history = conn.execute(
-            """
-            SELECT *
-            FROM checkins
-            WHERE device_id = ?
-            ORDER BY timestamp_utc DESC
+
+def latest_rows_for(conn: sqlite3.Connection, checkin_ids: Sequence[int]) -> List[Dict[str, Any]]:
+    """
+    Fleet-view rows (DEFAULT_FIELDS + liveness) for device_latest entries,
+    by check-in id. For in-process consumers: timestamp_utc stays epoch ms.
+    """
+    rows = conn.execute(
+        f"""
+        SELECT {_select_list(DEFAULT_FIELDS, "c", iso=False)}, l.liveness
+        FROM device_latest l
+        JOIN checkins c ON c.id = l.checkin_id
+        WHERE l.checkin_id IN (SELECT value FROM json_each(?))
+        """,
+        (json.dumps(list(checkin_ids)),),
+    ).fetchall()
+    return [row_to_dict(r) for r in rows]
+
+
+def device_locations(conn: sqlite3.Connection, device_ids: Iterable[str]) -> Dict[str, Optional[str]]:
+    """Stored location_tag per device (what a check-in without one belongs to)."""
+    rows = conn.execute(
+        "SELECT device_id, location_tag FROM devices WHERE device_id IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(device_ids)),),
+    ).fetchall()
+    return {r[0]: r[1] for r in rows}
+
+
+_SET_LIVENESS_SQL = f"""
+UPDATE device_latest
+SET liveness = json_extract(j.value, '$[2]'),
+    severity = {severity_sql("computed_status", "json_extract(j.value, '$[2]')")},
+    version = ?
+FROM json_each(?) j
+WHERE device_latest.device_id = json_extract(j.value, '$[0]')
+  AND device_latest.timestamp_utc = json_extract(j.value, '$[1]')
+  AND device_latest.liveness IS NOT json_extract(j.value, '$[2]')
+RETURNING device_latest.checkin_id
+"""
+
+
+def set_liveness(changes: Sequence[Tuple[str, str, Optional[str]]]) -> List[Dict[str, Any]]:
+    """
+    Mark devices stale / offline (or reporting again with None).
+
+    changes: (device_id, timestamp_utc of the latest check-in the caller
+      knows about, liveness). Rows whose latest check-in has moved on since
+      are left alone, so a check-in racing the update always wins.
+
+    Returns the changed fleet-view rows (see latest_rows_for).
+    """
+    if not changes:
+        return []
+
+    with connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        version = get_fleet_version(conn) + 1
+        ids = [r[0] for r in conn.execute(_SET_LIVENESS_SQL, (version, json.dumps(changes))).fetchall()]
+        if ids:
+            _bump_fleet_version(conn, 1)
+        conn.commit()
+        return latest_rows_for(conn, ids) if ids else []
+
+
+def load_liveness_state() -> List[Tuple[str, str, Optional[str]]]:
+    """(device_id, latest timestamp_utc, liveness) for every device in the fleet view."""
+    with connection() as conn:
+        return [
+            (r[0], r[1], r[2])
+            for r in conn.execute("SELECT device_id, timestamp_utc, liveness FROM device_latest")
+        ]
+
+
+def load_alert_state() -> List[Tuple[str, int, Optional[str], Optional[str], Optional[str]]]:
+    """
+    (device_id, latest timestamp_utc, location_tag, computed_status,
+    computed_reasons_json) for every device.
+    """
+    with connection() as conn:
+        return [
+            (r[0], r[1], r[2], r[3], r[4])
+            for r in conn.execute(
+                """
+                SELECT l.device_id, l.timestamp_utc, d.location_tag, l.computed_status,
+                       c.computed_reasons_json
+                FROM device_latest l
+                JOIN checkins c ON c.id = l.checkin_id
+                LEFT JOIN devices d ON d.device_id = l.device_id
+                """
+            )
+        ]
+
+
+# Hard cap on history page size (keeps responses and lock time bounded)
+MAX_HISTORY_PAGE = 500
+
+
+def encode_cursor(timestamp_utc: Any, checkin_id: int) -> str:
+    raw = json.dumps([timestamp_utc, checkin_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, int]:
+    """Raises ValueError on a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        ts, checkin_id = json.loads(raw)
+        return ts, int(checkin_id)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def get_device_history(
+    device_id: str,
+    ts_from: Optional[str] = None,
+    ts_to: Optional[str] = None,
+    cursor: Optional[str] = None,
+    page_size: int = 50,
+    fields: Sequence[str] = DEFAULT_FIELDS,
+) -> Dict[str, Any]:
+    """
+    One page of a device's check-ins, newest first.
+
+    Keyset pagination on (timestamp_utc, id) walks idx_checkins_device_time_unique
+    directly, so page N costs the same as page 1. ts_from / ts_to (ISO) bound
+    the window (inclusive). On the first page of an open-ended window the newest
+    row doubles as "latest", so no second query is needed.
+
+    Returns {"latest", "history", "next_cursor"}; next_cursor is None on the
+    last page.
+    """
+    page_size = max(1, min(page_size, MAX_HISTORY_PAGE))
+
+    # Cursor columns are always selected
+    wanted = set(fields) | {"id", "timestamp_utc"}
+    columns = [c for c in CHECKIN_COLUMNS if c in wanted]
+
+    # Qualified names: the select list aliases the ISO forms as timestamp_utc
+    where = ["c.device_id = ?"]
+    params: List[Any] = [device_id]
+    if ts_from is not None:
+        where.append("c.timestamp_utc >= ?")
+        params.append(to_epoch_ms(ts_from))
+    if ts_to is not None:
+        where.append("c.timestamp_utc <= ?")
+        params.append(to_epoch_ms(ts_to))
+    if cursor is not None:
+        cur_ts, cur_id = decode_cursor(cursor)
+        where.append("(c.timestamp_utc, c.id) < (?, ?)")
+        params.extend([to_epoch_ms(cur_ts), cur_id])
+
+    # One extra row tells us whether another page exists
+    params.append(page_size + 1)
+
+    with connection() as conn:
+        rows = conn.execute(
+            f"""
+            SELECT {_select_list(columns, "c")}
+            FROM checkins c
+            WHERE {" AND ".join(where)}
+            ORDER BY c.timestamp_utc DESC, c.id DESC
             LIMIT ?
             """,
-            (device_id, limit),
+            params,
         ).fetchall()
 
-        return {
-            "latest": dict(latest) if latest else None,
-            "history": [dict(r) for r in history],
-        }
-    finally:
-        conn.close()
+    history = [row_to_dict(r) for r in rows[:page_size]]
+    next_cursor = None
+    if len(rows) > page_size:
+        last = history[-1]
+        next_cursor = encode_cursor(to_epoch_ms(last["timestamp_utc"]), last["id"])
+
+    latest = None
+    if cursor is None and ts_to is None and history:
+        latest = history[0]
+
+    return {"latest": latest, "history": history, "next_cursor": next_cursor}
+
+
+def get_device_detail(
+    device_id: str,
+    limit: int = 20,
+    fields: Sequence[str] = DEFAULT_FIELDS,
+) -> Dict[str, Any]:
+    """
+    Return latest + recent history for a single device.
+
+    limit goes to SQLite as given (0: no history, negative: all of it); the
+    MAX_HISTORY_PAGE cap is for the paginated history API only.
+    """
+    wanted = set(fields) | {"id", "timestamp_utc"}
+    select = _select_list([c for c in CHECKIN_COLUMNS if c in wanted], "c")
+    sql = f"""
+        SELECT {select}
+        FROM checkins c
+        WHERE c.device_id = ?
+        ORDER BY c.timestamp_utc DESC, c.id DESC
+        LIMIT ?
+    """
+    with connection() as conn:
+        latest = conn.execute(sql, (device_id, 1)).fetchone()
+        history = conn.execute(sql, (device_id, limit)).fetchall() if limit else []
 
+    return {
+        "latest": row_to_dict(latest) if latest else None,
+        "history": [row_to_dict(r) for r in history],
+    }
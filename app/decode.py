@@ -0,0 +1,261 @@
+"""
+Fast check-in decoding: JSON body -> validated, flattened CheckinRecord.
+
+The checks are derived from the pydantic models in app/models.py at import
+time, compiled into one straight-line function (like health_rules), and
+only accept values of exactly the expected JSON type. Anything
+else (a missing field, a bound violation, a value pydantic would coerce
+such as "5" for an int) is handed to CheckinPayload.model_validate, so
+acceptance rules and error messages are pydantic's; only the common,
+well-formed case skips it.
+
+ISO timestamps become epoch milliseconds on the record (the stored form);
+raw_json keeps them as sent.
+"""
+from __future__ import annotations
+
+import json
+import typing
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from annotated_types import Ge, Le
+from pydantic import BaseModel
+
+from app.jsonfast import loads
+from app.models import CheckinPayload
+from app.rawcodec import encode_raw
+from app.records import CheckinRecord
+from app.timeutil import to_epoch_ms
+
+
+# checkins column (or CheckinRecord device field) -> payload path
+COLUMN_PATHS: Dict[str, Tuple[str, ...]] = {
+    "device_id": ("device_id",),
+    "timestamp_utc": ("timestamp_utc",),
+    "agent_version": ("agent_version",),
+    "ip_address": ("ip_address",),
+    "location_tag": ("location_tag",),
+
+    "last_boot_utc": ("metrics", "availability", "last_boot_utc"),
+    "uptime_seconds": ("metrics", "availability", "uptime_seconds"),
+
+    "unexpected_shutdowns": ("metrics", "stability", "unexpected_shutdowns"),
+    "app_crashes": ("metrics", "stability", "app_crashes"),
+    "service_restarts": ("metrics", "stability", "service_restarts"),
+    "hang_indicators": ("metrics", "stability", "hang_indicators"),
+
+    "disk_c_free_gb": ("metrics", "storage", "disk_c_free_gb"),
+    "disk_c_free_pct": ("metrics", "storage", "disk_c_free_pct"),
+    "disk_errors": ("metrics", "storage", "disk_errors"),
+    "profile_errors": ("metrics", "storage", "profile_errors"),
+
+    "av_enabled": ("metrics", "security", "av_enabled"),
+    "av_sig_age_days": ("metrics", "security", "av_sig_age_days"),
+    "pending_reboot": ("metrics", "security", "pending_reboot"),
+    "update_failures": ("metrics", "security", "update_failures"),
+
+    "dns_ok": ("metrics", "network", "dns_ok"),
+    "gateway_ok": ("metrics", "network", "gateway_ok"),
+    "backend_reachable": ("metrics", "network", "backend_reachable"),
+    "network_resets": ("metrics", "network", "network_resets"),
+
+    "mypc_client_running": ("metrics", "mypc", "client_running"),
+    "mypc_auth_attempts": ("metrics", "mypc", "auth", "attempts"),
+    "mypc_auth_successes": ("metrics", "mypc", "auth", "successes"),
+    "mypc_auth_failures": ("metrics", "mypc", "auth", "failures"),
+    "mypc_auth_failures_by_reason_json": ("metrics", "mypc", "auth", "failures_by_reason"),
+    "mypc_service_connect_failures": ("metrics", "mypc", "connectivity", "service_connect_failures"),
+    "mypc_time_to_service_ready_s": ("metrics", "mypc", "connectivity", "time_to_service_ready_s"),
+    "mypc_last_error_category": ("metrics", "mypc", "connectivity", "last_error_category"),
+    "mypc_avg_auth_ms": ("metrics", "mypc", "login_perf", "avg_auth_ms"),
+    "mypc_p95_auth_ms": ("metrics", "mypc", "login_perf", "p95_auth_ms"),
+    "mypc_slow_login_count": ("metrics", "mypc", "login_perf", "slow_login_count"),
+}
+
+
+class _Fallback(Exception):
+    """Value needs pydantic (coercion or an error report)."""
+
+
+_REQUIRED = object()
+_MISSING = object()
+
+# (key, kind, nullable, default factory or _REQUIRED, ge, le, column, child spec)
+_Field = Tuple[str, str, bool, Any, Optional[float], Optional[float], Optional[str], Any]
+
+
+def _build_spec(model: type, path: Tuple[str, ...], columns: Dict[Tuple[str, ...], str]) -> List[_Field]:
+    spec: List[_Field] = []
+    for key, info in model.model_fields.items():
+        ann = info.annotation
+        nullable = False
+        if typing.get_origin(ann) is Union:
+            args = [a for a in typing.get_args(ann) if a is not type(None)]
+            nullable = len(args) < len(typing.get_args(ann))
+            if len(args) != 1:
+                raise TypeError(f"{model.__name__}.{key}: unsupported type {ann}")
+            ann = args[0]
+
+        ge = le = None
+        for m in info.metadata:
+            if isinstance(m, Ge):
+                ge = m.ge
+            elif isinstance(m, Le):
+                le = m.le
+            else:
+                raise TypeError(f"{model.__name__}.{key}: unsupported constraint {m!r}")
+
+        if info.is_required():
+            default: Any = _REQUIRED
+        elif info.default_factory is not None:
+            default = info.default_factory
+        else:
+            default = (lambda v: lambda: v)(info.default)
+
+        child = None
+        column = None
+        if isinstance(ann, type) and issubclass(ann, BaseModel):
+            kind = "model"
+            child = _build_spec(ann, path + (key,), columns)
+        else:
+            if ann in (int, float, bool, str):
+                kind = ann.__name__
+            elif typing.get_origin(ann) is dict and typing.get_args(ann) == (str, int):
+                kind = "dict_str_int"
+            else:
+                raise TypeError(f"{model.__name__}.{key}: unsupported type {ann}")
+            column = columns.get(path + (key,))
+            if column is None:
+                raise TypeError(f"No column mapped for payload field {'.'.join(path + (key,))}")
+
+        spec.append((key, kind, nullable, default, ge, le, column, child))
+    return spec
+
+
+_SPEC = _build_spec(CheckinPayload, (), {p: c for c, p in COLUMN_PATHS.items()})
+
+
+def _leaf_source(f: _Field, src: str, out: str, consts: Dict[str, Any]) -> List[str]:
+    key, kind, nullable, default, ge, le, column, _ = f
+    lines = [f"v = {src}.get({key!r}, MISSING)"]
+    if default is _REQUIRED:
+        lines.append("if v is MISSING: raise Fallback")
+    else:
+        name = f"_default_{column}"
+        consts[name] = default
+        lines.append(f"if v is MISSING: v = {name}()")
+
+    if kind == "float":
+        checks = ["if type(v) is int: v = float(v)", "elif type(v) is not float: raise Fallback"]
+    elif kind == "dict_str_int":
+        checks = [
+            "if type(v) is not dict or not all(type(k) is str and type(n) is int for k, n in v.items()):",
+            "    raise Fallback",
+            "v = dict(v)",
+        ]
+    else:
+        checks = [f"if type(v) is not {kind}: raise Fallback"]
+    bounds = []
+    if ge is not None:
+        bounds.append(f"v >= {ge!r}")
+    if le is not None:
+        bounds.append(f"v <= {le!r}")
+    if bounds:
+        checks.append(f"if not ({' and '.join(bounds)}): raise Fallback")
+
+    lines.append("elif v is not None:" if nullable else "elif v is None: raise Fallback\nelse:")
+    lines += [f"    {c}" for c in checks]
+    lines.append(f"{out}[{key!r}] = v")
+
+    if kind == "bool":
+        value = "None if v is None else (1 if v else 0)" if nullable else "1 if v else 0"
+    elif kind == "dict_str_int":
+        value = "dumps(v, ensure_ascii=False)"
+    else:
+        value = "v"
+    lines.append(f"rec.{column} = {value}")
+    return lines
+
+
+def _model_source(spec: List[_Field], src: str, out: str, depth: int, consts: Dict[str, Any]) -> List[str]:
+    lines: List[str] = []
+    for f in spec:
+        key, kind, _, default, _, _, _, child = f
+        if kind != "model":
+            lines += _leaf_source(f, src, out, consts)
+            continue
+        if default is not _REQUIRED:
+            raise TypeError(f"Optional nested model '{key}' is not supported")
+        sub_src, sub_out = f"s{depth + 1}", f"o{depth + 1}"
+        lines += [
+            f"{sub_src} = {src}.get({key!r})",
+            f"if type({sub_src}) is not dict: raise Fallback",
+            f"{sub_out} = {out}[{key!r}] = {{}}",
+        ]
+        lines += _model_source(child, sub_src, sub_out, depth + 1, consts)
+    return lines
+
+
+def _compile_decoder(spec: List[_Field]) -> Callable[[Any, CheckinRecord], Dict[str, Any]]:
+    """
+    Generate one straight-line function for the whole payload tree:
+    _decode(obj, rec) validates obj, sets leaf columns on rec and returns
+    the normalized dict (what model_dump() would produce). Raises _Fallback
+    for anything it doesn't accept as-is.
+    """
+    consts: Dict[str, Any] = {}
+    body = [
+        "if type(s0) is not dict: raise Fallback",
+        "o0 = {}",
+    ] + _model_source(spec, "s0", "o0", 0, consts) + ["return o0"]
+    src = "def _decode(s0, rec):\n" + "\n".join(
+        "    " + line for chunk in body for line in chunk.split("\n")
+    )
+
+    namespace: Dict[str, Any] = dict(consts)
+    namespace.update(MISSING=_MISSING, Fallback=_Fallback, dumps=json.dumps)
+    exec(compile(src, "<checkin_decoder>", "exec"), namespace)
+    return namespace["_decode"]
+
+
+_decode = _compile_decoder(_SPEC)
+
+
+def _timestamps_to_ms(rec: CheckinRecord) -> None:
+    """Raises ValueError for a timestamp that doesn't parse."""
+    rec.timestamp_utc = to_epoch_ms(rec.timestamp_utc)
+    rec.last_boot_utc = to_epoch_ms(rec.last_boot_utc)
+
+
+def decode_checkin(obj: Any) -> CheckinRecord:
+    """
+    Validate a parsed JSON check-in and flatten it into a CheckinRecord
+    (raw_json encoded per DASHBOARD_RAW_PAYLOAD; status not yet computed).
+
+    Raises pydantic.ValidationError for invalid payloads.
+    """
+    rec = CheckinRecord()
+    try:
+        normalized = _decode(obj, rec)
+        _timestamps_to_ms(rec)
+    except (_Fallback, ValueError):
+        # pydantic reports a bad timestamp as a 422 like any other field
+        normalized = CheckinPayload.model_validate(obj).model_dump()
+        rec = CheckinRecord()
+        _decode(normalized, rec)
+        _timestamps_to_ms(rec)
+    rec.raw_json = encode_raw(normalized)
+    return rec
+
+
+def decode_checkin_body(body: Union[bytes, str]) -> CheckinRecord:
+    """
+    decode_checkin for a raw request body.
+    Raises ValueError for malformed JSON, pydantic.ValidationError otherwise.
+    """
+    return decode_checkin(loads(body))
+
+
+def record_from_payload(payload: CheckinPayload) -> CheckinRecord:
+    """CheckinRecord for an already validated model."""
+    return decode_checkin(payload.model_dump())
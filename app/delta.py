@@ -0,0 +1,151 @@
+"""
+Delta check-ins (POST /api/checkin/delta).
+
+An agent sends its full payload once, then only what changed since its
+last acknowledged check-in, as a JSON merge patch (RFC 7396: objects
+merge key by key, null removes a field) against that check-in's seq. The
+server rebuilds the full payload from the device's last state and stores
+it like any other check-in, so raw_json, history and the health rules
+never see a delta.
+
+When the patch isn't against the state held here (a sequence gap, a
+server restart, a device evicted from the table) the request is refused
+with 409 and the agent resends in full. A patch must move timestamp_utc
+forward. State is per process and in memory: one compact JSON document
+per device, replaced only once its check-in has been stored.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Iterable, Optional, Tuple
+
+from app.decode import decode_checkin
+from app.jsonfast import dumps_compact, loads
+from app.models import DeltaCheckin
+from app.records import CheckinRecord
+
+
+# Devices whose last payload is kept for rebuilding deltas
+DELTA_DEVICES = int(os.environ.get("DASHBOARD_DELTA_DEVICES", 50000))
+
+
+class DeltaResync(Exception):
+    """The delta isn't against the state held for the device; resend in full."""
+
+    def __init__(self, seq: Optional[int]) -> None:
+        super().__init__("Full check-in required")
+        self.seq = seq  # last seq held for the device, if any
+
+
+class StaleDelta(Exception):
+    """The rebuilt check-in isn't newer than the one the patch is against."""
+
+    def __init__(self, timestamp_utc: Any) -> None:
+        super().__init__("timestamp_utc must be later than the check-in the patch is against")
+        self.timestamp_utc = timestamp_utc  # as sent (or carried over by the patch)
+
+
+def merge_patch(target: Any, patch: Any) -> Any:
+    """Apply an RFC 7396 merge patch (target may be modified in place)."""
+    if type(patch) is not dict:
+        return patch
+    if type(target) is not dict:
+        target = {}
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        else:
+            target[key] = merge_patch(target.get(key), value)
+    return target
+
+
+class DeltaStates:
+    """
+    Bounded device_id -> (seq, timestamp_utc ms, compact JSON payload) map;
+    the device updated least recently is forgotten first.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._items: "OrderedDict[str, Tuple[int, int, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, device_id: str) -> Optional[Tuple[int, int, bytes]]:
+        with self._lock:
+            return self._items.get(device_id)
+
+    def put(self, device_id: str, seq: int, ts_ms: int, doc: bytes, expect: Optional[int] = None) -> bool:
+        """
+        Store a device's new state. With expect, only if its seq is still
+        expect (False if another request got there first).
+        """
+        if self.maxsize <= 0:
+            return True
+        with self._lock:
+            items = self._items
+            if expect is not None:
+                current = items.get(device_id)
+                if current is None or current[0] != expect:
+                    return False
+            items[device_id] = (seq, ts_ms, doc)
+            items.move_to_end(device_id)
+            while len(items) > self.maxsize:
+                items.popitem(last=False)
+        return True
+
+    def forget(self, device_ids: Iterable[str]) -> None:
+        """Drop devices' states; their next delta is answered with a resync."""
+        with self._lock:
+            for device_id in device_ids:
+                self._items.pop(device_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+delta_states = DeltaStates(DELTA_DEVICES)
+
+
+def rebuild_checkin(msg: DeltaCheckin) -> Tuple[CheckinRecord, str, Optional[bytes]]:
+    """
+    Decode a delta check-in into the full record.
+
+    Returns (record, kind, state): kind is "full", "delta", or "retry" for
+    a resend of the last applied seq (its ack was lost), which is rebuilt
+    as before so ingest answers it as a duplicate. state is the payload to
+    hand to commit_state once the record is stored (None for a retry).
+    Raises DeltaResync, StaleDelta, or pydantic.ValidationError for a
+    rebuilt payload that doesn't validate.
+    """
+    device_id = msg.device_id
+    state = delta_states.get(device_id)
+
+    if msg.base_seq is None:
+        doc, kind = msg.checkin, "full"
+    elif state is not None and state[0] == msg.seq:
+        return decode_checkin(loads(state[2])), "retry", None
+    elif state is None or state[0] != msg.base_seq:
+        raise DeltaResync(state[0] if state is not None else None)
+    else:
+        doc, kind = merge_patch(loads(state[2]), msg.checkin), "delta"
+
+    # The envelope names the device; a patch normally leaves it out
+    doc["device_id"] = device_id
+    rec = decode_checkin(doc)
+    if kind == "delta" and rec.timestamp_utc <= state[1]:
+        raise StaleDelta(doc.get("timestamp_utc"))
+    return rec, kind, dumps_compact(doc)
+
+
+def commit_state(msg: DeltaCheckin, rec: CheckinRecord, state: Optional[bytes]) -> bool:
+    """
+    Make a stored check-in the base for the device's next delta. False if
+    another request for the device got there first; the agent's next delta
+    is then answered with a resync.
+    """
+    if state is None:
+        return True
+    return delta_states.put(msg.device_id, msg.seq, rec.timestamp_utc, state, expect=msg.base_seq)
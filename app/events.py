@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+from typing import Any, Dict, Optional, Set, Tuple
+
+from app.db import DEFAULT_FIELDS
+from app.timeutil import from_epoch_ms
+from app.trends import trend_store
+
+
+# Fields whose change is worth pushing to live dashboards
+KEY_FIELDS = (
+    "computed_status",
+    "computed_reasons_json",
+    "disk_c_free_pct",
+    "av_enabled",
+    "mypc_auth_failures",
+    "mypc_auth_attempts",
+    "liveness",
+)
+
+# Event shape: the default /api/devices projection (plus "trend")
+EVENT_FIELDS = DEFAULT_FIELDS + ("liveness",)
+
+# Per-subscriber buffer; a client that falls this far behind is dropped
+# (EventSource reconnects and the dashboard resyncs with a normal fetch).
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+class FleetBroker:
+    """
+    In-process pub/sub for device state changes.
+
+    publish_checkin() is called from sync ingest threads; delivery to the
+    asyncio subscriber queues happens with one hop onto the event loop,
+    no matter how many subscribers are connected.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscribers: Set["asyncio.Queue[Optional[str]]"] = set()
+        # device_id -> (timestamp_utc, key field values) of last published state
+        self._last: Dict[str, Tuple[Any, Tuple[Any, ...]]] = {}
+
+    def subscribe(self) -> "asyncio.Queue[Optional[str]]":
+        """Must be called from the event loop (async endpoint)."""
+        q: "asyncio.Queue[Optional[str]]" = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q: "asyncio.Queue[Optional[str]]") -> None:
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish_checkin(self, row: Dict[str, Any]) -> bool:
+        """
+        Publish a stored check-in row (or a liveness change) if it changes
+        the device's status, reasons, key metrics or liveness. Returns True
+        if an event was emitted.
+        """
+        device_id = row["device_id"]
+        ts = row["timestamp_utc"]
+        sig = tuple(row.get(f) for f in KEY_FIELDS)
+
+        with self._lock:
+            last = self._last.get(device_id)
+            # Late check-ins don't change the latest state
+            if last is not None and (ts < last[0] or sig == last[1]):
+                return False
+            self._last[device_id] = (ts, sig)
+
+            loop = self._loop
+            if loop is None or not self._subscribers:
+                return False
+
+        payload = {f: row.get(f) for f in EVENT_FIELDS}
+        # Same ISO form as /api/devices
+        payload["timestamp_utc"] = from_epoch_ms(ts)
+        payload["trend"] = trend_store.get(device_id)
+        event = json.dumps(payload, ensure_ascii=False)
+        try:
+            loop.call_soon_threadsafe(self._deliver, event)
+        except RuntimeError:
+            # Event loop already closed (shutdown)
+            return False
+        return True
+
+    def _deliver(self, event: str) -> None:
+        # Runs on the event loop thread
+        with self._lock:
+            subscribers = list(self._subscribers)
+
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except asyncio.QueueFull:
+                self.unsubscribe(q)
+                # Make room for the sentinel so the stream ends promptly
+                while not q.empty():
+                    q.get_nowait()
+                q.put_nowait(None)
+
+
+broker = FleetBroker()
@@ -0,0 +1,146 @@
+"""
+Bulk export of check-in history as CSV or NDJSON (GET /api/export and
+python -m app.cli export).
+
+Rows are streamed oldest first in pages: each page is one short read on a
+pooled connection, which goes back to the pool before the page is sent,
+and the next page continues after the last (timestamp_utc, id). A slow
+client holds no connection and no read snapshot, so ingest and WAL
+checkpoints carry on underneath it, and memory stays constant however
+much history matches.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import json
+from dataclasses import dataclass
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+
+from app.db import CHECKIN_COLUMNS, _select_list, connection, resolve_fields
+from app.rawcodec import decode_raw
+from app.timeutil import to_epoch_ms
+
+
+EXPORT_FORMATS = ("csv", "ndjson")
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+# Rows per read, i.e. per streamed chunk
+PAGE_ROWS = 1000
+
+
+@dataclass
+class ExportFilter:
+    ts_from: Optional[str] = None        # inclusive ISO timestamps
+    ts_to: Optional[str] = None
+    device_ids: Sequence[str] = ()
+    location: Optional[str] = None       # the device's current location_tag
+    statuses: Sequence[str] = ()         # computed_status at check-in time
+
+    def validate(self) -> None:
+        """Raises ValueError on a malformed timestamp or unknown status."""
+        for ts in (self.ts_from, self.ts_to):
+            if ts is not None:
+                to_epoch_ms(ts)
+        for status in self.statuses:
+            if status not in ("green", "yellow", "red"):
+                raise ValueError(f"Unknown status: {status}")
+
+
+def export_columns(fields: Optional[str]) -> Tuple[str, ...]:
+    """
+    Output columns for a fields= value: every column except raw_json by
+    default, otherwise as resolve_fields() plus the id / timestamp_utc the
+    export pages on. location_tag follows device_id.
+    """
+    wanted = set(resolve_fields(fields or "all")) | {"id", "timestamp_utc"}
+    columns = tuple(c for c in CHECKIN_COLUMNS if c in wanted)
+    i = columns.index("device_id") + 1
+    return columns[:i] + ("location_tag",) + columns[i:]
+
+
+def _query(flt: ExportFilter, columns: Sequence[str]) -> Tuple[str, List[Any]]:
+    select = ", ".join(
+        "d.location_tag" if c == "location_tag" else _select_list((c,), "c") for c in columns
+    )
+    where: List[str] = ["(c.timestamp_utc, c.id) > (?, ?)"]
+    params: List[Any] = []
+    if flt.ts_from is not None:
+        where.append("c.timestamp_utc >= ?")
+        params.append(to_epoch_ms(flt.ts_from))
+    if flt.ts_to is not None:
+        where.append("c.timestamp_utc <= ?")
+        params.append(to_epoch_ms(flt.ts_to))
+    if flt.device_ids:
+        where.append(f"c.device_id IN ({', '.join('?' * len(flt.device_ids))})")
+        params.extend(flt.device_ids)
+    if flt.location is not None:
+        where.append("d.location_tag = ?")
+        params.append(flt.location)
+    if flt.statuses:
+        where.append(f"c.computed_status IN ({', '.join('?' * len(flt.statuses))})")
+        params.extend(flt.statuses)
+
+    sql = f"""
+        SELECT {select}
+        FROM checkins c
+        LEFT JOIN devices d ON d.device_id = c.device_id
+        WHERE {" AND ".join(where)}
+        ORDER BY c.timestamp_utc, c.id
+        LIMIT {PAGE_ROWS}
+    """
+    return sql, params
+
+
+def iter_rows(flt: ExportFilter, columns: Sequence[str]) -> Iterator[List[tuple]]:
+    """Matching rows as tuples in column order, PAGE_ROWS at a time."""
+    sql, params = _query(flt, columns)
+    ts_i, id_i = columns.index("timestamp_utc"), columns.index("id")
+    raw_i = columns.index("raw_json") if "raw_json" in columns else None
+
+    # Keyset start: before any stored (timestamp_utc, id)
+    after: Tuple[Any, Any] = (-1, 0)
+    while True:
+        # Read the page whole: the consumer may be a slow download, and the
+        # connection must not wait on it
+        with connection() as conn:
+            page = conn.execute(sql, [*after, *params]).fetchall()
+        if not page:
+            return
+        last = page[-1]
+        # timestamp_utc is selected as ISO; the key is epoch ms
+        after = (to_epoch_ms(last[ts_i]), last[id_i])
+        rows = [tuple(r) for r in page]
+        if raw_i is not None:
+            rows = [r[:raw_i] + (decode_raw(r[raw_i]),) + r[raw_i + 1:] for r in rows]
+        yield rows
+        if len(page) < PAGE_ROWS:
+            return
+
+
+def iter_export(flt: ExportFilter, fmt: str, columns: Sequence[str]) -> Iterator[str]:
+    """Encoded text chunks: a CSV header then rows, or one JSON object per line."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {EXPORT_FORMATS}")
+
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator="\n")
+        writer.writerow(columns)
+        for rows in iter_rows(flt, columns):
+            writer.writerows(rows)
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        # Header-only output for an empty export
+        if buf.tell():
+            yield buf.getvalue()
+        return
+
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    for rows in iter_rows(flt, columns):
+        yield "".join(dumps(dict(zip(columns, r))) + "\n" for r in rows)
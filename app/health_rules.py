@@ -1,124 +1,261 @@
 from __future__ import annotations
 
-from typing import Dict, List, Tuple
+import copy
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 
-def classify(checkin_row: Dict) -> Tuple[str, List[str]]:
+# Sort weight for the fleet view (worst first)
+STATUS_SEVERITY = {"green": 1, "yellow": 2, "red": 3}
+
+# Devices that stopped checking in (app/liveness.py) rank at least this
+# high; offline sorts above red
+LIVENESS_SEVERITY = {"stale": 2, "offline": 4}
+
+
+def severity_of(status: Optional[str], liveness: Optional[str] = None) -> int:
+    severity = STATUS_SEVERITY.get(status or "green", 1)
+    if liveness:
+        severity = max(severity, LIVENESS_SEVERITY.get(liveness, 0))
+    return severity
+
+
+def severity_sql(status_expr: str, liveness_expr: str) -> str:
+    """SQL expression computing severity_of(status, liveness) from two columns."""
+    status_case = " ".join(f"WHEN '{s}' THEN {v}" for s, v in STATUS_SEVERITY.items())
+    liveness_case = " ".join(f"WHEN '{s}' THEN {v}" for s, v in LIVENESS_SEVERITY.items())
+    return (
+        f"MAX(CASE {status_expr} {status_case} ELSE 1 END, "
+        f"CASE {liveness_expr} {liveness_case} ELSE 0 END)"
+    )
+
+
+# Rule definitions live next to schema.sql; override with DASHBOARD_HEALTH_RULES
+RULES_PATH = Path(
+    os.environ.get(
+        "DASHBOARD_HEALTH_RULES",
+        Path(__file__).resolve().parent.parent / "health_rules.json",
+    )
+)
+
+# How often classify() may stat the rules file for hot reload
+RELOAD_CHECK_S = 2.0
+
+_COMPARE_OPS = {"<", "<=", ">", ">=", "==", "!="}
+_FLAG_OPS = {"true", "false"}
+_OVERRIDABLE = {"value", "min_per", "status", "reason", "enabled"}
+
+# Called with a CheckinRecord (app/records.py); rule fields are read as attributes
+Classifier = Callable[[Any], Tuple[str, List[str]]]
+
+
+# -------------------------
+# Rule compilation
+# -------------------------
+def _fmt_number(v: Any) -> str:
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return str(v)
+
+
+def _check_rule(rule: Dict[str, Any]) -> None:
+    rid = rule.get("id", "?")
+    for key in ("id", "field", "op", "status", "reason"):
+        if key not in rule:
+            raise ValueError(f"Rule {rid}: missing '{key}'")
+    if rule["status"] not in STATUS_SEVERITY or rule["status"] == "green":
+        raise ValueError(f"Rule {rid}: status must be 'yellow' or 'red'")
+
+    op = rule["op"]
+    if op in _COMPARE_OPS:
+        if isinstance(rule.get("value"), bool) or not isinstance(rule.get("value"), (int, float)):
+            raise ValueError(f"Rule {rid}: '{op}' needs a numeric value")
+    elif op not in _FLAG_OPS:
+        raise ValueError(f"Rule {rid}: unknown op '{op}'")
+
+    for col in (rule["field"], rule.get("per")):
+        if col is not None and not (isinstance(col, str) and col.isidentifier()):
+            raise ValueError(f"Rule {rid}: bad column name {col!r}")
+
+
+def _rule_source(i: int, rule: Dict[str, Any], consts: Dict[str, Any]) -> List[str]:
+    """Python source lines for one rule (thresholds inlined as literals)."""
+    sev = STATUS_SEVERITY[rule["status"]]
+    value = rule.get("value")
+
+    reason_name = f"_r{i}"
+    consts[reason_name] = rule["reason"].format(
+        value=_fmt_number(value),
+        value_pct=_fmt_number(round(value * 100, 6)) if isinstance(value, (int, float)) else "",
+    )
+
+    op = rule["op"]
+    lines = [f"    v = row.{rule['field']}"]
+    if rule.get("per"):
+        lines.append(f"    d = row.{rule['per']}")
+        test = (
+            f"v is not None and d and d >= {rule.get('min_per', 1)!r} "
+            f"and v / d {op} {value!r}"
+        )
+    elif op == "true":
+        test = "v"
+    elif op == "false":
+        test = "v is not None and not v"
+    else:
+        test = f"v is not None and v {op} {value!r}"
+
+    # A rule can't add a milder reason once the row is already worse
+    guard = "" if sev == max(STATUS_SEVERITY.values()) else f"sev <= {sev} and "
+    lines += [
+        f"    if {guard}{test}:",
+        f"        sev = {sev}",
+        f"        status = {rule['status']!r}",
+        f"        reasons.append({reason_name})",
+    ]
+    return lines
+
+
+def compile_rules(rules: List[Dict[str, Any]]) -> Classifier:
+    """
+    Compile a rule list into one Python function. Thresholds, statuses and
+    reason strings become literals/constants, so evaluating a row costs one
+    slot attribute read and one comparison per rule -- no config lookups,
+    method calls or coercions.
+    """
+    consts: Dict[str, Any] = {}
+    src = [
+        "def _classify(row):",
+        "    status = 'green'",
+        "    sev = 1",
+        "    reasons = []",
+    ]
+    for i, rule in enumerate(rules):
+        _check_rule(rule)
+        if rule.get("enabled", True):
+            src += _rule_source(i, rule, consts)
+    src.append("    return status, reasons")
+
+    namespace: Dict[str, Any] = dict(consts)
+    exec(compile("\n".join(src), "<health_rules>", "exec"), namespace)
+    return namespace["_classify"]
+
+
+def _apply_overrides(rules: List[Dict[str, Any]], overrides: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    merged = copy.deepcopy(rules)
+    merged_by_id = {r["id"]: r for r in merged}
+    for rule_id, changes in overrides.items():
+        if rule_id not in merged_by_id:
+            raise ValueError(f"Override for unknown rule '{rule_id}'")
+        bad = set(changes) - _OVERRIDABLE
+        if bad:
+            raise ValueError(f"Rule {rule_id}: can't override {sorted(bad)}")
+        merged_by_id[rule_id].update(changes)
+    return merged
+
+
+# -------------------------
+# Rule set with hot reload
+# -------------------------
+class RuleSet:
+    """
+    Compiled rules for the default policy plus one evaluator per
+    location_tag override. Reloads itself when the file changes.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._next_check = 0.0
+        self._default: Classifier = compile_rules([])
+        self._by_location: Dict[str, Classifier] = {}
+        self.columns: Tuple[str, ...] = ()
+        # Loaded on first use: validating rule fields needs app.db, which
+        # imports this module
+
+    def load(self) -> None:
+        """Compile the file; on error the previous rules stay active."""
+        with self._lock:
+            mtime = self.path.stat().st_mtime
+            with open(self.path, "r", encoding="utf-8") as f:
+                spec = json.load(f)
+
+            rules = spec.get("rules", [])
+            default = compile_rules(rules)
+            by_location = {
+                location: compile_rules(_apply_overrides(rules, overrides))
+                for location, overrides in spec.get("locations", {}).items()
+            }
+
+            columns = sorted({c for r in rules for c in (r["field"], r.get("per")) if c})
+            # Rules read fields as record attributes, so they must be columns
+            from app.db import CHECKIN_COLUMNS
+            unknown = set(columns) - set(CHECKIN_COLUMNS)
+            if unknown:
+                raise ValueError(f"Unknown check-in columns in rules: {sorted(unknown)}")
+
+            self._default, self._by_location, self._mtime = default, by_location, mtime
+            self.columns = tuple(columns)
+
+    def maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        if self._mtime is None:
+            # First use: a broken rules file is an error, not a warning
+            self.load()
+            self._next_check = now + RELOAD_CHECK_S
+            return
+        self._next_check = now + RELOAD_CHECK_S
+        try:
+            if self.path.stat().st_mtime != self._mtime:
+                self.load()
+        except Exception as e:
+            print(f"[health_rules] reload failed, keeping previous rules: {e}")
+
+    def evaluator(self, location_tag: Optional[str] = None) -> Classifier:
+        self.maybe_reload()
+        return self._by_location.get(location_tag, self._default)
+
+    def classify(self, checkin_row: Any, location_tag: Optional[str] = None) -> Tuple[str, List[str]]:
+        return self.evaluator(location_tag)(checkin_row)
+
+    def snapshot(self) -> Tuple[Tuple[str, ...], Callable[[Optional[str]], Classifier]]:
+        """The columns and per-location evaluators of one version of the rules."""
+        self.maybe_reload()
+        with self._lock:
+            default, by_location, columns = self._default, self._by_location, self.columns
+        return columns, lambda location_tag: by_location.get(location_tag, default)
+
+
+_rules = RuleSet(RULES_PATH)
+
+
+def reload_rules() -> None:
+    """Force a reload now (raises if the file is invalid)."""
+    _rules.load()
+
+
+def rules_snapshot() -> Tuple[Tuple[str, ...], Callable[[Optional[str]], Classifier]]:
+    """
+    (columns read, location_tag -> compiled evaluator) for the current
+    rules, for bulk re-classification: a reload during the run doesn't
+    change them.
+    """
+    return _rules.snapshot()
+
+
+def classify(checkin_row: Any, location_tag: Optional[str] = None) -> Tuple[str, List[str]]:
     """
-    Classify a check-in row into a health state and human-readable reasons.
+    Classify a check-in (CheckinRecord) into a health state and human-readable reasons,
+    using the rules in health_rules.json (with location_tag overrides).
 
     Returns:
       computed_status: 'green' | 'yellow' | 'red'
       reasons: list[str]
     """
-    reasons: List[str] = []
-    status = "green"
-
-    # -------------------------
-    # Storage rules
-    # -------------------------
-    disk_pct = float(checkin_row["disk_c_free_pct"])
-    if disk_pct < 10:
-        status = "red"
-        reasons.append("Low disk space (<10%)")
-    elif disk_pct < 20 and status != "red":
-        status = "yellow"
-        reasons.append("Disk space warning (<20%)")
-
-    # Optional disk/profile error signals (if you populate them)
-    disk_errors = checkin_row.get("disk_errors")
-    if disk_errors is not None and int(disk_errors) > 0 and status != "red":
-        status = "yellow"
-        reasons.append("Disk errors detected")
-
-    profile_errors = checkin_row.get("profile_errors")
-    if profile_errors is not None and int(profile_errors) > 0 and status != "red":
-        status = "yellow"
-        reasons.append("Profile errors detected")
-
-    # -------------------------
-    # Security rules
-    # -------------------------
-    if not bool(checkin_row["av_enabled"]):
-        status = "red"
-        reasons.append("Antivirus disabled")
-
-    sig_age = int(checkin_row["av_sig_age_days"])
-    if sig_age > 7 and status != "red":
-        status = "yellow"
-        reasons.append("AV definitions out of date (>7 days)")
-
-    if bool(checkin_row["pending_reboot"]) and status != "red":
-        status = "yellow"
-        reasons.append("Pending reboot")
-
-    update_failures = checkin_row.get("update_failures")
-    if update_failures is not None and int(update_failures) > 0 and status != "red":
-        status = "yellow"
-        reasons.append("Windows Update failures detected")
-
-    # -------------------------
-    # Network rules
-    # -------------------------
-    if not bool(checkin_row["dns_ok"]):
-        status = "red"
-        reasons.append("DNS check failed")
-
-    if not bool(checkin_row["gateway_ok"]):
-        status = "red"
-        reasons.append("Gateway unreachable")
-
-    backend_reachable = checkin_row.get("backend_reachable")
-    if backend_reachable is not None and int(backend_reachable) == 0 and status != "red":
-        status = "yellow"
-        reasons.append("Auth backend not reachable")
-
-    network_resets = checkin_row.get("network_resets")
-    if network_resets is not None and int(network_resets) > 0 and status != "red":
-        status = "yellow"
-        reasons.append("Network adapter resets detected")
-
-    # -------------------------
-    # Stability rules
-    # -------------------------
-    if int(checkin_row["unexpected_shutdowns"]) > 0:
-        status = "red"
-        reasons.append("Unexpected shutdown detected")
-
-    # Crash thresholds can be tuned later; keep reasonable defaults
-    if int(checkin_row["app_crashes"]) >= 3 and status != "red":
-        status = "yellow"
-        reasons.append("High application crash count")
-
-    if int(checkin_row["service_restarts"]) >= 3 and status != "red":
-        status = "yellow"
-        reasons.append("High service restart count")
-
-    hang = checkin_row.get("hang_indicators")
-    if hang is not None and int(hang) > 0 and status != "red":
-        status = "yellow"
-        reasons.append("Hang indicators detected")
-
-    # -------------------------
-    # MyPC rules (generic)
-    # -------------------------
-    if int(checkin_row["mypc_service_connect_failures"]) > 0 and status != "red":
-        status = "yellow"
-        reasons.append("MyPC service connectivity failures")
-
-    attempts = int(checkin_row["mypc_auth_attempts"])
-    failures = int(checkin_row["mypc_auth_failures"])
-    if attempts >= 10:
-        fail_rate = failures / max(attempts, 1)
-        if fail_rate >= 0.5 and status != "red":
-            status = "yellow"
-            reasons.append("High MyPC auth failure rate (>=50%)")
-
-    # Slow auth signal (if present)
-    slow_count = checkin_row.get("mypc_slow_login_count")
-    if slow_count is not None and int(slow_count) > 0 and status != "red":
-        status = "yellow"
-        reasons.append("Slow MyPC authentication events")
-
-    return status, reasons
-
+    return _rules.classify(checkin_row, location_tag)
@@ -0,0 +1,190 @@
+"""
+Classify and store check-ins, then fan them out (rollups, trends, fleet
+summary, live stream, liveness, alerts).
+
+Ingest is idempotent on (device_id, timestamp_utc): agents retry after a
+timeout, and a retry is answered with the original result instead of
+being stored twice. Recently stored keys are kept in memory so a retry
+storm is answered without touching the database; older retries are
+caught by the unique index lookup in insert_checkins_batch.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app import metrics
+from app.alerts import get_alerts
+from app.db import device_locations, insert_checkins_batch
+from app.delta import delta_states
+from app.events import broker
+from app.health_rules import classify
+from app.liveness import get_liveness
+from app.records import CheckinRecord
+from app.rollups import update_rollups
+from app.summary import fleet_summary
+from app.trends import trend_store
+
+
+# Recently stored check-in keys remembered for retries
+RECENT_CHECKINS = int(os.environ.get("DASHBOARD_INGEST_RECENT_KEYS", 10000))
+
+
+class RecentCheckins:
+    """
+    Bounded (device_id, timestamp_utc) -> (checkin_id, computed_status,
+    computed_reasons_json) map; the oldest keys are forgotten first.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._items: "OrderedDict[Tuple[str, str], Tuple[int, str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str]) -> Optional[Tuple[int, str, str]]:
+        with self._lock:
+            return self._items.get(key)
+
+    def add(self, rows: Sequence[CheckinRecord], ids: Sequence[int]) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            items = self._items
+            for checkin_id, r in zip(ids, rows):
+                items[(r.device_id, r.timestamp_utc)] = (checkin_id, r.computed_status, r.computed_reasons_json)
+            while len(items) > self.maxsize:
+                items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+recent_checkins = RecentCheckins(RECENT_CHECKINS)
+
+
+def reset_ingest_caches() -> None:
+    """
+    Forget remembered check-in results and delta states. They describe the
+    database they were filled from: call after (re)opening one.
+    """
+    recent_checkins.clear()
+    delta_states.clear()
+
+
+def _duplicate_result(checkin_id: int, status: str, reasons_json: str) -> Dict[str, Any]:
+    return {
+        "checkin_id": checkin_id,
+        "computed_status": status,
+        "reasons": json.loads(reasons_json) if reasons_json else [],
+        "duplicate": True,
+    }
+
+
+def recent_result(rec: CheckinRecord) -> Optional[Dict[str, Any]]:
+    """The stored result if rec was stored recently (an agent retry), else None."""
+    hit = recent_checkins.get((rec.device_id, rec.timestamp_utc))
+    if hit is None:
+        return None
+    metrics.duplicate_checkins.inc(source="cache")
+    return _duplicate_result(*hit)
+
+
+def prepare_checkin(rec: CheckinRecord) -> Tuple[Tuple, List[str]]:
+    """
+    Classify one decoded check-in (sets computed_status / reasons on rec).
+
+    Returns (devices upsert tuple, reasons).
+    """
+    with metrics.stage("classify"):
+        computed_status, reasons = classify(rec, location_tag=rec.location_tag)
+    rec.computed_status = computed_status
+    rec.computed_reasons_json = json.dumps(reasons, ensure_ascii=False)
+
+    # first_seen_utc is only used on insert
+    ts = rec.timestamp_utc
+    device = (rec.device_id, rec.location_tag, rec.ip_address, ts, ts)
+    return device, reasons
+
+
+def commit_checkins(rows: Sequence[CheckinRecord], devices: Sequence[Tuple]) -> Tuple[List[int], List[int]]:
+    """
+    Write classified rows (group commit, rollups in the same transaction).
+
+    Returns (ids, inserted) as insert_checkins_batch: rows not in inserted
+    were already stored and now carry the stored result.
+    """
+    def add_rollups(conn, inserted: List[int]) -> None:
+        with metrics.stage("rollups"):
+            new_rows = [rows[i] for i in inserted]
+            # A check-in without location_tag counts for the device's stored
+            # one (the devices upsert keeps it), as rebuild_rollups does
+            untagged = {r.device_id for r in new_rows if not r.location_tag}
+            stored = device_locations(conn, untagged) if untagged else {}
+            update_rollups(conn, new_rows, [r.location_tag or stored.get(r.device_id) for r in new_rows])
+
+    ids, inserted = insert_checkins_batch(devices=devices, rows=rows, in_transaction=add_rollups)
+    recent_checkins.add(rows, ids)
+    if len(inserted) < len(rows):
+        metrics.duplicate_checkins.inc(len(rows) - len(inserted), source="db")
+    return ids, inserted
+
+
+def fan_out_checkins(rows: Sequence[CheckinRecord], ids: Sequence[int], inserted: Sequence[int]) -> None:
+    """Pass committed rows (as commit_checkins returned them) to the in-memory consumers."""
+    new_rows = [rows[i] for i in inserted]
+    trend_store.observe(new_rows)
+    fleet_summary.observe(new_rows)
+
+    # Live dashboards only hear about committed rows
+    for i in inserted:
+        rows[i].id = ids[i]
+        broker.publish_checkin(rows[i])
+
+    tracker = get_liveness()
+    if tracker is not None:
+        tracker.observe([(r.device_id, r.timestamp_utc) for r in new_rows])
+    # Only queues events; delivery happens on the sink threads
+    alerts = get_alerts()
+    if alerts is not None:
+        alerts.observe(new_rows)
+
+
+def write_checkins(rows: Sequence[CheckinRecord], devices: Sequence[Tuple]) -> Tuple[List[int], List[int]]:
+    """commit_checkins, then fan_out_checkins for the new rows."""
+    ids, inserted = commit_checkins(rows, devices)
+    fan_out_checkins(rows, ids, inserted)
+    return ids, inserted
+
+
+def store_checkins(rows: Sequence[CheckinRecord]) -> List[Dict[str, Any]]:
+    """
+    Classify and store decoded check-ins (see app/decode.py) with a single
+    group commit. Retries of stored check-ins are answered with the
+    original result (plus "duplicate": true) and not written again.
+
+    Returns one result per row, in order.
+    """
+    results: List[Optional[Dict[str, Any]]] = [recent_result(r) for r in rows]
+    todo = [i for i, res in enumerate(results) if res is None]
+    if not todo:
+        return results  # type: ignore[return-value]
+
+    fresh = [rows[i] for i in todo]
+    prepared = [prepare_checkin(r) for r in fresh]
+    ids, inserted = write_checkins(fresh, [device for device, _ in prepared])
+
+    new = set(inserted)
+    for k, (i, checkin_id, row, (_, reasons)) in enumerate(zip(todo, ids, fresh, prepared)):
+        if k in new:
+            results[i] = {
+                "checkin_id": checkin_id,
+                "computed_status": row.computed_status,
+                "reasons": reasons,
+            }
+        else:
+            results[i] = _duplicate_result(checkin_id, row.computed_status, row.computed_reasons_json)
+    return results  # type: ignore[return-value]
@@ -0,0 +1,19 @@
+"""
+JSON helpers on orjson (a requirement: decoding check-in bodies with the
+standard library would give most of app/decode.py's gain back).
+"""
+from __future__ import annotations
+
+from typing import Any, Union
+
+import orjson
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Parse a JSON document (raises ValueError on bad input)."""
+    return orjson.loads(data)
+
+
+def dumps_compact(obj: Any) -> bytes:
+    """UTF-8 JSON with no whitespace, e.g. for compressed raw payloads."""
+    return orjson.dumps(obj)
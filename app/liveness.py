@@ -0,0 +1,293 @@
+"""
+Stale / offline detection for devices that stop checking in.
+
+Each device has an expected check-in interval: an EWMA of the gaps between
+its check-in timestamps. A device silent for stale_factor x interval is
+marked stale, after offline_factor x interval offline; its next check-in
+clears the mark (the device_latest upsert resets it).
+
+Deadlines live in one min-heap with (normally) one entry per device. A
+check-in only moves the device's due time in a dict (O(1), no heap push
+while a no-later entry exists); when an entry comes up early because the
+device reported meanwhile, it is pushed back with the new due time. The
+sweeper thread sleeps until the earliest deadline, so a fleet of 100k
+devices costs a few heap operations per check-in interval, never a scan.
+"""
+from __future__ import annotations
+
+import heapq
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.db import load_liveness_state, set_liveness
+from app.events import broker
+from app.summary import fleet_summary
+from app.timeutil import to_epoch_ms
+
+
+LIVE, STALE, OFFLINE = 0, 1, 2
+_STATE_NAMES = (None, "stale", "offline")
+_STATE_OF = {None: LIVE, "stale": STALE, "offline": OFFLINE}
+
+# Longest the sweeper sleeps with nothing due (it is woken for earlier deadlines)
+_IDLE_WAIT_S = 60.0
+
+
+@dataclass
+class LivenessSettings:
+    # Expected interval until a device's own cadence has been seen
+    default_interval_s: float = 300.0
+    # Bounds on the learned interval (a chatty demo agent shouldn't go
+    # stale after a few seconds of jitter)
+    min_interval_s: float = 30.0
+    max_interval_s: float = 86400.0
+    # Missed intervals before a device is stale / offline
+    stale_factor: float = 3.0
+    offline_factor: float = 10.0
+    # Weight of the newest gap in the interval EWMA
+    ewma_alpha: float = 0.2
+    # Minimum time between sweeps, so transitions are written in batches
+    tick_s: float = 1.0
+
+    @classmethod
+    def from_env(cls) -> "LivenessSettings":
+        """DASHBOARD_LIVENESS_* environment variables override the defaults."""
+        env = os.environ
+        d = cls()
+        return cls(
+            default_interval_s=float(env.get("DASHBOARD_LIVENESS_DEFAULT_INTERVAL_S", d.default_interval_s)),
+            min_interval_s=float(env.get("DASHBOARD_LIVENESS_MIN_INTERVAL_S", d.min_interval_s)),
+            max_interval_s=float(env.get("DASHBOARD_LIVENESS_MAX_INTERVAL_S", d.max_interval_s)),
+            stale_factor=float(env.get("DASHBOARD_LIVENESS_STALE_FACTOR", d.stale_factor)),
+            offline_factor=float(env.get("DASHBOARD_LIVENESS_OFFLINE_FACTOR", d.offline_factor)),
+            ewma_alpha=float(env.get("DASHBOARD_LIVENESS_EWMA_ALPHA", d.ewma_alpha)),
+            tick_s=float(env.get("DASHBOARD_LIVENESS_TICK_S", d.tick_s)),
+        )
+
+
+class _Device:
+    __slots__ = ("ts", "ts_ms", "seen", "interval", "learned", "state", "due", "entry")
+
+    def __init__(self, ts: str, ts_ms: int, seen: float, interval: float) -> None:
+        self.ts = ts            # latest timestamp_utc, as stored in device_latest
+        self.ts_ms = ts_ms
+        self.seen = seen        # wall-clock time the latest check-in arrived
+        self.interval = interval
+        self.learned = False    # interval comes from an observed gap
+        self.state = LIVE
+        self.due = 0.0          # next transition (wall clock)
+        self.entry = 0.0        # due time of this device's heap entry (0 = none)
+
+
+class LivenessTracker:
+    """
+    In-memory deadlines for every device, plus the thread that writes
+    stale / offline transitions to device_latest and the live stream.
+    """
+
+    def __init__(self, settings: LivenessSettings) -> None:
+        self.settings = settings
+        self._devices: Dict[str, _Device] = {}
+        self._heap: List[Tuple[float, str]] = []
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        # Transitions whose write failed; retried on the next sweep
+        self._unwritten: Dict[str, Tuple[str, Optional[str]]] = {}
+        self._counts = [0, 0, 0]
+
+    # -------------------------
+    # Deadlines
+    # -------------------------
+    def _clamp(self, interval: float) -> float:
+        s = self.settings
+        return min(max(interval, s.min_interval_s), s.max_interval_s)
+
+    def _due(self, dev: _Device) -> float:
+        s = self.settings
+        if dev.state == OFFLINE:
+            return float("inf")
+        factor = s.stale_factor if dev.state == LIVE else s.offline_factor
+        return dev.seen + factor * dev.interval
+
+    def _schedule(self, device_id: str, dev: _Device) -> None:
+        """Set dev.due for its current state; caller holds the lock."""
+        dev.due = self._due(dev)
+        if dev.state == OFFLINE:
+            return
+        # An existing entry that fires no later than due is enough
+        if not dev.entry or dev.due < dev.entry:
+            dev.entry = dev.due
+            heapq.heappush(self._heap, (dev.due, device_id))
+            if self._heap[0][1] == device_id:
+                self._cond.notify()
+
+    def _set_state(self, dev: _Device, state: int) -> None:
+        self._counts[dev.state] -= 1
+        self._counts[state] += 1
+        dev.state = state
+
+    def seed(self, rows: Iterable[Tuple[str, str, Optional[str]]], now: Optional[float] = None) -> None:
+        """
+        Load (device_id, latest timestamp_utc, liveness) at startup. Silence
+        is counted from the stored timestamp; intervals start at the default.
+        """
+        now = time.time() if now is None else now
+        with self._cond:
+            for device_id, ts, liveness in rows:
+                ts_ms = to_epoch_ms(ts)
+                dev = _Device(ts, ts_ms, min(now, ts_ms / 1000), self._clamp(self.settings.default_interval_s))
+                dev.state = _STATE_OF.get(liveness, LIVE)
+                self._counts[dev.state] += 1
+                self._devices[device_id] = dev
+                self._schedule(device_id, dev)
+
+    def observe(self, checkins: Iterable[Tuple[str, str]], now: Optional[float] = None) -> None:
+        """Record committed check-ins: (device_id, timestamp_utc) pairs, in order."""
+        s = self.settings
+        now = time.time() if now is None else now
+        with self._cond:
+            for device_id, ts in checkins:
+                ts_ms = to_epoch_ms(ts)
+                dev = self._devices.get(device_id)
+                if dev is None:
+                    dev = self._devices[device_id] = _Device(
+                        ts, ts_ms, now, self._clamp(s.default_interval_s)
+                    )
+                    self._counts[LIVE] += 1
+                else:
+                    # Late check-ins don't change the latest state
+                    if ts_ms < dev.ts_ms:
+                        continue
+                    gap = (ts_ms - dev.ts_ms) / 1000
+                    # Outages (a gap across a stale mark) don't teach the cadence
+                    if gap > 0 and dev.state == LIVE:
+                        if dev.learned:
+                            gap = (1 - s.ewma_alpha) * dev.interval + s.ewma_alpha * gap
+                        dev.interval = self._clamp(gap)
+                        dev.learned = True
+                    dev.ts, dev.ts_ms, dev.seen = ts, ts_ms, now
+                    if dev.state != LIVE:
+                        self._set_state(dev, LIVE)
+                    self._unwritten.pop(device_id, None)
+                self._schedule(device_id, dev)
+
+    def expire(self, now: Optional[float] = None) -> List[Tuple[str, str, Optional[str]]]:
+        """
+        Advance every device whose deadline has passed.
+        Returns (device_id, timestamp_utc, new liveness) per changed device.
+        """
+        now = time.time() if now is None else now
+        changed: List[Tuple[str, str, Optional[str]]] = []
+        with self._cond:
+            heap = self._heap
+            while heap and heap[0][0] <= now:
+                entry, device_id = heapq.heappop(heap)
+                dev = self._devices.get(device_id)
+                if dev is None or entry != dev.entry:
+                    continue  # superseded by an earlier entry
+                dev.entry = 0.0
+                if dev.due > now:
+                    # Reported since this entry was pushed
+                    self._schedule(device_id, dev)
+                    continue
+                # A long silence (e.g. at startup) can pass both deadlines at once
+                while dev.due <= now:
+                    self._set_state(dev, dev.state + 1)
+                    dev.due = self._due(dev)
+                self._schedule(device_id, dev)
+                changed.append((device_id, dev.ts, _STATE_NAMES[dev.state]))
+        return changed
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                "devices": len(self._devices),
+                "stale": self._counts[STALE],
+                "offline": self._counts[OFFLINE],
+            }
+
+    # -------------------------
+    # Sweeper thread
+    # -------------------------
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="liveness", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(5)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    due = self._heap[0][0] if self._heap else None
+                    wait = _IDLE_WAIT_S if due is None else due - time.time()
+                    if wait <= 0:
+                        break
+                    self._cond.wait(min(wait, _IDLE_WAIT_S))
+                if self._stopping:
+                    return
+            self.sweep()
+            # Let more deadlines pile up so they share one transaction
+            with self._cond:
+                if not self._stopping:
+                    self._cond.wait(self.settings.tick_s)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Expire due devices and write the transitions. Returns rows changed."""
+        changed = self.expire(now)
+        with self._cond:
+            for device_id, ts, liveness in changed:
+                self._unwritten[device_id] = (ts, liveness)
+            if not self._unwritten:
+                return 0
+            pending = [(d, ts, liveness) for d, (ts, liveness) in self._unwritten.items()]
+
+        try:
+            rows = set_liveness(pending)
+        except Exception as e:
+            # Most likely a busy database; the next sweep retries
+            print(f"[liveness] could not write {len(pending)} transitions: {e!r}")
+            return 0
+
+        with self._cond:
+            for device_id, ts, liveness in pending:
+                if self._unwritten.get(device_id) == (ts, liveness):
+                    del self._unwritten[device_id]
+        fleet_summary.update_latest(rows)
+        for row in rows:
+            broker.publish_checkin(row)
+        return len(rows)
+
+
+_tracker: Optional[LivenessTracker] = None
+
+
+def start_liveness(settings: LivenessSettings) -> LivenessTracker:
+    """Seed deadlines from device_latest and start the sweeper."""
+    global _tracker
+    tracker = LivenessTracker(settings)
+    tracker.seed(load_liveness_state())
+    tracker.start()
+    _tracker = tracker
+    return tracker
+
+
+def get_liveness() -> Optional[LivenessTracker]:
+    """The running tracker, or None outside the server (CLI, scripts)."""
+    return _tracker
+
+
+def stop_liveness() -> None:
+    global _tracker
+    if _tracker is not None:
+        _tracker.stop()
+        _tracker = None
@@ -1,15 +1,49 @@
 from __future__ import annotations
 
+import asyncio
 import json
+import os
+import time
 from pathlib import Path
-from typing import Optional
-
-from fastapi import FastAPI, Header, HTTPException
-from fastapi.responses import FileResponse, RedirectResponse
-
-from app.models import CheckinPayload
-from app.db import init_db, upsert_device, insert_checkin, get_devices_latest, get_device_detail
-from app.health_rules import classify
+from typing import Any, Dict, List, Optional
+
+from fastapi import Body, FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import FileResponse, PlainTextResponse, RedirectResponse, StreamingResponse
+from pydantic import ValidationError
+
+from app import metrics
+from app.alerts import AlertSettings, get_alerts, start_alerts, stop_alerts
+from app.decode import decode_checkin, decode_checkin_body
+from app.delta import DeltaResync, StaleDelta, commit_state, rebuild_checkin
+from app.models import DeltaCheckin
+from app.records import CheckinRecord
+from app.db import (
+    DBSettings,
+    close_pool,
+    configure,
+    db_path,
+    init_db,
+    get_devices_latest,
+    get_device_detail,
+    get_device_history,
+    get_fleet_version,
+    resolve_fields,
+)
+from app.events import broker
+from app.export import EXPORT_FORMATS, MEDIA_TYPES, ExportFilter, export_columns, iter_export
+from app.health_rules import reload_rules
+from app.reclassify import reclassify_status, start_reclassify_job
+from app.ingest import prepare_checkin, recent_result, reset_ingest_caches, store_checkins
+from app.liveness import LivenessSettings, get_liveness, start_liveness, stop_liveness
+from app.retention import RetentionPolicy, start_retention_scheduler
+from app.rollups import SERIES_METRICS, get_series
+from app.summary import fleet_summary
+from app.trends import trend_store
+from app.jsonfast import dumps_compact, loads
+from app.timeutil import to_epoch_ms, utc_now_ms
+from app.writer import INGEST_MODES, WriterSettings, get_writer, start_writer, stop_writer
 
 
 # -------------------------
@@ -17,6 +51,24 @@ from app.health_rules import classify
 # -------------------------
 API_KEY = "dev-secret-key"
 
+# Upper bound on entries accepted by /api/checkins/batch
+MAX_BATCH_SIZE = 1000
+
+# Point budget bounds for /api/series
+DEFAULT_SERIES_POINTS = 300
+MAX_SERIES_POINTS = 2000
+
+# SSE comment sent on idle streams so proxies don't close them
+STREAM_HEARTBEAT_S = 15
+
+# sync: write before answering; async: queue and answer 202 (app/writer.py)
+INGEST_MODE = os.environ.get("DASHBOARD_INGEST_MODE", "sync")
+if INGEST_MODE not in INGEST_MODES:
+    raise ValueError(f"DASHBOARD_INGEST_MODE must be one of {INGEST_MODES}")
+
+# Retry-After (seconds) sent with 429 when the ingest queue is full
+QUEUE_FULL_RETRY_AFTER_S = 5
+
 # schema.sql lives in project root
 SCHEMA_PATH = Path(__file__).resolve().parent.parent / "schema.sql"
 
@@ -27,10 +79,105 @@ DEVICE_PAGE_PATH = Path(__file__).resolve().parent.parent / "static" / "device.h
 DASHBOARD_PATH = Path (__file__).resolve().parent.parent / "static" / "dashboard.html"
 
 
+# -------------------------
+# Metrics (GET /metrics)
+# -------------------------
+def _db_file_sizes() -> Dict[Any, Optional[float]]:
+    path = str(db_path())
+    return {("db",): metrics.file_size(path), ("wal",): metrics.file_size(path + "-wal")}
+
+
+def _writer_gauge(key: str):
+    def read() -> Dict[Any, Optional[float]]:
+        writer = get_writer()
+        return {(): writer.stats()[key]} if writer is not None else {}
+    return read
+
+
+metrics.register(metrics.CallbackMetric(
+    "dashboard_db_file_bytes", "Size of the SQLite database and WAL files.", _db_file_sizes, ("file",),
+))
+metrics.register(metrics.CallbackMetric(
+    "dashboard_ingest_queue_depth", "Check-ins waiting for the writer (async ingest).",
+    _writer_gauge("queue_depth"),
+))
+metrics.register(metrics.CallbackMetric(
+    "dashboard_ingest_queue_lag_seconds", "Age of the oldest queued check-in (async ingest).",
+    _writer_gauge("lag_s"),
+))
+metrics.register(metrics.CallbackMetric(
+    "dashboard_ingest_rejected_total", "Check-ins refused with 429 because the queue was full.",
+    _writer_gauge("rejected_full"), kind="counter",
+))
+metrics.register(metrics.CallbackMetric(
+    "dashboard_devices_not_reporting", "Devices currently marked stale / offline.",
+    lambda: {(k,): v for k, v in get_liveness().stats().items() if k in ("stale", "offline")}, ("state",),
+))
+metrics.register(metrics.CallbackMetric(
+    "dashboard_stream_subscribers", "Connected live-stream clients.",
+    lambda: {(): broker.subscriber_count()},
+))
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Route template (not the raw path) keeps label cardinality bounded
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        metrics.http_requests.inc(method=request.method, route=route, status=status)
+        metrics.http_duration.observe(time.perf_counter() - start, method=request.method, route=route)
+
+
 @app.on_event("startup")
 def startup() -> None:
+    # Connection pool / pragmas come from DASHBOARD_DB_* env vars
+    configure(DBSettings.from_env())
     # Initialize SQLite database and tables
     init_db(SCHEMA_PATH)
+    # Retry / delta caches from a previous database must not answer for this one
+    reset_ingest_caches()
+
+    # Compile health_rules.json now so a broken file fails startup
+    reload_rules()
+
+    # Trend rings are rebuilt from the device rollups, summary counters
+    # from device_latest
+    trend_store.seed_from_rollups()
+    fleet_summary.seed()
+
+    # Stale / offline tracking, seeded from device_latest
+    start_liveness(LivenessSettings.from_env())
+
+    # Status alerts; off unless a DASHBOARD_ALERT_* sink is configured
+    start_alerts(AlertSettings.from_env())
+
+    if INGEST_MODE == "async":
+        start_writer(WriterSettings.from_env())
+
+    # Optional background retention (DASHBOARD_RETENTION_INTERVAL_H > 0)
+    interval_h = float(os.environ.get("DASHBOARD_RETENTION_INTERVAL_H", "0"))
+    if interval_h > 0:
+        app.state.retention_stop = start_retention_scheduler(
+            RetentionPolicy.from_env(), interval_h * 3600
+        )
+
+
+@app.on_event("shutdown")
+def shutdown() -> None:
+    stop = getattr(app.state, "retention_stop", None)
+    if stop is not None:
+        stop.set()
+    # Write queued check-ins before the pool goes away
+    stop_writer()
+    stop_liveness()
+    stop_alerts()
+    close_pool()
 
 
 def require_api_key(x_api_key: Optional[str]) -> None:
@@ -38,10 +185,69 @@ def require_api_key(x_api_key: Optional[str]) -> None:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
 
+def body_validation_error(e: ValidationError, *loc: str) -> RequestValidationError:
+    """A 422 for a body validated by hand, with the same error shape as FastAPI's."""
+    return RequestValidationError(
+        [{**err, "loc": ("body", *loc, *err["loc"])} for err in e.errors(include_url=False)]
+    )
+
+
+def json_decode_error(e: ValueError) -> RequestValidationError:
+    return RequestValidationError(
+        [{"type": "json_invalid", "loc": ("body", 0), "msg": "JSON decode error", "input": {}, "ctx": {"error": str(e)}}]
+    )
+
+
+async def ingest_one(record: CheckinRecord, response: Response) -> Dict[str, Any]:
+    """Store (or, in async mode, queue with a 202) one decoded check-in."""
+    if get_writer() is not None:
+        result = enqueue_checkins([record])[0]
+        if result.get("queued"):
+            response.status_code = 202
+        return {"ok": True, **result}
+
+    # Device upsert + check-in insert share one transaction
+    result = (await run_in_threadpool(store_checkins, [record]))[0]
+
+    return {"ok": True, **result}
+
+
+def enqueue_checkins(records: List[CheckinRecord]) -> List[Dict[str, Any]]:
+    """
+    Async ingest: classify now, queue for the writer thread.
+    Recently stored check-ins (retries) are answered from the stored result
+    and not queued; the writer drops any other duplicate at write time.
+    Raises 429 (nothing queued) when the queue has no room for all of them.
+    """
+    results: List[Optional[Dict[str, Any]]] = [recent_result(r) for r in records]
+    todo = [i for i, res in enumerate(results) if res is None]
+    if not todo:
+        return results  # type: ignore[return-value]
+
+    fresh = [records[i] for i in todo]
+    prepared = [prepare_checkin(r) for r in fresh]
+    acks = get_writer().submit([(r, device) for r, (device, _) in zip(fresh, prepared)])
+    if acks is None:
+        raise HTTPException(
+            status_code=429,
+            detail="Ingest queue full, retry later",
+            headers={"Retry-After": str(QUEUE_FULL_RETRY_AFTER_S)},
+        )
+    for i, ack, r, (_, reasons) in zip(todo, acks, fresh, prepared):
+        results[i] = {"queued": True, "ack_id": ack, "computed_status": r.computed_status, "reasons": reasons}
+    return results  # type: ignore[return-value]
+
+
 @app.get("/health")
 def health() -> dict:
     return {"ok": True}
 
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics() -> PlainTextResponse:
+    """Prometheus text format; unauthenticated like /health."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 def root():
     return RedirectResponse(url="/dashboard")
@@ -55,105 +261,396 @@ def device_page():
     return FileResponse(DEVICE_PAGE_PATH)
 
 @app.post("/api/checkin")
-def post_checkin(payload: CheckinPayload, x_api_key: Optional[str] = Header(default=None)) -> dict:
+async def post_checkin(
+    request: Request,
+    response: Response,
+    x_api_key: Optional[str] = Header(default=None),
+) -> dict:
+    """
+    Body: a CheckinPayload (app/models.py) as JSON.
+    """
     require_api_key(x_api_key)
 
-    d = payload.model_dump()
-    device_id = d["device_id"]
-    ts = d["timestamp_utc"]
-    m = d["metrics"]
-
-    # Flatten payload into DB row that matches schema.sql columns
-    row = {
-        "device_id": device_id,
-        "timestamp_utc": ts,
-        "agent_version": d["agent_version"],
-
-        # Availability
-        "last_boot_utc": m["availability"]["last_boot_utc"],
-        "uptime_seconds": m["availability"]["uptime_seconds"],
-
-        # Stability
-        "unexpected_shutdowns": m["stability"]["unexpected_shutdowns"],
-        "app_crashes": m["stability"]["app_crashes"],
-        "service_restarts": m["stability"]["service_restarts"],
-        "hang_indicators": m["stability"].get("hang_indicators"),
-
-        # Storage
-        "disk_c_free_gb": m["storage"]["disk_c_free_gb"],
-        "disk_c_free_pct": m["storage"]["disk_c_free_pct"],
-        "disk_errors": m["storage"].get("disk_errors"),
-        "profile_errors": m["storage"].get("profile_errors"),
-
-        # Security
-        "av_enabled": 1 if m["security"]["av_enabled"] else 0,
-        "av_sig_age_days": m["security"]["av_sig_age_days"],
-        "pending_reboot": 1 if m["security"]["pending_reboot"] else 0,
-        "update_failures": m["security"].get("update_failures"),
-
-        # Network
-        "dns_ok": 1 if m["network"]["dns_ok"] else 0,
-        "gateway_ok": 1 if m["network"]["gateway_ok"] else 0,
-        "backend_reachable": None
-        if m["network"].get("backend_reachable") is None
-        else (1 if m["network"]["backend_reachable"] else 0),
-        "network_resets": m["network"].get("network_resets"),
-
-        # MyPC
-        "mypc_client_running": None
-        if m["mypc"].get("client_running") is None
-        else (1 if m["mypc"]["client_running"] else 0),
-
-        "mypc_auth_attempts": m["mypc"]["auth"]["attempts"],
-        "mypc_auth_successes": m["mypc"]["auth"]["successes"],
-        "mypc_auth_failures": m["mypc"]["auth"]["failures"],
-        "mypc_auth_failures_by_reason_json": json.dumps(
-            m["mypc"]["auth"]["failures_by_reason"], ensure_ascii=False
-        ),
-
-        "mypc_service_connect_failures": m["mypc"]["connectivity"]["service_connect_failures"],
-        "mypc_time_to_service_ready_s": m["mypc"]["connectivity"].get("time_to_service_ready_s"),
-        "mypc_last_error_category": m["mypc"]["connectivity"].get("last_error_category"),
-
-        "mypc_avg_auth_ms": m["mypc"]["login_perf"].get("avg_auth_ms"),
-        "mypc_p95_auth_ms": m["mypc"]["login_perf"].get("p95_auth_ms"),
-        "mypc_slow_login_count": m["mypc"]["login_perf"].get("slow_login_count"),
-
-        # Optional raw payload (NO PII!)
-        "raw_json": json.dumps(d, ensure_ascii=False),
-    }
+    # Decoded straight into a flat row (app/decode.py); same 422s as before
+    body = await request.body()
+    try:
+        with metrics.stage("decode"):
+            record = decode_checkin_body(body)
+    except ValidationError as e:
+        raise body_validation_error(e)
+    except ValueError as e:
+        raise json_decode_error(e)
+
+    return await ingest_one(record, response)
+
+
+@app.post("/api/checkin/delta")
+async def post_checkin_delta(
+    request: Request,
+    response: Response,
+    x_api_key: Optional[str] = Header(default=None),
+) -> dict:
+    """
+    Body: a DeltaCheckin (app/models.py): a full payload, or a merge patch
+    against the device's last acknowledged seq (app/delta.py).
+    409 asks the agent to resend the check-in in full.
+    """
+    require_api_key(x_api_key)
 
-    computed_status, reasons = classify(row)
-    row["computed_status"] = computed_status
-    row["computed_reasons_json"] = json.dumps(reasons, ensure_ascii=False)
-
-    # Update devices table (first_seen_utc passed but only used on insert)
-    upsert_device(
-        device_id=device_id,
-        location_tag=d.get("location_tag"),
-        ip=d.get("ip_address"),
-        first_seen_utc=ts,
-        last_seen_utc=ts,
-    )
+    body = await request.body()
+    try:
+        with metrics.stage("decode"):
+            msg = DeltaCheckin.model_validate(loads(body))
+    except ValidationError as e:
+        raise body_validation_error(e)
+    except ValueError as e:
+        raise json_decode_error(e)
+
+    try:
+        with metrics.stage("delta"):
+            record, kind, state = rebuild_checkin(msg)
+    except DeltaResync as e:
+        metrics.delta_checkins.inc(kind="resync")
+        metrics.delta_body_bytes.inc(len(body), kind="resync")
+        raise HTTPException(status_code=409, detail={"resync": True, "seq": e.seq})
+    except StaleDelta as e:
+        raise RequestValidationError(
+            [{"type": "value_error", "loc": ("body", "checkin", "timestamp_utc"), "msg": str(e), "input": e.timestamp_utc}]
+        )
+    except ValidationError as e:
+        raise body_validation_error(e, "checkin")
+    metrics.delta_checkins.inc(kind=kind)
+    metrics.delta_body_bytes.inc(len(body), kind=kind)
+
+    result = await ingest_one(record, response)
+    # Only a check-in that was stored, or queued, becomes the base for the
+    # next delta; the writer forgets the state again if it drops the check-in
+    commit_state(msg, record, state)
+    return {"seq": msg.seq, **result}
+
+
+@app.post("/api/checkins/batch")
+def post_checkins_batch(
+    response: Response,
+    payloads: List[Dict[str, Any]] = Body(...),
+    x_api_key: Optional[str] = Header(default=None),
+) -> dict:
+    """
+    Ingest many check-ins (relay agents / site collectors) in one round trip.
+    Every entry is validated on its own; valid entries are written with a
+    single group commit, invalid ones are reported back per item.
+    """
+    require_api_key(x_api_key)
+
+    if len(payloads) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {MAX_BATCH_SIZE})")
+
+    results: List[Dict[str, Any]] = [{} for _ in payloads]
+    valid: List[CheckinRecord] = []
+    valid_idx: List[int] = []
+
+    for i, item in enumerate(payloads):
+        try:
+            with metrics.stage("decode"):
+                valid.append(decode_checkin(item))
+            valid_idx.append(i)
+        except ValidationError as e:
+            results[i] = {"ok": False, "error": json.loads(e.json(include_url=False))}
+
+    if get_writer() is not None:
+        response.status_code = 202
+        stored_results = enqueue_checkins(valid)
+    else:
+        stored_results = store_checkins(valid)
 
-    checkin_id = insert_checkin(row)
+    for i, stored in zip(valid_idx, stored_results):
+        results[i] = {"ok": True, **stored}
 
     return {
         "ok": True,
-        "checkin_id": checkin_id,
-        "computed_status": computed_status,
-        "reasons": reasons,
+        "accepted": len(valid),
+        "rejected": len(payloads) - len(valid),
+        "results": results,
     }
 
 
+@app.get("/api/ingest/stats")
+def ingest_stats(x_api_key: Optional[str] = Header(default=None)) -> dict:
+    """Ingest mode plus writer queue depth / lag in async mode."""
+    require_api_key(x_api_key)
+    writer = get_writer()
+    return {"mode": INGEST_MODE, **(writer.stats() if writer is not None else {})}
+
+
+def parse_fields(fields: Optional[str]):
+    try:
+        return resolve_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def fleet_etag(version: int) -> str:
+    return f'W/"fleet-{version}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [t.strip() for t in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
 @app.get("/api/devices")
-def list_devices(x_api_key: Optional[str] = Header(default=None)) -> dict:
+def list_devices(
+    since: Optional[int] = None,
+    fields: Optional[str] = None,
+    x_api_key: Optional[str] = Header(default=None),
+    if_none_match: Optional[str] = Header(default=None),
+):
+    """
+    Latest state per device.
+
+    - ETag is the fleet version; a matching If-None-Match gets an empty 304.
+    - since=<version> returns only devices that changed after that version
+      (full list if the version is unknown, e.g. after a DB reset).
+    - fields=a,b,c picks columns ("all" for everything but raw_json);
+      the default is the compact set the dashboard renders.
+    - liveness is null, "stale" or "offline" (missed check-ins, see
+      app/liveness.py); offline devices sort first.
+    - trend holds 1h / 24h disk deltas and slopes, projected days until the
+      disk is full and auth failure rates (app/trends.py).
+    """
     require_api_key(x_api_key)
-    return {"devices": get_devices_latest()}
+    columns = parse_fields(fields)
+
+    # Cheap single-row read answers the common "nothing changed" poll
+    current = get_fleet_version()
+    if etag_matches(if_none_match, fleet_etag(current)):
+        return Response(status_code=304, headers={"ETag": fleet_etag(current)})
+
+    full = since is None or since > current
+    version, devices = get_devices_latest(since=None if full else since, fields=columns)
+    with metrics.stage("fleet_trends"):
+        trend_store.attach(devices)
+
+    with metrics.stage("fleet_serialize"):
+        body = dumps_compact({"version": version, "full": full, "devices": devices})
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={"ETag": fleet_etag(version), "Cache-Control": "no-cache"},
+    )
+
+
+@app.get("/api/fleet/summary")
+def fleet_summary_view(x_api_key: Optional[str] = Header(default=None)) -> dict:
+    """
+    Status counts, top health reasons, MyPC auth failures by reason and
+    p95 auth time / disk free quantiles, for the fleet and per location_tag.
+    Served from incrementally maintained counters (app/summary.py).
+    """
+    require_api_key(x_api_key)
+    return fleet_summary.to_dict()
+
+
+@app.get("/api/alerts")
+def alerts_view(x_api_key: Optional[str] = Header(default=None)) -> dict:
+    """
+    Devices alerting per location_tag, flapping count and per-sink
+    delivery stats (app/alerts.py).
+    """
+    require_api_key(x_api_key)
+    engine = get_alerts()
+    if engine is None:
+        return {"enabled": False}
+    return {"enabled": True, **engine.stats()}
 
 
 @app.get("/api/devices/{device_id}")
-def device_detail(device_id: str, limit: int = 20, x_api_key: Optional[str] = Header(default=None)) -> dict:
+def device_detail(
+    device_id: str,
+    limit: int = 20,
+    fields: Optional[str] = None,
+    x_api_key: Optional[str] = Header(default=None),
+) -> dict:
+    require_api_key(x_api_key)
+    detail = get_device_detail(device_id, limit=limit, fields=parse_fields(fields))
+    return {**detail, "trend": trend_store.get(device_id)}
+
+
+@app.get("/api/devices/{device_id}/history")
+def device_history(
+    device_id: str,
+    from_: Optional[str] = Query(default=None, alias="from"),
+    to: Optional[str] = None,
+    cursor: Optional[str] = None,
+    page_size: int = Query(default=50, ge=1),
+    fields: Optional[str] = None,
+    x_api_key: Optional[str] = Header(default=None),
+) -> dict:
+    """
+    Page backwards through a device's check-ins (newest first).
+    Pass next_cursor from the previous page as cursor=; page_size is capped.
+    """
+    require_api_key(x_api_key)
+    try:
+        return get_device_history(
+            device_id,
+            ts_from=from_,
+            ts_to=to,
+            cursor=cursor,
+            page_size=page_size,
+            fields=parse_fields(fields),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/export")
+def export_checkins(
+    format: str = "csv",
+    from_: Optional[str] = Query(default=None, alias="from"),
+    to: Optional[str] = None,
+    device_id: List[str] = Query(default=[]),
+    location: Optional[str] = None,
+    status: List[str] = Query(default=[]),
+    fields: Optional[str] = None,
+    x_api_key: Optional[str] = Header(default=None),
+) -> StreamingResponse:
+    """
+    Stream check-in history, oldest first, as CSV or NDJSON.
+
+    from/to: ISO timestamps (inclusive); device_id and status may repeat;
+    location matches the device's location_tag. fields= picks columns as
+    for /api/devices (default: everything but raw_json). Rows are read in
+    pages and sent in chunks, so memory use doesn't grow with the export.
+    """
     require_api_key(x_api_key)
-    return get_device_detail(device_id, limit=limit)
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {EXPORT_FORMATS}")
+    flt = ExportFilter(
+        ts_from=from_,
+        ts_to=to,
+        device_ids=device_id,
+        location=location,
+        statuses=status,
+    )
+    try:
+        flt.validate()
+        columns = export_columns(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # A sync iterator: Starlette pulls it on the threadpool, off the event loop
+    return StreamingResponse(
+        iter_export(flt, format, columns),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="checkins.{format}"'},
+    )
+
+
+@app.get("/api/series")
+def series(
+    key: str,
+    scope: str = "device",
+    metric: str = "disk_c_free_pct",
+    from_: Optional[str] = Query(default=None, alias="from"),
+    to: Optional[str] = None,
+    points: int = Query(default=DEFAULT_SERIES_POINTS, ge=1),
+    x_api_key: Optional[str] = Header(default=None),
+) -> dict:
+    """
+    Downsampled metric series for charts, served from rollups.
+
+    scope: device | location (key = device_id / location_tag)
+    metric: disk_c_free_pct | auth_fail_rate | mypc_p95_auth_ms | status
+    from/to: ISO timestamps (default: last 24 hours)
+    points: point budget; picks the finest bucket (5m/1h/1d) that fits.
+    """
+    require_api_key(x_api_key)
+
+    if scope not in ("device", "location"):
+        raise HTTPException(status_code=400, detail="scope must be 'device' or 'location'")
+    if metric != "status" and metric not in SERIES_METRICS:
+        raise HTTPException(status_code=400, detail=f"Unknown metric: {metric}")
+
+    try:
+        to_ms = to_epoch_ms(to) if to else utc_now_ms()
+        from_ms = to_epoch_ms(from_) if from_ else to_ms - 24 * 3600 * 1000
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid timestamp: {e}")
+
+    return get_series(scope, key, metric, from_ms, to_ms, min(points, MAX_SERIES_POINTS))
+
 
+@app.post("/api/admin/rules/reload")
+def admin_reload_rules(x_api_key: Optional[str] = Header(default=None)) -> dict:
+    """
+    Recompile health_rules.json now (it is also picked up automatically
+    within a few seconds of being edited).
+    """
+    require_api_key(x_api_key)
+    try:
+        reload_rules()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Rules not reloaded: {e}")
+    return {"ok": True}
+
+
+@app.post("/api/admin/reclassify", status_code=202)
+def admin_reclassify(
+    restart: bool = False,
+    x_api_key: Optional[str] = Header(default=None),
+) -> dict:
+    """
+    Re-run the current health rules over stored check-ins in the background.
+    Poll GET /api/admin/reclassify for progress.
+    """
+    require_api_key(x_api_key)
+    if not start_reclassify_job(resume=not restart):
+        raise HTTPException(status_code=409, detail="Reclassification already running")
+    return reclassify_status()
+
+
+@app.get("/api/admin/reclassify")
+def admin_reclassify_status(x_api_key: Optional[str] = Header(default=None)) -> dict:
+    require_api_key(x_api_key)
+    return reclassify_status()
+
+
+@app.get("/api/stream/devices")
+async def stream_devices(
+    api_key: Optional[str] = None,
+    x_api_key: Optional[str] = Header(default=None),
+) -> StreamingResponse:
+    """
+    Server-Sent Events: one 'device' event (latest row as JSON) whenever a
+    check-in changes a device's status, reasons or key metrics.
+
+    EventSource can't send headers, so the key may be passed as ?api_key=.
+    """
+    require_api_key(x_api_key or api_key)
+
+    queue = broker.subscribe()
+
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=STREAM_HEARTBEAT_S)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    # Subscriber fell behind and was dropped; client reconnects
+                    break
+                yield f"event: device\ndata: {event}\n\n"
+        finally:
+            broker.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,282 @@
+"""
+In-process metrics in the Prometheus text exposition format (GET /metrics).
+
+Small self-contained counters/histograms rather than a client library:
+everything is aggregated in memory and rendered on scrape. Timing hooks
+are cheap (two perf_counter calls and a locked bucket increment).
+"""
+from __future__ import annotations
+
+import bisect
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+# Seconds; covers sub-millisecond stages up to slow commits
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+ROW_COUNT_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return repr(v)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[Any, ...]:
+        return tuple(labels[n] for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        # Unlabelled counters start at 0 so they appear before the first inc
+        self._values: Dict[Tuple[Any, ...], float] = {} if self.labelnames else {(): 0}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in sorted(items)]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        # key -> [per-bucket counts (last = +Inf), sum]
+        self._values: Dict[Tuple[Any, ...], List[Any]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    def time(self, **labels: Any) -> "_Timer":
+        """with hist.time(stage="x"): ... observes the block's duration."""
+        return _Timer(self, labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v[0]), v[1]) for k, v in self._values.items()]
+        out: List[str] = []
+        for key, counts, total in sorted(items, key=lambda x: x[0]):
+            running = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                running += n
+                le = 'le="' + _fmt(bound) + '"'
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {running}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(total)}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, key)} {running}")
+        return out
+
+
+class _Timer:
+    __slots__ = ("_hist", "_labels", "_start")
+
+    def __init__(self, hist: Histogram, labels: Dict[str, Any]) -> None:
+        self._hist = hist
+        self._labels = labels
+
+    def __enter__(self) -> "_Timer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._hist.observe(time.perf_counter() - self._start, **self._labels)
+
+
+class CallbackMetric(_Metric):
+    """
+    Values read at scrape time: fn() returns {label values tuple: value}
+    (use () as the key for an unlabelled metric).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        fn: Callable[[], Dict[Tuple[Any, ...], float]],
+        labelnames: Sequence[str] = (),
+        kind: str = "gauge",
+    ) -> None:
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self._fn = fn
+
+    def samples(self) -> List[str]:
+        try:
+            values = self._fn()
+        except Exception:
+            return []
+        return [
+            f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}"
+            for k, v in sorted(values.items())
+            if v is not None
+        ]
+
+
+# -------------------------
+# Registry
+# -------------------------
+_registry: Dict[str, _Metric] = {}
+_registry_lock = threading.Lock()
+
+
+def register(metric: _Metric) -> _Metric:
+    """Add (or replace, e.g. on app restart in tests) a metric by name."""
+    with _registry_lock:
+        _registry[metric.name] = metric
+    return metric
+
+
+def render() -> str:
+    with _registry_lock:
+        metrics: Iterable[_Metric] = list(_registry.values())
+    lines: List[str] = []
+    for m in metrics:
+        lines += m.header()
+        lines += m.samples()
+    return "\n".join(lines) + "\n"
+
+
+# -------------------------
+# Core metrics
+# -------------------------
+http_requests = register(Counter(
+    "dashboard_http_requests_total",
+    "HTTP requests by route and status code.",
+    ("method", "route", "status"),
+))
+
+http_duration = register(Histogram(
+    "dashboard_http_request_duration_seconds",
+    "HTTP request latency by route.",
+    ("method", "route"),
+))
+
+stage_duration = register(Histogram(
+    "dashboard_stage_duration_seconds",
+    "Time spent in internal stages of the ingest and read paths.",
+    ("stage",),
+))
+
+fleet_rows = register(Histogram(
+    "dashboard_fleet_rows",
+    "Devices returned per /api/devices response.",
+    buckets=ROW_COUNT_BUCKETS,
+))
+
+sqlite_busy = register(Counter(
+    "dashboard_sqlite_busy_errors_total",
+    "Operations that failed with SQLITE_BUSY / database is locked.",
+))
+
+duplicate_checkins = register(Counter(
+    "dashboard_duplicate_checkins_total",
+    "Check-ins already stored (agent retries), by where they were caught.",
+    ("source",),
+))
+
+delta_checkins = register(Counter(
+    "dashboard_delta_checkins_total",
+    "Check-ins on /api/checkin/delta by kind (full, delta, retry, resync).",
+    ("kind",),
+))
+
+delta_body_bytes = register(Counter(
+    "dashboard_delta_body_bytes_total",
+    "Request body bytes received on /api/checkin/delta by kind.",
+    ("kind",),
+))
+
+alert_notifications = register(Counter(
+    "dashboard_alert_notifications_total",
+    "Alert notification delivery attempts by sink and result (sent, retry, failed).",
+    ("sink", "result"),
+))
+
+lock_wait = register(Histogram(
+    "dashboard_sqlite_write_lock_wait_seconds",
+    "Time waiting for the write lock (BEGIN IMMEDIATE).",
+))
+
+pool_wait = register(Histogram(
+    "dashboard_db_pool_wait_seconds",
+    "Time waiting for a pooled connection.",
+))
+
+
+def stage(name: str) -> _Timer:
+    """with stage("classify"): ... -- records into dashboard_stage_duration_seconds."""
+    return _Timer(stage_duration, {"stage": name})
+
+
+def is_busy_error(e: BaseException) -> bool:
+    msg = str(e)
+    return "locked" in msg or "busy" in msg
+
+
+def count_busy(e: BaseException) -> None:
+    if is_busy_error(e):
+        sqlite_busy.inc()
+
+
+def file_size(path: str) -> Optional[float]:
+    try:
+        return float(os.path.getsize(path))
+    except OSError:
+        return None
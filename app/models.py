@@ -1,7 +1,15 @@
 from __future__ import annotations
 
-from typing import Dict, Optional
-from pydantic import BaseModel, Field
+from typing import Any, Dict, Optional
+from pydantic import BaseModel, Field, field_validator, model_validator
+
+from app.timeutil import parse_utc
+
+
+def _iso_timestamp(value: str) -> str:
+    # Stored as epoch ms, so it has to parse (app/decode.py converts it)
+    parse_utc(value)
+    return value
 
 
 # -------------------------
@@ -11,6 +19,8 @@ class Availability(BaseModel):
     last_boot_utc: str
     uptime_seconds: int = Field(ge=0)
 
+    _check_last_boot = field_validator("last_boot_utc")(_iso_timestamp)
+
 
 # -------------------------
 # System stability
@@ -113,3 +123,23 @@ class CheckinPayload(BaseModel):
     location_tag: Optional[str] = None
     metrics: Metrics
 
+    _check_timestamp = field_validator("timestamp_utc")(_iso_timestamp)
+
+
+
+# -------------------------
+# Delta check-in (app/delta.py)
+# -------------------------
+class DeltaCheckin(BaseModel):
+    device_id: str
+    seq: int = Field(ge=0)
+    # None: checkin is a full CheckinPayload; otherwise a merge patch
+    # against the check-in acknowledged with this seq
+    base_seq: Optional[int] = Field(default=None, ge=0)
+    checkin: Dict[str, Any]
+
+    @model_validator(mode="after")
+    def _check_seq(self) -> "DeltaCheckin":
+        if self.base_seq is not None and self.seq <= self.base_seq:
+            raise ValueError("seq must be greater than base_seq")
+        return self
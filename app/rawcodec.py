@@ -0,0 +1,111 @@
+"""
+Storage format for checkins.raw_json.
+
+Modes (DASHBOARD_RAW_PAYLOAD):
+  zlib  - compact JSON deflated with a shared preset dictionary (default)
+  json  - plain JSON text, as older versions stored it
+  off   - don't store the raw payload at all
+
+Reads are transparent: decode_raw() accepts any stored form.
+"""
+from __future__ import annotations
+
+import json
+import os
+import zlib
+from typing import Any, Dict, Optional, Union
+
+from app.jsonfast import dumps_compact
+
+
+RAW_MODES = ("zlib", "json", "off")
+
+# 2-byte header on compressed values; the digit is the dictionary version
+_ZLIB_V1 = b"Z1"
+
+# Preset dictionary: the key names and common values of a check-in payload.
+# Compressed rows depend on these exact bytes -- never edit this, add a
+# version 2 instead.
+_ZDICT_V1 = json.dumps(
+    {
+        "device_id": "PUBPC-",
+        "timestamp_utc": "T00:00:00.000000+00:00",
+        "agent_version": "0.1.0",
+        "ip_address": "10.0.",
+        "location_tag": "Area",
+        "metrics": {
+            "availability": {"last_boot_utc": "T00:00:00.000000+00:00", "uptime_seconds": 0},
+            "stability": {
+                "unexpected_shutdowns": 0,
+                "app_crashes": 0,
+                "service_restarts": 0,
+                "hang_indicators": None,
+            },
+            "storage": {
+                "disk_c_free_gb": 0.0,
+                "disk_c_free_pct": 0.0,
+                "disk_errors": None,
+                "profile_errors": None,
+            },
+            "security": {
+                "av_enabled": True,
+                "av_sig_age_days": 0,
+                "pending_reboot": False,
+                "update_failures": None,
+            },
+            "network": {
+                "dns_ok": True,
+                "gateway_ok": True,
+                "backend_reachable": True,
+                "network_resets": None,
+            },
+            "mypc": {
+                "client_running": True,
+                "auth": {
+                    "attempts": 0,
+                    "successes": 0,
+                    "failures": 0,
+                    "failures_by_reason": {"invalid_credentials": 0, "timeout": 0},
+                },
+                "connectivity": {
+                    "service_connect_failures": 0,
+                    "time_to_service_ready_s": None,
+                    "last_error_category": None,
+                },
+                "login_perf": {"avg_auth_ms": None, "p95_auth_ms": None, "slow_login_count": None},
+            },
+        },
+    },
+    separators=(",", ":"),
+).encode("utf-8")
+
+RAW_MODE = os.environ.get("DASHBOARD_RAW_PAYLOAD", "zlib")
+if RAW_MODE not in RAW_MODES:
+    raise ValueError(f"DASHBOARD_RAW_PAYLOAD must be one of {RAW_MODES}")
+
+
+def compress_json(text: Union[str, bytes]) -> bytes:
+    if isinstance(text, str):
+        text = text.encode("utf-8")
+    c = zlib.compressobj(level=6, zdict=_ZDICT_V1)
+    return _ZLIB_V1 + c.compress(text) + c.flush()
+
+
+def encode_raw(d: Dict[str, Any], mode: Optional[str] = None) -> Union[str, bytes, None]:
+    """Stored value for a validated payload dict under the given/configured mode."""
+    mode = mode or RAW_MODE
+    if mode == "off":
+        return None
+    if mode == "json":
+        return json.dumps(d, ensure_ascii=False)
+    return compress_json(dumps_compact(d))
+
+
+def decode_raw(value: Union[str, bytes, None]) -> Optional[str]:
+    """JSON text for any stored raw_json value (None stays None)."""
+    if value is None or isinstance(value, str):
+        return value
+    if value[:2] == _ZLIB_V1:
+        d = zlib.decompressobj(zdict=_ZDICT_V1)
+        return (d.decompress(value[2:]) + d.flush()).decode("utf-8")
+    raise ValueError("Unknown raw_json encoding")
@@ -0,0 +1,209 @@
+"""
+Re-run the health rules over stored check-ins.
+
+Stored computed_status / computed_reasons_json reflect the rules in force
+when each check-in arrived. After editing health_rules.json, run
+
+  python -m app.cli reclassify
+
+(or POST /api/admin/reclassify) to bring history, device_latest and the
+status counts in rollups in line with the current rules.
+"""
+from __future__ import annotations
+
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from app.db import (
+    _bump_fleet_version,
+    connection,
+    get_fleet_version,
+    get_meta,
+    latest_rows_for,
+    set_meta,
+)
+from app.events import broker
+from app.health_rules import rules_snapshot, severity_sql
+from app.records import CheckinRecord
+from app.rollups import move_status_counts
+from app.summary import fleet_summary
+from app.timeutil import from_epoch_ms, utc_now_ms
+
+
+# meta key holding the checkpoint of an unfinished run
+_CHECKPOINT_KEY = "reclassify_last_id"
+
+# device_latest rows whose check-in was just rewritten (ids as a JSON array)
+_REFRESH_LATEST_SQL = f"""
+UPDATE device_latest
+SET computed_status = c.computed_status,
+    severity = {severity_sql("c.computed_status", "device_latest.liveness")},
+    version = ?
+FROM checkins c
+WHERE c.id = device_latest.checkin_id
+  AND c.id IN (SELECT value FROM json_each(?))
+RETURNING device_latest.checkin_id
+"""
+
+
+def reclassify_checkins(
+    chunk_size: int = 20000,
+    resume: bool = True,
+    rollups: bool = True,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Re-evaluate every check-in against the current rules, in id order.
+
+    Each chunk is one short write transaction that rewrites only the rows
+    whose result changed, refreshes the device_latest rows pointing at them
+    and records a checkpoint, so an interrupted run continues where it left
+    off (resume=False starts over). The same transaction moves the changed
+    rows between the green/yellow/red counts of their rollup buckets
+    (rollups=False to leave rollups alone); nothing is recounted from raw
+    rows, so history older than the retention cutoff is kept.
+
+    Returns a report dict; progress gets the running report after each chunk.
+    """
+    # One version of the rules for the whole run, even if the file is
+    # reloaded meanwhile: the SELECT below only reads its columns
+    columns, classifier_for = rules_snapshot()
+    select = ", ".join(f"c.{col}" for col in columns)
+    report: Dict[str, Any] = {
+        "rows_scanned": 0,
+        "rows_changed": 0,
+        "devices_refreshed": 0,
+        "rollup_buckets_updated": 0,
+        "resumed_from_id": 0,
+    }
+    started = time.monotonic()
+
+    with connection() as conn:
+        last_id = (get_meta(conn, _CHECKPOINT_KEY) if resume else None) or 0
+        report["resumed_from_id"] = last_id
+        # Rows ingested after this point are classified with the new rules already
+        max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM checkins").fetchone()[0]
+        report["max_id"] = max_id
+
+        while last_id < max_id:
+            rows = conn.execute(
+                f"""
+                SELECT c.id, c.timestamp_utc, c.computed_status, c.computed_reasons_json,
+                       c.device_id, d.location_tag, {select}
+                FROM checkins c
+                LEFT JOIN devices d ON d.device_id = c.device_id
+                WHERE c.id > ? AND c.id <= ?
+                ORDER BY c.id
+                LIMIT ?
+                """,
+                (last_id, max_id, chunk_size),
+            ).fetchall()
+            if not rows:
+                break
+
+            evaluators: Dict[Optional[str], Any] = {}
+            updates: List[tuple] = []
+            moved: List[tuple] = []
+            for r in rows:
+                location = r[5]
+                fn = evaluators.get(location)
+                if fn is None:
+                    fn = evaluators[location] = classifier_for(location)
+                rec = CheckinRecord()
+                for col, value in zip(columns, r[6:]):
+                    setattr(rec, col, value)
+                status, reasons = fn(rec)
+                reasons_json = json.dumps(reasons, ensure_ascii=False)
+                if status != r[2] or reasons_json != r[3]:
+                    updates.append((status, reasons_json, r[0]))
+                    if status != r[2]:
+                        # Keyed by the stored location, like the ingest hook
+                        moved.append((r[4], location, r[1], r[2], status))
+
+            refreshed: List[int] = []
+            conn.execute("BEGIN IMMEDIATE")
+            if updates:
+                conn.executemany(
+                    "UPDATE checkins SET computed_status = ?, computed_reasons_json = ? WHERE id = ?",
+                    updates,
+                )
+                version = get_fleet_version(conn) + 1
+                refreshed = [
+                    t[0] for t in conn.execute(
+                        _REFRESH_LATEST_SQL,
+                        (version, json.dumps([u[2] for u in updates])),
+                    ).fetchall()
+                ]
+                if refreshed:
+                    _bump_fleet_version(conn, 1)
+                if rollups and moved:
+                    report["rollup_buckets_updated"] += move_status_counts(conn, moved)
+            last_id = rows[-1][0]
+            set_meta(conn, _CHECKPOINT_KEY, last_id)
+            conn.commit()
+
+            if refreshed:
+                _publish_latest(conn, refreshed)
+
+            report["rows_scanned"] += len(rows)
+            report["rows_changed"] += len(updates)
+            report["devices_refreshed"] += len(refreshed)
+            report["last_id"] = last_id
+            if progress:
+                progress(dict(report))
+
+        with conn:
+            conn.execute("DELETE FROM meta WHERE key = ?", (_CHECKPOINT_KEY,))
+
+    report["elapsed_s"] = round(time.monotonic() - started, 3)
+    return report
+
+
+def _publish_latest(conn, checkin_ids: List[int]) -> None:
+    """Push refreshed latest states to the fleet summary and live dashboards."""
+    rows = latest_rows_for(conn, checkin_ids)
+    fleet_summary.update_latest(rows)
+    for row in rows:
+        broker.publish_checkin(row)
+
+
+# -------------------------
+# Background job (admin endpoint)
+# -------------------------
+_job_lock = threading.Lock()
+_job: Dict[str, Any] = {"state": "idle"}
+
+
+def start_reclassify_job(**kwargs: Any) -> bool:
+    """
+    Run reclassify_checkins on a daemon thread.
+    Returns False if a run is already in progress.
+    """
+    with _job_lock:
+        if _job.get("state") == "running":
+            return False
+        _job.clear()
+        _job.update(state="running", started_utc=from_epoch_ms(utc_now_ms()), progress=None)
+
+    def on_progress(report: Dict[str, Any]) -> None:
+        with _job_lock:
+            _job["progress"] = report
+
+    def run() -> None:
+        try:
+            report = reclassify_checkins(progress=on_progress, **kwargs)
+            with _job_lock:
+                _job.update(state="done", report=report)
+        except Exception as e:  # checkpoint is kept; a new run resumes
+            with _job_lock:
+                _job.update(state="failed", error=repr(e))
+
+    threading.Thread(target=run, name="reclassify", daemon=True).start()
+    return True
+
+
+def reclassify_status() -> Dict[str, Any]:
+    with _job_lock:
+        return dict(_job)
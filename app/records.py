@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+from operator import attrgetter
+from typing import Any, Iterator, Tuple
+
+from app.db import CHECKIN_COLUMNS, INSERT_COLUMNS
+
+
+_insert_values = attrgetter(*INSERT_COLUMNS)
+
+
+class CheckinRecord:
+    """
+    One flattened check-in: an attribute per checkins column, plus the
+    device fields (location_tag, ip_address) that go to the devices table.
+
+    Supports read-only mapping access (rec["x"], rec.get("x")) so the health
+    rules, rollups and live stream can treat it like a row dict.
+    """
+
+    __slots__ = CHECKIN_COLUMNS + ("location_tag", "ip_address")
+
+    def __init__(self) -> None:
+        self.id = None
+        self.computed_status = None
+        self.computed_reasons_json = None
+        self.raw_json = None
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default)
+
+    def keys(self) -> Iterator[str]:
+        return iter(CHECKIN_COLUMNS)
+
+    def insert_values(self) -> Tuple[Any, ...]:
+        """Values in INSERT_COLUMNS order."""
+        return _insert_values(self)
@@ -0,0 +1,314 @@
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from app.db import CHECKIN_COLUMNS, _select_list, connection, get_meta, row_to_dict, set_meta
+from app.rawcodec import compress_json, decode_raw
+from app.timeutil import from_epoch_ms, utc_now_ms
+
+
+DAY_MS = 24 * 3600 * 1000
+
+# meta keys: check-ins older than this (epoch ms) may have been deleted, and
+# rollup buckets of each width starting before these (epoch s) were pruned.
+# Only ever raised, so a later, longer policy can't claim data that is gone.
+RETENTION_CUTOFF_KEY = "retention_cutoff_ms"
+ROLLUP_FLOOR_KEYS = {300: "rollup_5m_floor_s", 3600: "rollup_1h_floor_s"}
+
+
+@dataclass
+class RetentionPolicy:
+    # Full-resolution check-ins younger than this are kept
+    keep_days: int = 90
+    # Rollups outlive raw rows; daily buckets are kept forever
+    rollup_5m_days: int = 90
+    rollup_1h_days: int = 730
+    # Small delete transactions so ingest never waits long on the write lock
+    batch_size: int = 2000
+    pause_s: float = 0.05
+    # Write expired rows to gzip NDJSON here before deleting (None = no archive)
+    archive_dir: Optional[Path] = None
+    # Pages released per incremental_vacuum step
+    vacuum_step_pages: int = 2000
+
+    @classmethod
+    def from_env(cls) -> "RetentionPolicy":
+        """DASHBOARD_RETENTION_* environment variables override the defaults."""
+        env = os.environ
+        d = cls()
+        archive = env.get("DASHBOARD_RETENTION_ARCHIVE_DIR")
+        return cls(
+            keep_days=int(env.get("DASHBOARD_RETENTION_DAYS", d.keep_days)),
+            rollup_5m_days=int(env.get("DASHBOARD_RETENTION_ROLLUP_5M_DAYS", d.rollup_5m_days)),
+            rollup_1h_days=int(env.get("DASHBOARD_RETENTION_ROLLUP_1H_DAYS", d.rollup_1h_days)),
+            batch_size=int(env.get("DASHBOARD_RETENTION_BATCH_SIZE", d.batch_size)),
+            archive_dir=Path(archive) if archive else None,
+        )
+
+
+def _db_bytes(conn) -> int:
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    return int(page_size * page_count)
+
+
+def _archive_path(archive_dir: Path, now_ms: int) -> Path:
+    stamp = from_epoch_ms(now_ms)[:19].replace(":", "").replace("-", "")
+    return archive_dir / f"checkins-{stamp}.ndjson.gz"
+
+
+def run_retention(policy: RetentionPolicy, now_ms: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Delete check-ins older than policy.keep_days in batches (optionally
+    archiving them first), prune old fine-grained rollups, then give the
+    freed pages back to the filesystem with incremental vacuum.
+
+    Rows referenced by device_latest are never deleted, so devices that
+    went quiet keep their last state. Returns a report dict.
+    """
+    now_ms = utc_now_ms() if now_ms is None else now_ms
+    cutoff_ms = now_ms - policy.keep_days * DAY_MS
+
+    report: Dict[str, Any] = {
+        "cutoff_utc": from_epoch_ms(cutoff_ms),
+        "checkins_deleted": 0,
+        "archive_path": None,
+        "rollups_deleted": 0,
+    }
+
+    archive = None
+    if policy.archive_dir is not None:
+        policy.archive_dir.mkdir(parents=True, exist_ok=True)
+        path = _archive_path(policy.archive_dir, now_ms)
+        archive = gzip.open(path, "at", encoding="utf-8")
+        report["archive_path"] = str(path)
+
+    rollup_floors = {
+        ROLLUP_FLOOR_KEYS[300]: (now_ms - policy.rollup_5m_days * DAY_MS) // 1000,
+        ROLLUP_FLOOR_KEYS[3600]: (now_ms - policy.rollup_1h_days * DAY_MS) // 1000,
+    }
+
+    # Archived rows look like API rows (ISO timestamps)
+    columns = _select_list(CHECKIN_COLUMNS, "c")
+    try:
+        with connection() as conn:
+            report["db_bytes_before"] = _db_bytes(conn)
+
+            # Recorded before anything is deleted, so an interrupted run
+            # still tells rebuilds where the raw history stops
+            with conn:
+                set_meta(conn, RETENTION_CUTOFF_KEY, cutoff_ms, keep_max=True)
+                for key, floor_s in rollup_floors.items():
+                    set_meta(conn, key, floor_s, keep_max=True)
+
+            while True:
+                rows = conn.execute(
+                    f"""
+                    SELECT {columns}
+                    FROM checkins c
+                    WHERE c.timestamp_utc < ?
+                      AND c.id NOT IN (SELECT checkin_id FROM device_latest)
+                    ORDER BY c.timestamp_utc
+                    LIMIT ?
+                    """,
+                    (cutoff_ms, policy.batch_size),
+                ).fetchall()
+                if not rows:
+                    break
+
+                if archive is not None:
+                    for r in rows:
+                        archive.write(json.dumps(row_to_dict(r), ensure_ascii=False) + "\n")
+                    # Rows must be on disk before they leave the database
+                    archive.flush()
+                    os.fsync(archive.fileno())
+
+                with conn:
+                    conn.executemany("DELETE FROM checkins WHERE id = ?", [(r["id"],) for r in rows])
+                report["checkins_deleted"] += len(rows)
+
+                if len(rows) < policy.batch_size:
+                    break
+                time.sleep(policy.pause_s)
+
+            for bucket_s, key in ROLLUP_FLOOR_KEYS.items():
+                with conn:
+                    cur = conn.execute(
+                        "DELETE FROM rollups WHERE bucket_s = ? AND bucket_start < ?",
+                        (bucket_s, rollup_floors[key]),
+                    )
+                report["rollups_deleted"] += cur.rowcount
+
+            report.update(reclaim_space(conn, policy.vacuum_step_pages))
+            report["db_bytes_after"] = _db_bytes(conn)
+    finally:
+        if archive is not None:
+            archive.close()
+
+    return report
+
+
+def rebuild_floors(conn, bucket_widths: Iterable[int]) -> Dict[int, int]:
+    """
+    Per bucket width, the earliest bucket_start (epoch s) that can be
+    recomputed from stored check-ins: buckets from before the retention
+    cutoff are missing raw rows, and pruned ones should stay pruned.
+    0 everywhere if retention has never run.
+    """
+    cutoff_ms = get_meta(conn, RETENTION_CUTOFF_KEY) or 0
+    floors: Dict[int, int] = {}
+    for width in bucket_widths:
+        # First bucket lying wholly after the cutoff
+        floor_s = -(-cutoff_ms // (width * 1000)) * width
+        pruned_s = get_meta(conn, ROLLUP_FLOOR_KEYS[width]) if width in ROLLUP_FLOOR_KEYS else None
+        if pruned_s:
+            floor_s = max(floor_s, -(-pruned_s // width) * width)
+        floors[width] = floor_s
+    return floors
+
+
+def reclaim_space(conn, step_pages: int = 2000) -> Dict[str, Any]:
+    """
+    Release free pages with incremental vacuum, a step at a time.
+    Needs auto_vacuum=INCREMENTAL (new databases get it from init_db;
+    see enable_incremental_vacuum for older ones).
+    """
+    mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+    if mode != 2:
+        return {
+            "pages_freed": 0,
+            "bytes_reclaimed": 0,
+            "free_pages_remaining": free_before,
+            "note": "auto_vacuum is not INCREMENTAL; run 'python -m app.cli retention --enable-incremental-vacuum'",
+        }
+
+    remaining = free_before
+    while remaining > 0:
+        # Each step is its own short write transaction
+        conn.execute(f"PRAGMA incremental_vacuum({int(step_pages)})").fetchall()
+        left = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if left >= remaining:
+            break
+        remaining = left
+
+    free_after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    # Shrink the WAL too, otherwise the file size doesn't move
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+
+    freed = free_before - free_after
+    return {
+        "pages_freed": freed,
+        "bytes_reclaimed": freed * page_size,
+        "free_pages_remaining": free_after,
+    }
+
+
+def recode_raw_payloads(
+    mode: str,
+    batch_size: int = 2000,
+    vacuum: bool = False,
+    progress: Optional[Callable[[int], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Rewrite stored raw_json values into `mode` (see app/rawcodec.py) in
+    batches, e.g. to shrink a database written with the old plain-JSON
+    format, then reclaim the freed pages. Returns a report dict.
+
+    Shrunk rows leave partly-empty pages behind; vacuum=True finishes with a
+    full VACUUM (locks the database while it runs) to repack them.
+    """
+    report: Dict[str, Any] = {"rows_scanned": 0, "rows_rewritten": 0, "raw_bytes_before": 0, "raw_bytes_after": 0}
+
+    with connection() as conn:
+        report["db_bytes_before"] = _db_bytes(conn)
+        last_id = 0
+        while True:
+            rows = conn.execute(
+                """
+                SELECT id, raw_json
+                FROM checkins
+                WHERE id > ? AND raw_json IS NOT NULL
+                ORDER BY id
+                LIMIT ?
+                """,
+                (last_id, batch_size),
+            ).fetchall()
+            if not rows:
+                break
+
+            updates = []
+            for checkin_id, stored in rows:
+                if mode == "off":
+                    new = None
+                elif mode == "json":
+                    new = decode_raw(stored)
+                elif isinstance(stored, bytes):
+                    new = stored  # already compressed
+                else:
+                    compact = json.dumps(json.loads(stored), ensure_ascii=False, separators=(",", ":"))
+                    new = compress_json(compact)
+
+                size = len(stored.encode("utf-8")) if isinstance(stored, str) else len(stored)
+                new_size = 0 if new is None else (len(new.encode("utf-8")) if isinstance(new, str) else len(new))
+                report["raw_bytes_before"] += size
+                report["raw_bytes_after"] += new_size
+                if new != stored:
+                    updates.append((new, checkin_id))
+
+            if updates:
+                with conn:
+                    conn.executemany("UPDATE checkins SET raw_json = ? WHERE id = ?", updates)
+
+            last_id = rows[-1][0]
+            report["rows_scanned"] += len(rows)
+            report["rows_rewritten"] += len(updates)
+            if progress:
+                progress(report["rows_scanned"])
+
+        if vacuum:
+            conn.execute("VACUUM")
+        report.update(reclaim_space(conn))
+        report["db_bytes_after"] = _db_bytes(conn)
+
+    return report
+
+
+def enable_incremental_vacuum() -> Dict[str, Any]:
+    """
+    One-time switch of an existing database to auto_vacuum=INCREMENTAL.
+    Runs a full VACUUM, which locks the database while it rewrites it.
+    """
+    with connection() as conn:
+        before = _db_bytes(conn)
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        return {"db_bytes_before": before, "db_bytes_after": _db_bytes(conn)}
+
+
+def start_retention_scheduler(policy: RetentionPolicy, interval_s: float) -> threading.Event:
+    """
+    Run retention every interval_s seconds on a daemon thread.
+    Set the returned event to stop it.
+    """
+    stop = threading.Event()
+
+    def loop() -> None:
+        while not stop.wait(interval_s):
+            try:
+                report = run_retention(policy)
+                print(f"[retention] {report}")
+            except Exception as e:  # keep the scheduler alive; next run retries
+                print(f"[retention] failed: {e!r}")
+
+    threading.Thread(target=loop, name="retention", daemon=True).start()
+    return stop
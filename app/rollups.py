@@ -0,0 +1,341 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.db import connection
+from app.retention import rebuild_floors
+from app.timeutil import from_epoch_ms, to_epoch_ms
+
+
+# Bucket widths in seconds: 5 minutes, 1 hour, 1 day
+BUCKETS = (300, 3600, 86400)
+
+# Set DASHBOARD_ROLLUPS_ON_INGEST=0 to only build rollups with the catch-up job
+ROLLUPS_ON_INGEST = os.environ.get("DASHBOARD_ROLLUPS_ON_INGEST", "1") != "0"
+
+
+def _auth_fail_rate(r: Dict[str, Any]) -> Optional[float]:
+    attempts = r["mypc_auth_attempts"]
+    return r["mypc_auth_failures"] / attempts if attempts else None
+
+
+# Column prefix -> value extracted from a flattened check-in row (None = no sample)
+METRICS: Dict[str, Callable[[Dict[str, Any]], Optional[float]]] = {
+    "disk": lambda r: r["disk_c_free_pct"],
+    "afr": _auth_fail_rate,
+    "p95": lambda r: r["mypc_p95_auth_ms"],
+}
+
+# /api/series metric name -> column prefix
+SERIES_METRICS = {
+    "disk_c_free_pct": "disk",
+    "auth_fail_rate": "afr",
+    "mypc_p95_auth_ms": "p95",
+}
+
+_KEY_COLUMNS = ("scope", "scope_key", "bucket_s", "bucket_start")
+_COUNT_COLUMNS = ("n", "green", "yellow", "red", "auth_attempts", "auth_failures")
+_METRIC_COLUMNS = tuple(
+    f"{p}_{s}" for p in METRICS for s in ("n", "min", "max", "sum", "last")
+)
+_COLUMNS = _KEY_COLUMNS + _COUNT_COLUMNS + ("last_ts",) + _METRIC_COLUMNS
+
+# Columns in checkins needed to build rollups
+SOURCE_COLUMNS = (
+    "device_id",
+    "timestamp_utc",
+    "computed_status",
+    "disk_c_free_pct",
+    "mypc_auth_attempts",
+    "mypc_auth_failures",
+    "mypc_p95_auth_ms",
+)
+
+
+def _merge_sql() -> str:
+    sets = [f"{c} = rollups.{c} + excluded.{c}" for c in _COUNT_COLUMNS]
+    for p in METRICS:
+        sets += [
+            f"{p}_n = rollups.{p}_n + excluded.{p}_n",
+            f"{p}_sum = rollups.{p}_sum + excluded.{p}_sum",
+            # scalar MIN/MAX return NULL if either side is NULL
+            f"{p}_min = MIN(COALESCE(rollups.{p}_min, excluded.{p}_min), "
+            f"COALESCE(excluded.{p}_min, rollups.{p}_min))",
+            f"{p}_max = MAX(COALESCE(rollups.{p}_max, excluded.{p}_max), "
+            f"COALESCE(excluded.{p}_max, rollups.{p}_max))",
+            f"{p}_last = CASE WHEN excluded.last_ts >= rollups.last_ts "
+            f"THEN COALESCE(excluded.{p}_last, rollups.{p}_last) "
+            f"ELSE COALESCE(rollups.{p}_last, excluded.{p}_last) END",
+        ]
+    sets.append("last_ts = MAX(rollups.last_ts, excluded.last_ts)")
+
+    return (
+        f"INSERT INTO rollups ({', '.join(_COLUMNS)}) "
+        f"VALUES ({', '.join(['?'] * len(_COLUMNS))}) "
+        f"ON CONFLICT({', '.join(_KEY_COLUMNS)}) DO UPDATE SET "
+        + ", ".join(sets)
+    )
+
+
+_UPSERT_ROLLUP_SQL = _merge_sql()
+
+
+def _new_agg() -> Dict[str, Any]:
+    agg: Dict[str, Any] = {c: 0 for c in _COUNT_COLUMNS}
+    agg["last_ts"] = -1
+    for p in METRICS:
+        agg.update({f"{p}_n": 0, f"{p}_min": None, f"{p}_max": None, f"{p}_sum": 0.0, f"{p}_last": None})
+    return agg
+
+
+def _add_sample(agg: Dict[str, Any], ts_ms: int, row: Dict[str, Any]) -> None:
+    agg["n"] += 1
+    status = row["computed_status"]
+    if status in ("green", "yellow", "red"):
+        agg[status] += 1
+    agg["auth_attempts"] += row["mypc_auth_attempts"] or 0
+    agg["auth_failures"] += row["mypc_auth_failures"] or 0
+
+    newest = ts_ms >= agg["last_ts"]
+    for p, extract in METRICS.items():
+        v = extract(row)
+        if v is None:
+            continue
+        agg[f"{p}_n"] += 1
+        agg[f"{p}_sum"] += v
+        agg[f"{p}_min"] = v if agg[f"{p}_min"] is None else min(agg[f"{p}_min"], v)
+        agg[f"{p}_max"] = v if agg[f"{p}_max"] is None else max(agg[f"{p}_max"], v)
+        if newest or agg[f"{p}_last"] is None:
+            agg[f"{p}_last"] = v
+    if newest:
+        agg["last_ts"] = ts_ms
+
+
+def aggregate(
+    rows: Iterable[Dict[str, Any]],
+    locations: Iterable[Optional[str]],
+) -> Dict[Tuple[str, str, int, int], Dict[str, Any]]:
+    """
+    Pre-aggregate check-in rows into rollup buckets (device and location scope,
+    every bucket width), so a batch costs one upsert per touched bucket.
+    """
+    out: Dict[Tuple[str, str, int, int], Dict[str, Any]] = {}
+    for row, location in zip(rows, locations):
+        ts_ms = to_epoch_ms(row["timestamp_utc"])
+        ts_s = ts_ms // 1000
+        scopes = [("device", row["device_id"])]
+        if location:
+            scopes.append(("location", location))
+
+        for bucket_s in BUCKETS:
+            start = ts_s - ts_s % bucket_s
+            for scope, key in scopes:
+                k = (scope, key, bucket_s, start)
+                agg = out.get(k)
+                if agg is None:
+                    agg = out[k] = _new_agg()
+                _add_sample(agg, ts_ms, row)
+    return out
+
+
+def write_aggregates(
+    conn: sqlite3.Connection,
+    aggs: Dict[Tuple[str, str, int, int], Dict[str, Any]],
+) -> None:
+    """Merge pre-aggregated buckets into rollups (caller owns the transaction)."""
+    data_columns = _COLUMNS[len(_KEY_COLUMNS):]
+    conn.executemany(
+        _UPSERT_ROLLUP_SQL,
+        [key + tuple(agg[c] for c in data_columns) for key, agg in aggs.items()],
+    )
+
+
+def update_rollups(
+    conn: sqlite3.Connection,
+    rows: Sequence[Dict[str, Any]],
+    locations: Sequence[Optional[str]],
+) -> None:
+    """Ingest hook: called inside the check-in write transaction."""
+    if ROLLUPS_ON_INGEST:
+        write_aggregates(conn, aggregate(rows, locations))
+
+
+_STATUS_SLOTS = {"green": 0, "yellow": 1, "red": 2}
+
+# A bucket that never counted the row (its device has since moved to
+# another location) is left alone rather than driven negative
+_MOVE_STATUS_SQL = """
+UPDATE rollups
+SET green = green + ?, yellow = yellow + ?, red = red + ?
+WHERE scope = ? AND scope_key = ? AND bucket_s = ? AND bucket_start = ?
+  AND green + ? >= 0 AND yellow + ? >= 0 AND red + ? >= 0
+"""
+
+
+def move_status_counts(
+    conn: sqlite3.Connection,
+    changes: Iterable[Tuple[str, Optional[str], int, Optional[str], Optional[str]]],
+) -> int:
+    """
+    Shift re-classified check-ins between the status counts of the buckets
+    already holding them (caller owns the transaction). Nothing else in a
+    bucket depends on the status, and buckets retention pruned stay gone.
+
+    changes: (device_id, location_tag, timestamp ms, old status, new status);
+    location_tag is the device's stored one, as ingest and rebuild_rollups
+    key location buckets.
+    Returns the number of bucket rows updated.
+    """
+    deltas: Dict[Tuple[str, str, int, int], List[int]] = {}
+    for device_id, location, ts_ms, old, new in changes:
+        if old == new:
+            continue
+        ts_s = ts_ms // 1000
+        scopes = [("device", device_id)]
+        if location:
+            scopes.append(("location", location))
+        for bucket_s in BUCKETS:
+            start = ts_s - ts_s % bucket_s
+            for scope, key in scopes:
+                d = deltas.setdefault((scope, key, bucket_s, start), [0, 0, 0])
+                if old in _STATUS_SLOTS:
+                    d[_STATUS_SLOTS[old]] -= 1
+                if new in _STATUS_SLOTS:
+                    d[_STATUS_SLOTS[new]] += 1
+
+    params = [tuple(d) + key + tuple(d) for key, d in deltas.items() if any(d)]
+    if not params:
+        return 0
+    return conn.executemany(_MOVE_STATUS_SQL, params).rowcount
+
+
+def rebuild_rollups(
+    since: Optional[str] = None,
+    chunk_size: int = 5000,
+    progress: Optional[Callable[[int], None]] = None,
+) -> int:
+    """
+    Catch-up job: recompute rollups for every bucket from `since` onward
+    (everything if None). Runs in chunks so ingest is never blocked for long.
+
+    Buckets that retention has cut into or pruned (see
+    retention.rebuild_floors) are left as they are: their check-ins are
+    partly gone, so recounting would lose history.
+    Returns the number of check-ins processed.
+    """
+    since_s = to_epoch_ms(since) // 1000 if since else 0
+
+    with connection() as conn:
+        # Clearing and fixing the high-water mark together means rows ingested
+        # later are counted exactly once (by the ingest hook).
+        conn.execute("BEGIN IMMEDIATE")
+        # Per width, the first bucket to rebuild whole
+        floors = rebuild_floors(conn, BUCKETS)
+        starts = {w: max(since_s - since_s % w, floors[w]) for w in BUCKETS}
+        conn.executemany(
+            "DELETE FROM rollups WHERE bucket_s = ? AND bucket_start >= ?",
+            list(starts.items()),
+        )
+        max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM checkins").fetchone()[0]
+        conn.commit()
+
+        cols = ", ".join(f"c.{c}" for c in SOURCE_COLUMNS)
+        # (ts, id) > (since, 0) takes every row from since on (ids start at 1)
+        last_ts, last_id, done = min(starts.values()) * 1000, 0, 0
+        while True:
+            rows = conn.execute(
+                f"""
+                SELECT c.id, {cols}, d.location_tag
+                FROM checkins c
+                LEFT JOIN devices d ON d.device_id = c.device_id
+                WHERE (c.timestamp_utc, c.id) > (?, ?)
+                  AND c.id <= ?
+                ORDER BY c.timestamp_utc, c.id
+                LIMIT ?
+                """,
+                (last_ts, last_id, max_id, chunk_size),
+            ).fetchall()
+            if not rows:
+                break
+
+            dict_rows = [dict(r) for r in rows]
+            aggs = aggregate(dict_rows, [r["location_tag"] for r in dict_rows])
+            # Rows early enough for a wider bucket still fall in finer ones left alone
+            aggs = {k: agg for k, agg in aggs.items() if k[3] >= starts[k[2]]}
+            with conn:
+                write_aggregates(conn, aggs)
+
+            last_ts, last_id = rows[-1]["timestamp_utc"], rows[-1]["id"]
+            done += len(rows)
+            if progress:
+                progress(done)
+
+    return done
+
+
+def pick_bucket(range_s: int, max_points: int) -> int:
+    """Finest bucket width whose point count over range_s fits max_points."""
+    for bucket_s in BUCKETS:
+        if range_s / bucket_s <= max_points:
+            return bucket_s
+    return BUCKETS[-1]
+
+
+def get_series(
+    scope: str,
+    key: str,
+    metric: str,
+    from_ms: int,
+    to_ms: int,
+    max_points: int,
+) -> Dict[str, Any]:
+    """
+    Downsampled series from rollups. metric is a SERIES_METRICS name or
+    'status' (green/yellow/red check-in counts per bucket).
+    """
+    bucket_s = pick_bucket(max(0, to_ms - from_ms) // 1000, max_points)
+    start_s = from_ms // 1000
+    start_s -= start_s % bucket_s
+
+    with connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT *
+            FROM rollups
+            WHERE scope = ? AND scope_key = ? AND bucket_s = ?
+              AND bucket_start BETWEEN ? AND ?
+            ORDER BY bucket_start
+            """,
+            (scope, key, bucket_s, start_s, to_ms // 1000),
+        ).fetchall()
+
+    points: List[Dict[str, Any]] = []
+    for r in rows:
+        point: Dict[str, Any] = {"t": from_epoch_ms(r["bucket_start"] * 1000), "n": r["n"]}
+        if metric == "status":
+            point.update(green=r["green"], yellow=r["yellow"], red=r["red"])
+        else:
+            p = SERIES_METRICS[metric]
+            n = r[f"{p}_n"]
+            if p == "afr":
+                # Bucket-level rate weights every attempt, not every check-in
+                avg = r["auth_failures"] / r["auth_attempts"] if r["auth_attempts"] else None
+            else:
+                avg = r[f"{p}_sum"] / n if n else None
+            point.update(
+                min=r[f"{p}_min"],
+                max=r[f"{p}_max"],
+                avg=avg,
+                last=r[f"{p}_last"],
+            )
+        points.append(point)
+
+    return {
+        "scope": scope,
+        "key": key,
+        "metric": metric,
+        "bucket_s": bucket_s,
+        "points": points,
+    }
@@ -0,0 +1,286 @@
+"""
+Fleet-wide summary (GET /api/fleet/summary), overall and per location_tag.
+
+Every device's latest check-in contributes to the counters of the fleet
+and of its location: status counts (stale / offline devices are counted
+as such instead of by their last status), active health reasons, MyPC
+auth failures by reason, and quantile sketches of mypc_p95_auth_ms and
+disk_c_free_pct. When a device's latest state changes, its old
+contribution is subtracted and the new one added, so keeping the summary
+current costs O(1) per check-in. Fleet totals are the location blocks
+merged at read time, which depends on the number of locations, not
+devices. Startup seeds it with one pass over device_latest.
+"""
+from __future__ import annotations
+
+import json
+import math
+import threading
+from typing import Any, Dict, Iterable, NamedTuple, Optional, Sequence, Tuple
+
+from app.db import connection
+
+
+# Reported quantiles of the metric sketches
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+# How many health reasons the summary lists per block
+TOP_REASONS = 5
+
+# Summary key for devices that never sent a location_tag
+NO_LOCATION = "(none)"
+
+STATUS_KEYS = ("green", "yellow", "red", "stale", "offline")
+
+
+# -------------------------
+# Quantile sketch
+# -------------------------
+class QuantileSketch:
+    """
+    Relative-error quantile sketch (DDSketch-style): a value v > 0 counts
+    in bucket ceil(log_gamma(v)), so any quantile is within
+    relative_accuracy of the true value. Buckets are plain counts, so
+    sketches merge by adding and a value can be removed again.
+    """
+
+    MIN_VALUE = 1e-6  # smaller values (e.g. 0% disk free) share the zero bucket
+    ZERO_INDEX = -(1 << 30)
+
+    def __init__(self, relative_accuracy: float = 0.01) -> None:
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.counts: Dict[int, int] = {}
+        self.n = 0
+
+    def index(self, value: float) -> int:
+        """Bucket for value."""
+        if value < self.MIN_VALUE:
+            return self.ZERO_INDEX
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def add_index(self, idx: int, count: int = 1) -> None:
+        """Add (or with a negative count, remove) samples by bucket index."""
+        n = self.counts.get(idx, 0) + count
+        if n:
+            self.counts[idx] = n
+        else:
+            del self.counts[idx]
+        self.n += count
+
+    def merge(self, other: "QuantileSketch") -> None:
+        for idx, count in other.counts.items():
+            self.add_index(idx, count)
+
+    def _value(self, idx: int) -> float:
+        if idx == self.ZERO_INDEX:
+            return 0.0
+        return 2 * self.gamma ** idx / (self.gamma + 1)
+
+    def quantiles(self, qs: Sequence[float] = QUANTILES) -> Dict[str, Optional[float]]:
+        """{"p50": value, ...}; None for an empty sketch."""
+        out: Dict[str, Optional[float]] = {}
+        if not self.n:
+            return {f"p{round(q * 100)}": None for q in qs}
+        items = sorted(self.counts.items())
+        for q in qs:
+            rank = q * (self.n - 1)
+            seen = 0
+            for idx, count in items:
+                seen += count
+                if seen > rank:
+                    break
+            out[f"p{round(q * 100)}"] = round(self._value(idx), 2)
+        return out
+
+
+# -------------------------
+# Counters
+# -------------------------
+class _Contribution(NamedTuple):
+    """What one device's latest state adds to its blocks."""
+    location: Optional[str]
+    ts: str
+    status: str                          # one of STATUS_KEYS
+    reasons: Tuple[str, ...]
+    auth_failures: Tuple[Tuple[str, int], ...]
+    p95_idx: Optional[int]               # sketch bucket of mypc_p95_auth_ms
+    disk_idx: Optional[int]              # sketch bucket of disk_c_free_pct
+
+
+def _bump(counter: Dict[str, int], key: str, delta: int) -> None:
+    n = counter.get(key, 0) + delta
+    if n:
+        counter[key] = n
+    else:
+        counter.pop(key, None)
+
+
+class _Block:
+    """Counters for the whole fleet or one location."""
+
+    def __init__(self) -> None:
+        self.devices = 0
+        self.status: Dict[str, int] = dict.fromkeys(STATUS_KEYS, 0)
+        self.reasons: Dict[str, int] = {}
+        self.auth_failures: Dict[str, int] = {}
+        self.p95_auth_ms = QuantileSketch()
+        self.disk_free_pct = QuantileSketch()
+
+    def add(self, c: _Contribution, sign: int) -> None:
+        self.devices += sign
+        self.status[c.status] += sign
+        for reason in c.reasons:
+            _bump(self.reasons, reason, sign)
+        for reason, n in c.auth_failures:
+            _bump(self.auth_failures, reason, sign * n)
+        if c.p95_idx is not None:
+            self.p95_auth_ms.add_index(c.p95_idx, sign)
+        if c.disk_idx is not None:
+            self.disk_free_pct.add_index(c.disk_idx, sign)
+
+    def merge(self, other: "_Block") -> None:
+        self.devices += other.devices
+        for key, n in other.status.items():
+            self.status[key] += n
+        for reason, n in other.reasons.items():
+            _bump(self.reasons, reason, n)
+        for reason, n in other.auth_failures.items():
+            _bump(self.auth_failures, reason, n)
+        self.p95_auth_ms.merge(other.p95_auth_ms)
+        self.disk_free_pct.merge(other.disk_free_pct)
+
+    def to_dict(self) -> Dict[str, Any]:
+        top = sorted(self.reasons.items(), key=lambda kv: (-kv[1], kv[0]))[:TOP_REASONS]
+        return {
+            "devices": self.devices,
+            "status": dict(self.status),
+            "top_reasons": [{"reason": r, "devices": n} for r, n in top],
+            "auth_failures_total": sum(self.auth_failures.values()),
+            "auth_failures_by_reason": dict(sorted(self.auth_failures.items())),
+            "mypc_p95_auth_ms": self.p95_auth_ms.quantiles(),
+            "disk_c_free_pct": self.disk_free_pct.quantiles(),
+        }
+
+
+class FleetSummary:
+    """Incremental fleet / per-location counters over devices' latest states."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._devices: Dict[str, _Contribution] = {}
+        self._locations: Dict[str, _Block] = {}
+        # Only used for bucket indexes (all blocks share the accuracy)
+        self._sketch = QuantileSketch()
+
+    def _apply(self, device_id: str, new: _Contribution) -> None:
+        """Swap a device's contribution; caller holds the lock."""
+        old = self._devices.get(device_id)
+        if old == new:
+            return
+        if old is not None:
+            key = old.location or NO_LOCATION
+            block = self._locations[key]
+            block.add(old, -1)
+            if not block.devices:
+                del self._locations[key]
+        self._devices[device_id] = new
+        key = new.location or NO_LOCATION
+        block = self._locations.get(key)
+        if block is None:
+            block = self._locations[key] = _Block()
+        block.add(new, 1)
+
+    def _contribution(
+        self,
+        location: Optional[str],
+        ts: str,
+        status: Optional[str],
+        liveness: Optional[str],
+        reasons_json: Optional[str],
+        auth_json: Optional[str],
+        p95: Optional[float],
+        disk: Optional[float],
+    ) -> _Contribution:
+        reasons = tuple(json.loads(reasons_json)) if reasons_json else ()
+        auth = json.loads(auth_json) if auth_json else {}
+        return _Contribution(
+            location=location,
+            ts=ts,
+            status=liveness or status or "green",
+            reasons=reasons,
+            auth_failures=tuple((str(k), int(v)) for k, v in auth.items() if v),
+            p95_idx=self._sketch.index(p95) if p95 is not None else None,
+            disk_idx=self._sketch.index(disk) if disk is not None else None,
+        )
+
+    # -------------------------
+    # Updates
+    # -------------------------
+    def seed(self) -> int:
+        """Rebuild from device_latest (startup). Returns the number of devices."""
+        with connection() as conn:
+            rows = conn.execute(
+                """
+                SELECT l.device_id, d.location_tag, c.timestamp_utc, c.computed_status, l.liveness,
+                       c.computed_reasons_json, c.mypc_auth_failures_by_reason_json,
+                       c.mypc_p95_auth_ms, c.disk_c_free_pct
+                FROM device_latest l
+                JOIN checkins c ON c.id = l.checkin_id
+                LEFT JOIN devices d ON d.device_id = l.device_id
+                """
+            ).fetchall()
+
+        with self._lock:
+            self._devices.clear()
+            self._locations.clear()
+            for r in rows:
+                self._apply(r[0], self._contribution(*r[1:]))
+            return len(self._devices)
+
+    def observe(self, rows: Iterable[Any]) -> None:
+        """Stored check-ins (CheckinRecord); late ones don't change the latest state."""
+        with self._lock:
+            for r in rows:
+                old = self._devices.get(r.device_id)
+                if old is not None and r.timestamp_utc < old.ts:
+                    continue
+                # The devices upsert keeps the old location_tag when none is sent
+                location = r.location_tag or (old.location if old is not None else None)
+                self._apply(r.device_id, self._contribution(
+                    location, r.timestamp_utc, r.computed_status, None,
+                    r.computed_reasons_json, r.mypc_auth_failures_by_reason_json,
+                    r.mypc_p95_auth_ms, r.disk_c_free_pct,
+                ))
+
+    def update_latest(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """
+        Fleet-view rows whose status / reasons / liveness changed without a
+        new check-in (liveness sweeps, reclassification).
+        """
+        with self._lock:
+            for r in rows:
+                old = self._devices.get(r["device_id"])
+                if old is None or r["timestamp_utc"] != old.ts:
+                    continue
+                reasons = r.get("computed_reasons_json")
+                self._apply(r["device_id"], old._replace(
+                    status=r.get("liveness") or r.get("computed_status") or "green",
+                    reasons=tuple(json.loads(reasons)) if reasons else (),
+                ))
+
+    # -------------------------
+    # Read
+    # -------------------------
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            fleet = _Block()
+            for block in self._locations.values():
+                fleet.merge(block)
+            return {
+                "fleet": fleet.to_dict(),
+                "locations": {k: b.to_dict() for k, b in sorted(self._locations.items())},
+            }
+
+
+fleet_summary = FleetSummary()
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+
+def parse_utc(value: str) -> datetime:
+    """
+    Parse an agent ISO-8601 timestamp ('Z' or any offset; naive = UTC).
+    Raises ValueError on anything else.
+    """
+    dt = datetime.fromisoformat(value.strip())
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MS = timedelta(milliseconds=1)
+
+
+def to_epoch_ms(value: Any) -> int:
+    """Epoch milliseconds from an ISO string (or a value that already is ms)."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    # Integer arithmetic: float timestamps can land a millisecond low
+    return (parse_utc(value) - _EPOCH) // _MS
+
+
+def from_epoch_ms(ms: int) -> str:
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).isoformat(timespec="milliseconds")
+
+
+def utc_now_ms() -> int:
+    return int(datetime.now(timezone.utc).timestamp() * 1000)
@@ -0,0 +1,231 @@
+"""
+Per-device disk / auth-failure trends for the fleet view.
+
+Each device keeps two small rings that mirror its rollup buckets: the last
+hour in 5-minute slots and the last day in 1-hour slots. A slot holds the
+newest sample time, that sample's disk_c_free_pct and the slot's summed
+auth attempts / failures. Ingest only writes one slot per ring; the
+derived numbers are computed when first read after a change and cached,
+so a fleet poll attaches ready-made dicts. At startup the rings are seeded
+from the device rollups of the same widths.
+
+Windows end at the device's newest check-in, so a device that stopped
+reporting keeps the trend it had.
+"""
+from __future__ import annotations
+
+import threading
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.db import connection
+from app.timeutil import to_epoch_ms
+
+
+HOUR_MS = 3600 * 1000
+
+# (slot width ms, slots): one slot more than the window so its far edge is covered
+SHORT_RING = (300 * 1000, 13)
+LONG_RING = (HOUR_MS, 25)
+
+# Fields per slot: newest sample ts (ms, 0 = empty), disk %, auth attempts, auth failures
+_SLOT = 4
+_NAN = float("nan")  # slot without a disk sample
+
+# Disk projections further out than this are reported as None ("not soon")
+MAX_DAYS_TO_FULL = 365
+
+
+def _window(
+    ring: "array[float]",
+    slots: int,
+    latest_ts: float,
+    window_ms: int,
+) -> Tuple[List[Tuple[float, float]], float, float]:
+    """(ts, disk) points, attempts, failures of slots whose newest sample is in the window."""
+    points: List[Tuple[float, float]] = []
+    attempts = failures = 0.0
+    start = latest_ts - window_ms
+    for i in range(0, slots * _SLOT, _SLOT):
+        ts = ring[i]
+        if ts and start <= ts <= latest_ts:
+            points.append((ts, ring[i + 1]))
+            attempts += ring[i + 2]
+            failures += ring[i + 3]
+    return points, attempts, failures
+
+
+def _disk_trend(points: List[Tuple[float, float]], window_ms: int) -> Tuple[Optional[float], Optional[float]]:
+    """
+    (delta, slope per hour) of disk % across the window. None until the
+    samples span at least half of it.
+    """
+    if len(points) < 2:
+        return None, None
+    points.sort()
+    t0, first = points[0]
+    t1, last = points[-1]
+    if t1 - t0 < window_ms / 2:
+        return None, None
+
+    # Least-squares slope, time in hours from the first point
+    n = len(points)
+    xs = [(t - t0) / HOUR_MS for t, _ in points]
+    mean_x = sum(xs) / n
+    mean_y = sum(v for _, v in points) / n
+    sxx = sum((x - mean_x) ** 2 for x in xs)
+    sxy = sum((x - mean_x) * (v - mean_y) for x, (_, v) in zip(xs, points))
+    slope = sxy / sxx if sxx else None
+    return round(last - first, 2), (round(slope, 3) if slope is not None else None)
+
+
+def _rate(failures: float, attempts: float) -> Optional[float]:
+    return round(failures / attempts, 4) if attempts else None
+
+
+class _DeviceTrend:
+    __slots__ = ("short", "long", "latest_ts", "disk", "cached")
+
+    def __init__(self) -> None:
+        self.short = array("d", bytes(8 * SHORT_RING[1] * _SLOT))
+        self.long = array("d", bytes(8 * LONG_RING[1] * _SLOT))
+        self.latest_ts = 0.0
+        self.disk: Optional[float] = None
+        self.cached: Optional[Dict[str, Any]] = None
+
+    def add(self, ts: float, disk: Optional[float], attempts: float, failures: float) -> None:
+        """One check-in: goes into a slot of both rings."""
+        self.put(self.short, SHORT_RING, ts, disk, attempts, failures)
+        self.put(self.long, LONG_RING, ts, disk, attempts, failures)
+
+    def put(
+        self,
+        ring: "array[float]",
+        spec: Tuple[int, int],
+        ts: float,
+        disk: Optional[float],
+        attempts: float,
+        failures: float,
+    ) -> None:
+        slot_ms, slots = spec
+        bucket = ts // slot_ms
+        i = int(bucket % slots) * _SLOT
+        held = ring[i] // slot_ms if ring[i] else -1
+        if held < bucket:
+            ring[i:i + _SLOT] = array("d", (ts, _NAN if disk is None else disk, attempts, failures))
+        elif held == bucket:
+            ring[i + 2] += attempts
+            ring[i + 3] += failures
+            if ts >= ring[i]:
+                ring[i] = ts
+                ring[i + 1] = _NAN if disk is None else disk
+        # else: a late sample whose slot has already been reused
+
+        if ts >= self.latest_ts:
+            self.latest_ts = ts
+            self.disk = disk
+        self.cached = None
+
+    def compute(self) -> Dict[str, Any]:
+        short_points, short_att, short_fail = _window(self.short, SHORT_RING[1], self.latest_ts, HOUR_MS)
+        long_points, long_att, long_fail = _window(self.long, LONG_RING[1], self.latest_ts, 24 * HOUR_MS)
+        short_points = [p for p in short_points if p[1] == p[1]]  # drop NaN (no disk sample)
+        long_points = [p for p in long_points if p[1] == p[1]]
+
+        delta_1h, slope_1h = _disk_trend(short_points, HOUR_MS)
+        delta_24h, slope_24h = _disk_trend(long_points, 24 * HOUR_MS)
+
+        # Prefer the day's slope; the hour's is noisier
+        slope = slope_24h if slope_24h is not None else slope_1h
+        days_to_full = None
+        if slope is not None and slope < 0 and self.disk is not None:
+            days = self.disk / -slope / 24
+            days_to_full = round(days, 1) if days <= MAX_DAYS_TO_FULL else None
+
+        rate_1h = _rate(short_fail, short_att)
+        rate_24h = _rate(long_fail, long_att)
+        return {
+            "disk_delta_1h": delta_1h,
+            "disk_slope_1h": slope_1h,
+            "disk_delta_24h": delta_24h,
+            "disk_slope_24h": slope_24h,
+            "disk_days_to_full": days_to_full,
+            "auth_fail_rate_1h": rate_1h,
+            "auth_fail_rate_24h": rate_24h,
+            # Last hour against the day's average
+            "auth_fail_rate_change": (
+                round(rate_1h - rate_24h, 4) if rate_1h is not None and rate_24h is not None else None
+            ),
+        }
+
+
+class TrendStore:
+    """Trend rings for every device; safe to update from ingest threads."""
+
+    def __init__(self) -> None:
+        self._devices: Dict[str, _DeviceTrend] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, rows: Iterable[Any]) -> None:
+        """Add stored check-ins (anything with device_id, timestamp_utc, disk / auth fields)."""
+        with self._lock:
+            for r in rows:
+                dev = self._devices.get(r["device_id"])
+                if dev is None:
+                    dev = self._devices[r["device_id"]] = _DeviceTrend()
+                dev.add(
+                    to_epoch_ms(r["timestamp_utc"]),
+                    r["disk_c_free_pct"],
+                    r["mypc_auth_attempts"] or 0,
+                    r["mypc_auth_failures"] or 0,
+                )
+
+    def get(self, device_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            dev = self._devices.get(device_id)
+            if dev is None:
+                return None
+            if dev.cached is None:
+                dev.cached = dev.compute()
+            return dev.cached
+
+    def attach(self, devices: Sequence[Dict[str, Any]]) -> None:
+        """Set "trend" on fleet-view rows."""
+        get = self.get
+        for d in devices:
+            d["trend"] = get(d["device_id"])
+
+    def seed_from_rollups(self) -> int:
+        """
+        Fill the rings from device rollups ending at each device's latest
+        check-in. Returns the number of devices seeded.
+        """
+        rows: List[Tuple[Any, ...]] = []
+        with connection() as conn:
+            for spec in (SHORT_RING, LONG_RING):
+                slot_ms, slots = spec
+                rows += [(spec, *r) for r in conn.execute(
+                    """
+                    SELECT r.scope_key, r.last_ts, r.disk_last, r.auth_attempts, r.auth_failures
+                    FROM device_latest l
+                    JOIN rollups r
+                      ON r.scope = 'device'
+                     AND r.scope_key = l.device_id
+                     AND r.bucket_s = ?
+                     AND r.bucket_start > l.timestamp_utc / 1000 - ?
+                    """,
+                    (slot_ms // 1000, slot_ms // 1000 * slots),
+                )]
+
+        with self._lock:
+            self._devices.clear()
+            for spec, device_id, last_ts, disk, attempts, failures in rows:
+                dev = self._devices.get(device_id)
+                if dev is None:
+                    dev = self._devices[device_id] = _DeviceTrend()
+                ring = dev.short if spec is SHORT_RING else dev.long
+                dev.put(ring, spec, float(last_ts), disk, attempts, failures)
+            return len(self._devices)
+
+
+trend_store = TrendStore()
@@ -0,0 +1,247 @@
+"""
+Queue-backed ingest (DASHBOARD_INGEST_MODE=async).
+
+Request handlers validate and classify a check-in, hand it to the writer
+and answer 202 with an ack id; one writer thread drains the bounded queue
+in batched transactions. A full queue is reported as 429 so agents back
+off instead of piling up request threads. Queued check-ins live in memory
+only: they are written on a clean shutdown, but lost if the process dies.
+"""
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+from app import metrics
+from app.delta import delta_states
+from app.ingest import commit_checkins, fan_out_checkins
+from app.records import CheckinRecord
+
+
+INGEST_MODES = ("sync", "async")
+
+
+@dataclass
+class WriterSettings:
+    # Check-ins waiting to be written; beyond this, requests get 429
+    queue_size: int = 10000
+    # Most check-ins written per transaction
+    batch_size: int = 500
+    # How long the writer lets a small batch fill up before committing
+    linger_ms: float = 5.0
+    # Max time spent writing queued check-ins at shutdown
+    drain_timeout_s: float = 30.0
+
+    @classmethod
+    def from_env(cls) -> "WriterSettings":
+        """DASHBOARD_INGEST_* environment variables override the defaults."""
+        env = os.environ
+        d = cls()
+        return cls(
+            queue_size=int(env.get("DASHBOARD_INGEST_QUEUE_SIZE", d.queue_size)),
+            batch_size=int(env.get("DASHBOARD_INGEST_BATCH_SIZE", d.batch_size)),
+            linger_ms=float(env.get("DASHBOARD_INGEST_LINGER_MS", d.linger_ms)),
+            drain_timeout_s=float(env.get("DASHBOARD_INGEST_DRAIN_S", d.drain_timeout_s)),
+        )
+
+
+def _is_busy(e: Exception) -> bool:
+    # A full connection pool is as transient as a locked database
+    return isinstance(e, sqlite3.OperationalError) and (
+        metrics.is_busy_error(e) or "pool exhausted" in str(e)
+    )
+
+
+# (ack id, classified row, devices upsert tuple, enqueue time)
+_Item = Tuple[int, CheckinRecord, Tuple, float]
+
+
+class CheckinWriter:
+    """
+    Bounded FIFO of classified check-ins plus the thread that writes them.
+    Acks are assigned and written in queue order: every ack up to
+    last_committed_ack has been committed (or counted under failed).
+    """
+
+    def __init__(self, settings: WriterSettings) -> None:
+        self.settings = settings
+        self._items: Deque[_Item] = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._drain_deadline = float("inf")
+        self._next_ack = 1
+
+        self._stats: Dict[str, Any] = {
+            "enqueued": 0,
+            "committed": 0,
+            "rejected_full": 0,
+            "failed": 0,
+            "fan_out_errors": 0,
+            "dropped_at_shutdown": 0,
+            "batches": 0,
+            "retries": 0,
+            "last_committed_ack": 0,
+            "last_batch_size": 0,
+            "last_commit_lag_s": None,
+        }
+
+    # -------------------------
+    # Producer side (request handlers)
+    # -------------------------
+    def submit(self, items: Sequence[Tuple[CheckinRecord, Tuple]]) -> Optional[List[int]]:
+        """
+        Queue (row, devices tuple) pairs all-or-nothing.
+        Returns their ack ids, or None if the queue has no room.
+        """
+        now = time.monotonic()
+        with self._cond:
+            if self._stopping or len(self._items) + len(items) > self.settings.queue_size:
+                self._stats["rejected_full"] += len(items)
+                return None
+            first = self._next_ack
+            self._next_ack += len(items)
+            for i, (row, device) in enumerate(items):
+                self._items.append((first + i, row, device, now))
+            self._stats["enqueued"] += len(items)
+            self._cond.notify()
+        return list(range(first, first + len(items)))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            oldest = self._items[0][3] if self._items else None
+            return {
+                **self._stats,
+                "queue_depth": len(self._items),
+                "queue_capacity": self.settings.queue_size,
+                # Age of the oldest check-in still waiting to be written
+                "lag_s": round(time.monotonic() - oldest, 3) if oldest is not None else 0.0,
+            }
+
+    # -------------------------
+    # Writer thread
+    # -------------------------
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="checkin-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> bool:
+        """
+        Refuse new check-ins, write what is queued (up to drain_timeout_s)
+        and stop the thread. Returns True if the queue was fully drained.
+        """
+        with self._cond:
+            self._stopping = True
+            self._drain_deadline = time.monotonic() + self.settings.drain_timeout_s
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(self.settings.drain_timeout_s + 5)
+
+        with self._cond:
+            dropped = list(self._items)
+            left = len(dropped)
+            self._items.clear()
+        if left:
+            delta_states.forget(item[1].device_id for item in dropped)
+            self._stats["dropped_at_shutdown"] += left
+            print(f"[writer] shutdown: {left} queued check-ins not written")
+        return left == 0
+
+    def _next_batch(self) -> List[_Item]:
+        s = self.settings
+        with self._cond:
+            while not self._items and not self._stopping:
+                self._cond.wait()
+            # Give a burst a moment to accumulate into one transaction
+            if 0 < len(self._items) < s.batch_size and not self._stopping and s.linger_ms > 0:
+                self._cond.wait(s.linger_ms / 1000)
+            n = min(len(self._items), s.batch_size)
+            return [self._items.popleft() for _ in range(n)]
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return  # stopping and drained
+            self._write(batch)
+
+    def _write(self, batch: List[_Item]) -> None:
+        rows = [b[1] for b in batch]
+        delay = 0.05
+        while True:
+            try:
+                ids, inserted = commit_checkins(rows, [b[2] for b in batch])
+                break
+            except Exception as e:
+                if _is_busy(e):
+                    # Keep the batch and try again, unless shutdown has run
+                    # out of time
+                    if time.monotonic() > self._drain_deadline:
+                        self._fail(batch, e)
+                        return
+                    self._stats["retries"] += 1
+                    time.sleep(delay)
+                    delay = min(delay * 2, 1.0)
+                    continue
+                # Something in the batch can't be written; isolate it
+                if len(batch) == 1:
+                    self._fail(batch, e)
+                    return
+                for item in batch:
+                    self._write([item])
+                return
+
+        done = time.monotonic()
+        with self._cond:
+            self._stats["committed"] += len(batch)
+            self._stats["batches"] += 1
+            self._stats["last_batch_size"] = len(batch)
+            self._stats["last_committed_ack"] = batch[-1][0]
+            self._stats["last_commit_lag_s"] = round(done - batch[-1][3], 4)
+
+        # The batch is stored whatever happens here: a failing consumer is
+        # logged, not retried (that would answer the rows as duplicates)
+        try:
+            fan_out_checkins(rows, ids, inserted)
+        except Exception as e:
+            with self._cond:
+                self._stats["fan_out_errors"] += 1
+            print(f"[writer] fan-out failed for acks {batch[0][0]}..{batch[-1][0]}: {e!r}")
+
+    def _fail(self, batch: List[_Item], error: Exception) -> None:
+        with self._cond:
+            self._stats["failed"] += len(batch)
+            self._stats["last_committed_ack"] = batch[-1][0]
+        # A delta may have been acknowledged against one of these; make the
+        # agents resend in full rather than patch a check-in never stored
+        delta_states.forget(item[1].device_id for item in batch)
+        print(f"[writer] dropped {len(batch)} check-ins (acks {batch[0][0]}..{batch[-1][0]}): {error!r}")
+
+
+_writer: Optional[CheckinWriter] = None
+
+
+def start_writer(settings: WriterSettings) -> CheckinWriter:
+    global _writer
+    _writer = CheckinWriter(settings)
+    _writer.start()
+    return _writer
+
+
+def get_writer() -> Optional[CheckinWriter]:
+    """The running writer, or None in sync ingest mode."""
+    return _writer
+
+
+def stop_writer() -> bool:
+    global _writer
+    if _writer is None:
+        return True
+    drained = _writer.stop()
+    _writer = None
+    return drained
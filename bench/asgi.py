@@ -0,0 +1,113 @@
+"""
+Minimal in-process ASGI driver for benchmarks: runs the app's lifespan and
+sends HTTP requests straight into it (no sockets, no httpx).
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class AsgiClient:
+    """
+    with AsgiClient(app) as client:
+        status, headers, body = client.request("GET", "/api/devices", headers={...})
+    """
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+        self.loop = asyncio.new_event_loop()
+        self._lifespan_task: Optional[asyncio.Task] = None
+        self._lifespan_in: "asyncio.Queue[Dict[str, Any]]"
+        self._lifespan_out: "asyncio.Queue[Dict[str, Any]]"
+
+    # -------------------------
+    # Lifespan (startup / shutdown events)
+    # -------------------------
+    def __enter__(self) -> "AsgiClient":
+        self.loop.run_until_complete(self._startup())
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.loop.run_until_complete(self._shutdown())
+        self.loop.close()
+
+    async def _startup(self) -> None:
+        self._lifespan_in = asyncio.Queue()
+        self._lifespan_out = asyncio.Queue()
+        scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}
+        self._lifespan_task = asyncio.ensure_future(
+            self.app(scope, self._lifespan_in.get, self._lifespan_out.put)
+        )
+        await self._lifespan_in.put({"type": "lifespan.startup"})
+        message = await self._lifespan_out.get()
+        if message["type"] != "lifespan.startup.complete":
+            raise RuntimeError(f"App startup failed: {message}")
+
+    async def _shutdown(self) -> None:
+        await self._lifespan_in.put({"type": "lifespan.shutdown"})
+        await self._lifespan_out.get()
+        await self._lifespan_task
+
+    # -------------------------
+    # HTTP
+    # -------------------------
+    def request(
+        self,
+        method: str,
+        path: str,
+        headers: Optional[Dict[str, str]] = None,
+        body: bytes = b"",
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        return self.loop.run_until_complete(self._request(method, path, headers or {}, body))
+
+    def post_json(self, path: str, payload: Any, headers: Optional[Dict[str, str]] = None) -> Tuple[int, Any]:
+        h = {"content-type": "application/json", **(headers or {})}
+        status, _, body = self.request("POST", path, h, json.dumps(payload).encode("utf-8"))
+        return status, json.loads(body) if body else None
+
+    async def _request(self, method: str, path: str, headers: Dict[str, str], body: bytes) -> Tuple[int, Dict[str, str], bytes]:
+        raw_path, _, query = path.partition("?")
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": raw_path,
+            "raw_path": raw_path.encode("ascii"),
+            "query_string": query.encode("ascii"),
+            "root_path": "",
+            "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()],
+            "client": ("127.0.0.1", 50000),
+            "server": ("bench", 80),
+            "state": {},
+        }
+        sent_body = False
+
+        async def receive() -> Dict[str, Any]:
+            nonlocal sent_body
+            if not sent_body:
+                sent_body = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            # The app only asks again to watch for a disconnect
+            await asyncio.Event().wait()
+            return {"type": "http.disconnect"}
+
+        status = 0
+        response_headers: Dict[str, str] = {}
+        chunks: List[bytes] = []
+
+        async def send(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_headers.update(
+                    (k.decode("latin-1"), v.decode("latin-1")) for k, v in message.get("headers", [])
+                )
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, send)
+        return status, response_headers, b"".join(chunks)
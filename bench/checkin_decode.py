@@ -0,0 +1,123 @@
+"""
+Micro-benchmark: CPU per /api/checkin request body, from raw bytes to a
+classified row ready for INSERT (no database, no HTTP).
+
+  python -m bench.checkin_decode [--n 20000]
+
+  pydantic  json.loads -> CheckinPayload.model_validate -> model_dump ->
+            the insert dict built by hand, raw_json via the standard
+            library (the request path before app/decode.py)
+  fast      app.decode fast path (orjson)
+
+Both produce the same stored form: epoch-ms timestamps and raw_json
+compressed as DASHBOARD_RAW_PAYLOAD=zlib stores it.
+
+Classification is left out of both: it costs the same compiled rules either
+way and bench/run.py reports it separately (classify rows/s).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import time
+from typing import Any, Callable, Dict, List
+
+import simulate_checkins as sim
+from app.decode import decode_checkin_body
+from app.models import CheckinPayload
+from app.rawcodec import compress_json
+from app.timeutil import to_epoch_ms
+
+
+def make_bodies(n: int) -> List[bytes]:
+    random.seed(42)
+    modes = [None] * 8 + ["low_disk_red", "crashy_yellow", "mypc_auth_fail_yellow", "slow_auth_yellow"]
+    bodies = []
+    for i in range(n):
+        payload = sim.base_metrics(f"PUBPC-{i % 500:03d}")
+        mode = random.choice(modes)
+        if mode:
+            payload = sim.apply_mode(payload, mode)
+        bodies.append(json.dumps(payload).encode("utf-8"))
+    return bodies
+
+
+def _bool(v: Any) -> Any:
+    return None if v is None else (1 if v else 0)
+
+
+def pydantic_path(body: bytes) -> Dict[str, Any]:
+    d = CheckinPayload.model_validate(json.loads(body)).model_dump()
+    m = d["metrics"]
+    av, st, sto, sec, net, mypc = (
+        m["availability"], m["stability"], m["storage"], m["security"], m["network"], m["mypc"]
+    )
+    return {
+        "device_id": d["device_id"],
+        "timestamp_utc": to_epoch_ms(d["timestamp_utc"]),
+        "agent_version": d["agent_version"],
+        "last_boot_utc": to_epoch_ms(av["last_boot_utc"]),
+        "uptime_seconds": av["uptime_seconds"],
+        "unexpected_shutdowns": st["unexpected_shutdowns"],
+        "app_crashes": st["app_crashes"],
+        "service_restarts": st["service_restarts"],
+        "hang_indicators": st.get("hang_indicators"),
+        "disk_c_free_gb": sto["disk_c_free_gb"],
+        "disk_c_free_pct": sto["disk_c_free_pct"],
+        "disk_errors": sto.get("disk_errors"),
+        "profile_errors": sto.get("profile_errors"),
+        "av_enabled": _bool(sec["av_enabled"]),
+        "av_sig_age_days": sec["av_sig_age_days"],
+        "pending_reboot": _bool(sec["pending_reboot"]),
+        "update_failures": sec.get("update_failures"),
+        "dns_ok": _bool(net["dns_ok"]),
+        "gateway_ok": _bool(net["gateway_ok"]),
+        "backend_reachable": _bool(net.get("backend_reachable")),
+        "network_resets": net.get("network_resets"),
+        "mypc_client_running": _bool(mypc.get("client_running")),
+        "mypc_auth_attempts": mypc["auth"]["attempts"],
+        "mypc_auth_successes": mypc["auth"]["successes"],
+        "mypc_auth_failures": mypc["auth"]["failures"],
+        "mypc_auth_failures_by_reason_json": json.dumps(mypc["auth"]["failures_by_reason"], ensure_ascii=False),
+        "mypc_service_connect_failures": mypc["connectivity"]["service_connect_failures"],
+        "mypc_time_to_service_ready_s": mypc["connectivity"].get("time_to_service_ready_s"),
+        "mypc_last_error_category": mypc["connectivity"].get("last_error_category"),
+        "mypc_avg_auth_ms": mypc["login_perf"].get("avg_auth_ms"),
+        "mypc_p95_auth_ms": mypc["login_perf"].get("p95_auth_ms"),
+        "mypc_slow_login_count": mypc["login_perf"].get("slow_login_count"),
+        "raw_json": compress_json(json.dumps(d, ensure_ascii=False, separators=(",", ":"))),
+    }
+
+
+def fast_path(body: bytes) -> Any:
+    return decode_checkin_body(body)
+
+
+def measure(fn: Callable[[bytes], Any], bodies: List[bytes]) -> float:
+    """CPU microseconds per body (best of 3)."""
+    best = float("inf")
+    for _ in range(3):
+        start = time.process_time()
+        for body in bodies:
+            fn(body)
+        best = min(best, time.process_time() - start)
+    return best / len(bodies) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m bench.checkin_decode")
+    parser.add_argument("--n", type=int, default=20000, help="request bodies per run")
+    args = parser.parse_args()
+
+    bodies = make_bodies(args.n)
+    before = measure(pydantic_path, bodies)
+    after = measure(fast_path, bodies)
+
+    print(f"bodies: {args.n}  avg size: {sum(map(len, bodies)) // len(bodies)} B")
+    print(f"pydantic   {before:8.1f} us/request")
+    print(f"fast       {after:8.1f} us/request  ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Benchmark suite for the ingest and dashboard read paths.
+
+  python -m bench.run [--sizes 200x50,1000x100] [--out bench/results/latest.json]
+                      [--baseline FILE] [--tolerance 0.15] [--save-baseline FILE]
+
+For each database size (devices x check-ins per device) a fresh database is
+seeded with deterministic synthetic data, then the app is driven in-process
+through its ASGI interface:
+
+  devices_latest_ms    GET /api/devices (full fleet)            p50 / p95
+  device_detail_ms     GET /api/devices/{id}                    p50 / p95
+  ingest_single_cps    POST /api/checkin, one at a time         check-ins/s
+  ingest_batch_cps     POST /api/checkins/batch (100 per call)  check-ins/s
+
+plus classify_ops (compiled health rules, rows/s) once. Results are written
+as JSON; with --baseline every metric is compared and regressions beyond
+--tolerance make the exit status 1.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+API_HEADERS = {"x-api-key": "dev-secret-key"}
+
+
+def parse_sizes(spec: str) -> List[Tuple[int, int]]:
+    sizes = []
+    for part in spec.split(","):
+        devices, per_device = part.lower().split("x")
+        sizes.append((int(devices), int(per_device)))
+    return sizes
+
+
+def percentiles(samples_ms: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples_ms)
+    pick = lambda p: ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+    return {"p50": round(pick(50), 3), "p95": round(pick(95), 3)}
+
+
+def timed_requests(fn: Callable[[int], None], n: int, warmup: int = 5) -> List[float]:
+    for i in range(warmup):
+        fn(i)
+    out = []
+    for i in range(n):
+        start = time.perf_counter()
+        fn(i)
+        out.append((time.perf_counter() - start) * 1000)
+    return out
+
+
+def bench_size(devices: int, per_device: int, reads: int, ingest_n: int) -> Dict[str, Any]:
+    # Imported here so DASHBOARD_DB_PATH for this size is in place first
+    from app.db import DBSettings, configure, connection, init_db
+    from app.ingest import reset_ingest_caches
+    from app.main import SCHEMA_PATH, app
+    from bench.asgi import AsgiClient
+    from bench.seed import FleetGenerator, seed_database
+
+    configure(DBSettings.from_env())
+    init_db(SCHEMA_PATH)
+    # The previous size's retry keys would answer this size's check-ins
+    reset_ingest_caches()
+    gen = FleetGenerator(devices)
+    start = time.perf_counter()
+    rows = seed_database(gen, per_device)
+    seed_s = time.perf_counter() - start
+
+    with connection() as conn:
+        stored = conn.execute("SELECT COUNT(*) FROM checkins").fetchone()[0]
+    if stored != rows or rows != devices * per_device:
+        raise RuntimeError(f"seeded {stored} check-ins ({rows} reported), expected {devices * per_device}")
+
+    result: Dict[str, Any] = {"devices": devices, "rows": rows, "seed_s": round(seed_s, 2)}
+    with AsgiClient(app) as client:
+        def get_devices(_: int) -> None:
+            status, _, _ = client.request("GET", "/api/devices", API_HEADERS)
+            assert status == 200, status
+
+        def get_detail(i: int) -> None:
+            dev = gen.device_ids[i * 7919 % devices]
+            status, _, _ = client.request("GET", f"/api/devices/{dev}", API_HEADERS)
+            assert status == 200, status
+
+        result["devices_latest_ms"] = percentiles(timed_requests(get_devices, reads))
+        result["device_detail_ms"] = percentiles(timed_requests(get_detail, reads * 5))
+
+        payloads = gen.live(ingest_n * 2)
+        single, batch = payloads[:ingest_n], payloads[ingest_n:]
+
+        start = time.perf_counter()
+        for p in single:
+            status, body = client.post_json("/api/checkin", p, API_HEADERS)
+            assert status in (200, 202) and not body.get("duplicate"), (status, body)
+        result["ingest_single_cps"] = round(len(single) / (time.perf_counter() - start), 1)
+
+        start = time.perf_counter()
+        for i in range(0, len(batch), 100):
+            status, body = client.post_json("/api/checkins/batch", batch[i:i + 100], API_HEADERS)
+            assert status in (200, 202), status
+            assert not any(r.get("duplicate") for r in body["results"]), body
+        result["ingest_batch_cps"] = round(len(batch) / (time.perf_counter() - start), 1)
+
+    return result
+
+
+def bench_classify(n: int = 20000) -> float:
+    from app.decode import decode_checkin
+    from app.health_rules import classify
+    from bench.seed import FleetGenerator
+
+    gen = FleetGenerator(500)
+    records = [decode_checkin(p) for p in gen.live(n)]
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for r in records:
+            classify(r, r.location_tag)
+        best = min(best, time.perf_counter() - start)
+    return round(n / best, 1)
+
+
+# -------------------------
+# Baseline comparison
+# -------------------------
+def flatten(results: Dict[str, Any]) -> Dict[str, float]:
+    """{"size/metric[.pXX]": value} for every comparable number."""
+    flat: Dict[str, float] = {"classify_ops": results["classify_ops"]}
+    for size in results["sizes"]:
+        label = f"{size['devices']}x{size['rows'] // size['devices']}"
+        for key, value in size.items():
+            if isinstance(value, dict):
+                for p, v in value.items():
+                    flat[f"{label}/{key}.{p}"] = v
+            elif key.endswith(("_cps", "_ms")):
+                flat[f"{label}/{key}"] = value
+    return flat
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Print a comparison table; returns the regressed metric names."""
+    cur, base = flatten(current), flatten(baseline)
+    regressions = []
+    print(f"\n{'metric':45} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name in sorted(set(cur) & set(base)):
+        b, c = base[name], cur[name]
+        if not b:
+            continue
+        # Latencies: lower is better; throughputs / ops: higher is better
+        lower_better = "_ms" in name
+        change = (c - b) / b
+        worse = change > tolerance if lower_better else change < -tolerance
+        flag = "  REGRESSION" if worse else ""
+        print(f"{name:45} {b:12.3f} {c:12.3f} {change:+7.1%}{flag}")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m bench.run")
+    parser.add_argument("--sizes", default="200x50,1000x100", help="DEVICESxCHECKINS_PER_DEVICE,...")
+    parser.add_argument("--reads", type=int, default=50, help="timed fleet reads per size")
+    parser.add_argument("--ingest", type=int, default=1000, help="check-ins per ingest run")
+    parser.add_argument("--out", default=str(RESULTS_DIR / "latest.json"))
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative slowdown")
+    parser.add_argument("--save-baseline", help="also write the results here")
+    args = parser.parse_args()
+
+    results: Dict[str, Any] = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "sizes": [],
+    }
+
+    for devices, per_device in parse_sizes(args.sizes):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.environ["DASHBOARD_DB_PATH"] = str(Path(tmp) / "bench.db")
+            print(f"[{devices} devices x {per_device} check-ins] seeding...", flush=True)
+            size = bench_size(devices, per_device, args.reads, args.ingest)
+            print(f"  {json.dumps(size)}", flush=True)
+            results["sizes"].append(size)
+
+    results["classify_ops"] = bench_classify()
+    print(f"classify: {results['classify_ops']} rows/s")
+
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=2))
+    print(f"results written to {out}")
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps(results, indent=2))
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
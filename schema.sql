@@ -8,22 +8,24 @@ CREATE TABLE IF NOT EXISTS devices (
   device_id TEXT PRIMARY KEY,
   location_tag TEXT,
   last_ip TEXT,
-  first_seen_utc TEXT,
-  last_seen_utc TEXT
+  first_seen_utc INTEGER,  -- epoch ms
+  last_seen_utc INTEGER    -- epoch ms
 );
 
 -- =========================
 -- Check-ins table
 -- Time-series health data
+-- Timestamps are UTC epoch milliseconds (normalized on ingest); the API
+-- shows them as ISO 8601
 -- =========================
 CREATE TABLE IF NOT EXISTS checkins (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   device_id TEXT NOT NULL,
-  timestamp_utc TEXT NOT NULL,
+  timestamp_utc INTEGER NOT NULL,
   agent_version TEXT NOT NULL,
 
   -- Availability
-  last_boot_utc TEXT NOT NULL,
+  last_boot_utc INTEGER NOT NULL,
   uptime_seconds INTEGER NOT NULL,
 
   -- Stability
@@ -79,12 +81,91 @@ CREATE TABLE IF NOT EXISTS checkins (
   FOREIGN KEY (device_id) REFERENCES devices(device_id)
 );
 
+-- =========================
+-- Latest state per device
+-- Maintained on ingest in the same transaction as the check-in insert,
+-- so the fleet view reads O(fleet) rows instead of scanning history.
+-- Rebuild for existing databases: python -m app.cli rebuild-latest
+-- =========================
+CREATE TABLE IF NOT EXISTS device_latest (
+  device_id TEXT PRIMARY KEY,
+  checkin_id INTEGER NOT NULL,
+  timestamp_utc INTEGER NOT NULL,  -- epoch ms
+  computed_status TEXT,
+  severity INTEGER NOT NULL,  -- offline=4, red=3, yellow/stale=2, green=1
+  version INTEGER NOT NULL DEFAULT 0,  -- fleet_version when this row last changed
+  liveness TEXT,  -- NULL while reporting, 'stale' / 'offline' once check-ins stop
+
+  FOREIGN KEY (device_id) REFERENCES devices(device_id),
+  FOREIGN KEY (checkin_id) REFERENCES checkins(id)
+);
+
+-- =========================
+-- Time-bucketed rollups
+-- 5 min / 1 h / 1 day buckets per device and per location_tag,
+-- merged on ingest (or rebuilt: python -m app.cli rollup-catchup)
+-- disk = disk_c_free_pct, afr = auth failure rate, p95 = mypc_p95_auth_ms
+-- =========================
+CREATE TABLE IF NOT EXISTS rollups (
+  scope TEXT NOT NULL,            -- 'device' | 'location'
+  scope_key TEXT NOT NULL,        -- device_id or location_tag
+  bucket_s INTEGER NOT NULL,      -- 300 | 3600 | 86400
+  bucket_start INTEGER NOT NULL,  -- epoch seconds
+
+  n INTEGER NOT NULL,
+  green INTEGER NOT NULL,
+  yellow INTEGER NOT NULL,
+  red INTEGER NOT NULL,
+  auth_attempts INTEGER NOT NULL,
+  auth_failures INTEGER NOT NULL,
+  last_ts INTEGER NOT NULL,       -- epoch ms of newest sample
+
+  disk_n INTEGER NOT NULL,
+  disk_min REAL,
+  disk_max REAL,
+  disk_sum REAL NOT NULL,
+  disk_last REAL,
+
+  afr_n INTEGER NOT NULL,
+  afr_min REAL,
+  afr_max REAL,
+  afr_sum REAL NOT NULL,
+  afr_last REAL,
+
+  p95_n INTEGER NOT NULL,
+  p95_min REAL,
+  p95_max REAL,
+  p95_sum REAL NOT NULL,
+  p95_last REAL,
+
+  PRIMARY KEY (scope, scope_key, bucket_s, bucket_start)
+) WITHOUT ROWID;
+
+-- =========================
+-- Small key/value state
+-- fleet_version: bumped whenever device_latest changes (ETag / ?since=)
+-- =========================
+CREATE TABLE IF NOT EXISTS meta (
+  key TEXT PRIMARY KEY,
+  value INTEGER NOT NULL
+);
+
+INSERT OR IGNORE INTO meta (key, value) VALUES ('fleet_version', 0);
+
 -- =========================
 -- Indexes for performance
 -- =========================
-CREATE INDEX IF NOT EXISTS idx_checkins_device_time
+-- One row per device and timestamp: an agent retrying a check-in gets the
+-- stored result instead of a second row (older databases are deduplicated
+-- once by init_db)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_checkins_device_time_unique
   ON checkins(device_id, timestamp_utc);
 
 CREATE INDEX IF NOT EXISTS idx_checkins_time
   ON checkins(timestamp_utc);
 
+CREATE INDEX IF NOT EXISTS idx_device_latest_severity
+  ON device_latest(severity DESC, device_id);
+
+CREATE INDEX IF NOT EXISTS idx_device_latest_version
+  ON device_latest(version);
@@ -1,9 +1,22 @@
+"""
+Device check-in simulator.
+
+  python simulate_checkins.py            # 30 devices, readable output
+  python simulate_checkins.py load ...   # load generator, see --help
+"""
 from __future__ import annotations
 
+import argparse
+import copy
+import json
+import math
 import random
+import threading
 import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional, Tuple
 
 import requests
 
@@ -24,13 +37,15 @@ def boot_time(uptime_seconds: int) -> str:
 
 
 def make_device_ids(n: int) -> List[str]:
-    # Example naming: PUBPC-01 .. PUBPC-30
-    return [f"PUBPC-{i:02d}" for i in range(1, n + 1)]
+    # Example naming: PUBPC-01 .. PUBPC-30 (wider numbers for big fleets)
+    width = max(2, len(str(n)))
+    return [f"PUBPC-{i:0{width}d}" for i in range(1, n + 1)]
 
 
-def choose_bad_actors(device_ids: List[str]) -> Dict[str, str]:
+def choose_bad_actors(device_ids: List[str], per_mode: int = 1) -> Dict[str, str]:
     """
     Assign specific failure modes to a few devices so the dashboard has interesting data.
+    per_mode devices get each mode (scale it up with the fleet).
     Returns: device_id -> mode
     """
     modes = [
@@ -44,8 +59,8 @@ def choose_bad_actors(device_ids: List[str]) -> Dict[str, str]:
         "slow_auth_yellow",
     ]
     random.shuffle(device_ids)
-    chosen = device_ids[: len(modes)]
-    return {dev: mode for dev, mode in zip(chosen, modes)}
+    chosen = device_ids[: len(modes) * per_mode]
+    return {dev: modes[i % len(modes)] for i, dev in enumerate(chosen)}
 
 
 def base_metrics(device_id: str) -> Dict:
@@ -194,17 +209,121 @@ def apply_mode(payload: Dict, mode: str) -> Dict:
     return payload
 
 
-def post_checkin(payload: Dict) -> None:
+def post_checkin(payload: Dict, retries: int = 2) -> None:
     headers = {"X-API-Key": API_KEY}
-    r = requests.post(API_URL, json=payload, headers=headers, timeout=5)
+    # Like a real agent, resend the same check-in after a timeout; the
+    # server answers a retry of a stored check-in with the original result
+    for attempt in range(retries + 1):
+        try:
+            r = requests.post(API_URL, json=payload, headers=headers, timeout=5)
+            break
+        except requests.Timeout:
+            if attempt == retries:
+                raise
     if r.status_code != 200:
         print(f"[{payload['device_id']}] ERROR {r.status_code}: {r.text}")
     else:
         out = r.json()
-        print(f"[{payload['device_id']}] {out.get('computed_status')} {out.get('reasons')}")
+        dup = " (retry)" if out.get("duplicate") else ""
+        print(f"[{payload['device_id']}] {out.get('computed_status')} {out.get('reasons')}{dup}")
+
+
+def make_payload(dev: str, bad_map: Dict[str, str]) -> Dict:
+    payload = base_metrics(dev)
+    if dev in bad_map:
+        payload = apply_mode(payload, bad_map[dev])
+
+    # slight variability each cycle
+    if random.random() < 0.05:
+        payload["metrics"]["security"]["pending_reboot"] = True
+    if random.random() < 0.05:
+        payload["metrics"]["storage"]["disk_c_free_pct"] = round(
+            max(1.0, payload["metrics"]["storage"]["disk_c_free_pct"] - random.uniform(1, 5)), 1
+        )
+    return payload
+
+
+def next_payload(prev: Dict, dev: str, bad_map: Dict[str, str]) -> Dict:
+    """The device's next check-in: later timestamp, a few values moved."""
+    payload = copy.deepcopy(prev)
+    payload["timestamp_utc"] = utc_now()
+    m = payload["metrics"]
+
+    boot = datetime.fromisoformat(m["availability"]["last_boot_utc"])
+    m["availability"]["uptime_seconds"] = int((datetime.now(timezone.utc) - boot).total_seconds())
+    if random.random() < 0.3:
+        # someone logged in
+        m["mypc"]["auth"]["attempts"] += 1
+        m["mypc"]["auth"]["successes"] += 1
+    if random.random() < 0.1:
+        storage = m["storage"]
+        used_gb = random.uniform(0, 0.5)
+        storage["disk_c_free_gb"] = round(max(0.5, storage["disk_c_free_gb"] - used_gb), 1)
+        storage["disk_c_free_pct"] = round(max(1.0, storage["disk_c_free_pct"] - used_gb / 2), 1)
+    if random.random() < 0.02:
+        m["security"]["pending_reboot"] = not m["security"]["pending_reboot"]
+    if dev in bad_map and random.random() < 0.2:
+        apply_mode(payload, bad_map[dev])
+    return payload
+
 
+def merge_patch_for(old: Dict, new: Dict) -> Dict:
+    """
+    RFC 7396 merge patch turning old into new (what /api/checkin/delta
+    takes). A field that became null is sent as a removal, which the
+    server reads back as the default null.
+    """
+    patch: Dict = {}
+    for key, value in new.items():
+        before = old.get(key)
+        if isinstance(value, dict) and isinstance(before, dict):
+            sub = merge_patch_for(before, value)
+            if sub:
+                patch[key] = sub
+        elif key not in old or type(value) is not type(before) or value != before:
+            patch[key] = value
+    for key in old:
+        if key not in new:
+            patch[key] = None
+    return patch
+
+
+def encode(body) -> bytes:
+    return json.dumps(body, separators=(",", ":")).encode("utf-8")
+
+
+class DeltaAgent:
+    """
+    One device's side of the delta protocol. A seq is never reused for
+    different content, so a request that failed just burns its seq and
+    the next delta is still against the last acknowledged one.
+    """
 
-def main() -> None:
+    def __init__(self, dev: str) -> None:
+        self.dev = dev
+        self.lock = threading.Lock()
+        self.next_seq = 1
+        self.acked_seq: Optional[int] = None
+        self.acked: Optional[Dict] = None  # payload acknowledged with acked_seq
+
+    def body(self, payload: Dict, full: bool = False) -> Dict:
+        seq = self.next_seq
+        self.next_seq += 1
+        if full or self.acked is None:
+            return {"device_id": self.dev, "seq": seq, "checkin": payload}
+        return {
+            "device_id": self.dev,
+            "seq": seq,
+            "base_seq": self.acked_seq,
+            "checkin": merge_patch_for(self.acked, payload),
+        }
+
+    def ack(self, body: Dict, payload: Dict) -> None:
+        self.acked_seq = body["seq"]
+        self.acked = payload
+
+
+def run_simple() -> None:
     device_ids = make_device_ids(FLEET_SIZE)
     bad_map = choose_bad_actors(device_ids)
 
@@ -218,24 +337,235 @@ def main() -> None:
     while True:
         # each loop sends one check-in per device (with small jitter)
         for dev in device_ids:
-            payload = base_metrics(dev)
-            if dev in bad_map:
-                payload = apply_mode(payload, bad_map[dev])
-
-            # slight variability each cycle
-            if random.random() < 0.05:
-                payload["metrics"]["security"]["pending_reboot"] = True
-            if random.random() < 0.05:
-                payload["metrics"]["storage"]["disk_c_free_pct"] = round(
-                    max(1.0, payload["metrics"]["storage"]["disk_c_free_pct"] - random.uniform(1, 5)), 1
-                )
-
-            post_checkin(payload)
+            post_checkin(make_payload(dev, bad_map))
             time.sleep(random.uniform(0.05, 0.20))
 
         time.sleep(INTERVAL_SECONDS)
 
 
+# -------------------------
+# Load mode
+# -------------------------
+def rate_profile(name: str, rate: float, devices: int, storm_at: float, storm_s: float) -> Callable[[float], float]:
+    """
+    Target check-ins/second at time t (seconds since start).
+
+    steady      constant rate
+    ramp        linear 0 -> rate over the first storm_at seconds, then rate
+    boot_storm  rate, plus every device checking in once within storm_s
+                seconds starting at storm_at (the 9 AM mass boot)
+    """
+    if name == "steady":
+        return lambda t: rate
+    if name == "ramp":
+        return lambda t: rate * min(1.0, t / storm_at) if storm_at > 0 else rate
+    if name == "boot_storm":
+        extra = devices / storm_s
+        return lambda t: rate + (extra if storm_at <= t < storm_at + storm_s else 0.0)
+    raise ValueError(f"Unknown profile {name}")
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    k = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+class LoadStats:
+    """Per-request results, shared by the worker threads."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.latencies_ms = array("d")
+        self.status: Dict[str, int] = {}
+        self.checkins_ok = 0
+        self.requests = 0
+        self.body_bytes = 0
+        self.full_bytes = 0  # the same check-ins sent as full payloads
+
+    def record(self, status: str, latency_ms: float, checkins: int, body_bytes: int = 0, full_bytes: int = 0) -> None:
+        with self.lock:
+            self.requests += 1
+            self.body_bytes += body_bytes
+            self.full_bytes += full_bytes
+            self.latencies_ms.append(latency_ms)
+            self.status[status] = self.status.get(status, 0) + 1
+            if status in ("200", "202"):
+                self.checkins_ok += checkins
+
+
+def run_load(args: argparse.Namespace) -> None:
+    device_ids = make_device_ids(args.devices)
+    bad_map = choose_bad_actors(list(device_ids), per_mode=max(1, int(args.devices * args.bad_fraction / 8)))
+    # Each device stays at one location, so per-location rollups make sense
+    locations = {dev: LOCATION_TAGS[i % len(LOCATION_TAGS)] for i, dev in enumerate(device_ids)}
+    rate_at = rate_profile(args.profile, args.rate, args.devices, args.storm_at, args.storm_seconds)
+
+    base = args.url.rstrip("/")
+    if args.delta:
+        url = base + "/api/checkin/delta"
+    else:
+        url = base + ("/api/checkins/batch" if args.batch > 1 else "/api/checkin")
+    headers = {"X-API-Key": API_KEY, "Content-Type": "application/json"}
+    agents = {dev: DeltaAgent(dev) for dev in device_ids} if args.delta else {}
+    local = threading.local()
+    stats = LoadStats()
+    # Bounds requests in flight; when the server can't keep up the
+    # scheduler falls behind and the achieved rate shows it
+    in_flight = threading.BoundedSemaphore(args.workers * 2)
+
+    def post(session: requests.Session, data: bytes) -> Tuple[Optional[requests.Response], str, float]:
+        start = time.perf_counter()
+        try:
+            r = session.post(url, data=data, headers=headers, timeout=args.timeout)
+            status = str(r.status_code)
+        except requests.RequestException as e:
+            r, status = None, type(e).__name__
+        return r, status, (time.perf_counter() - start) * 1000
+
+    def send_delta(session: requests.Session, dev: str) -> None:
+        agent = agents[dev]
+        with agent.lock:
+            if agent.acked is None:
+                payload = make_payload(dev, bad_map)
+                payload["location_tag"] = locations[dev]
+            else:
+                payload = next_payload(agent.acked, dev, bad_map)
+            full = len(encode(payload))
+            body = agent.body(payload)
+            data = encode(body)
+            _, status, ms = post(session, data)
+            stats.record(status, ms, 1, len(data), full)
+            if status == "409":
+                # The server lost track of this device: resend in full
+                body = agent.body(payload, full=True)
+                data = encode(body)
+                _, status, ms = post(session, data)
+                stats.record(status, ms, 1, len(data), 0)
+            if status in ("200", "202"):
+                agent.ack(body, payload)
+
+    def send(devs: List[str]) -> None:
+        session = getattr(local, "session", None)
+        if session is None:
+            # One keep-alive connection per worker thread
+            session = local.session = requests.Session()
+        if args.delta:
+            try:
+                send_delta(session, devs[0])
+            finally:
+                in_flight.release()
+            return
+
+        payloads = []
+        for dev in devs:
+            p = make_payload(dev, bad_map)
+            p["location_tag"] = locations[dev]
+            payloads.append(p)
+        data = encode(payloads if args.batch > 1 else payloads[0])
+
+        try:
+            _, status, ms = post(session, data)
+        finally:
+            in_flight.release()
+        stats.record(status, ms, len(devs), len(data), len(data))
+
+    print(
+        f"Load: {args.devices} devices, profile={args.profile}, rate={args.rate}/s, "
+        f"batch={args.batch}, workers={args.workers}, duration={args.duration}s, "
+        f"bad actors={len(bad_map)}{', delta' if args.delta else ''}"
+    )
+
+    started = time.perf_counter()
+    next_report = started + args.report_every
+    scheduled = started  # when the next request is due
+    sent = 0
+    device_idx = 0
+
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        while True:
+            now = time.perf_counter()
+            t = now - started
+            if t >= args.duration:
+                break
+
+            if now < scheduled:
+                time.sleep(min(scheduled - now, 0.05))
+                continue
+
+            rate = rate_at(t)
+            if rate <= 0:
+                scheduled = now + 0.05
+                continue
+
+            sent += args.batch
+            devs = [device_ids[(device_idx + i) % len(device_ids)] for i in range(args.batch)]
+            device_idx = (device_idx + args.batch) % len(device_ids)
+            in_flight.acquire()
+            pool.submit(send, devs)
+            scheduled += args.batch / rate
+            # Don't try to "catch up" a backlog of more than a second
+            scheduled = max(scheduled, time.perf_counter() - 1.0)
+
+            if now >= next_report:
+                with stats.lock:
+                    ok, reqs = stats.checkins_ok, stats.requests
+                print(f"  t={t:6.1f}s target={rate:8.1f}/s sent={sent} ok={ok} requests={reqs}")
+                next_report += args.report_every
+
+    elapsed = time.perf_counter() - started
+    lat = sorted(stats.latencies_ms)
+    print("")
+    print(f"Duration:    {elapsed:.1f}s")
+    print(f"Requests:    {stats.requests} ({stats.requests / elapsed:.1f}/s)")
+    print(f"Check-ins:   {stats.checkins_ok} accepted ({stats.checkins_ok / elapsed:.1f}/s)")
+    print(f"Status:      {dict(sorted(stats.status.items()))}")
+    print(
+        "Latency ms:  "
+        f"p50={percentile(lat, 50):.1f} p95={percentile(lat, 95):.1f} "
+        f"p99={percentile(lat, 99):.1f} max={lat[-1] if lat else float('nan'):.1f}"
+    )
+    print(f"Body bytes:  {stats.body_bytes} ({stats.body_bytes / max(1, stats.requests):.0f}/request)")
+    if args.delta and stats.full_bytes:
+        print(
+            f"Full bytes:  {stats.full_bytes} as full payloads "
+            f"(delta sent {100 * stats.body_bytes / stats.full_bytes:.1f}%)"
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python simulate_checkins.py")
+    sub = parser.add_subparsers(dest="command")
+
+    p = sub.add_parser("load", help="generate load from a large simulated fleet")
+    p.add_argument("--devices", type=int, default=10000)
+    p.add_argument("--rate", type=float, default=200.0, help="target check-ins per second")
+    p.add_argument("--duration", type=float, default=60.0, help="seconds")
+    p.add_argument("--profile", choices=["steady", "ramp", "boot_storm"], default="steady")
+    p.add_argument("--storm-at", type=float, default=10.0, help="boot storm start / ramp length (s)")
+    p.add_argument("--storm-seconds", type=float, default=60.0, help="boot storm length (s)")
+    p.add_argument("--batch", type=int, default=1, help="check-ins per request (>1 uses the batch endpoint)")
+    p.add_argument("--workers", type=int, default=64, help="concurrent connections")
+    p.add_argument(
+        "--delta",
+        action="store_true",
+        help="send changes only, via /api/checkin/delta (devices evolve instead of re-randomizing)",
+    )
+    p.add_argument("--bad-fraction", type=float, default=0.03, help="share of devices with a failure mode")
+    p.add_argument("--timeout", type=float, default=10.0)
+    p.add_argument("--report-every", type=float, default=5.0)
+    p.add_argument("--url", default=API_URL.rsplit("/api/", 1)[0], help="API base URL")
+
+    args = parser.parse_args(argv)
+    if args.command == "load":
+        if args.delta and args.batch > 1:
+            parser.error("--delta sends one check-in per request (no --batch)")
+        run_load(args)
+    else:
+        run_simple()
+
+
 if __name__ == "__main__":
     main()
 
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Iterator, Optional
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import db
+from app.decode import decode_checkin
+from app.ingest import reset_ingest_caches, store_checkins
+from app.main import SCHEMA_PATH, app
+from app.summary import fleet_summary
+from app.timeutil import from_epoch_ms, to_epoch_ms
+from app.trends import trend_store
+
+
+_API_KEY_HEADERS = {"x-api-key": "dev-secret-key"}
+
+HOUR_MS = 3600 * 1000
+DAY_MS = 24 * HOUR_MS
+# "Now" for the seeded history (retention runs are given it explicitly)
+HISTORY_NOW_MS = to_epoch_ms("2026-06-01T12:34:00Z")
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch) -> Iterator[str]:
+    """A fresh database, configured the way startup() does it."""
+    path = tmp_path / "dashboard.db"
+    monkeypatch.setenv("DASHBOARD_DB_PATH", str(path))
+    db.configure(db.DBSettings.from_env())
+    db.init_db(SCHEMA_PATH)
+    # Module-level state outlives a database (startup() does the same)
+    reset_ingest_caches()
+    trend_store.seed_from_rollups()
+    fleet_summary.seed()
+    yield str(path)
+    db.close_pool()
+
+
+@pytest.fixture
+def client(db_path) -> Iterator[TestClient]:
+    """The app with startup run against db_path; requests carry the API key."""
+    with TestClient(app, headers=_API_KEY_HEADERS) as c:
+        yield c
+
+
+def make_checkin(
+    device_id: str,
+    ts_ms: int,
+    location_tag: Optional[str] = "Library",
+    disk_pct: float = 60.0,
+    av_enabled: bool = True,
+) -> Dict[str, Any]:
+    """A healthy check-in payload (red with disk_pct < 10 or av_enabled=False)."""
+    return {
+        "device_id": device_id,
+        "timestamp_utc": from_epoch_ms(ts_ms),
+        "agent_version": "test-1.0",
+        "ip_address": "10.0.10.20",
+        "location_tag": location_tag,
+        "metrics": {
+            "availability": {"last_boot_utc": from_epoch_ms(ts_ms - 3600_000), "uptime_seconds": 3600},
+            "stability": {"unexpected_shutdowns": 0, "app_crashes": 0, "service_restarts": 0},
+            "storage": {"disk_c_free_gb": 100.0, "disk_c_free_pct": disk_pct},
+            "security": {"av_enabled": av_enabled, "av_sig_age_days": 1, "pending_reboot": False},
+            "network": {"dns_ok": True, "gateway_ok": True, "backend_reachable": True},
+            "mypc": {
+                "client_running": True,
+                "auth": {"attempts": 4, "successes": 3, "failures": 1, "failures_by_reason": {"invalid_credentials": 1}},
+                "connectivity": {"service_connect_failures": 0},
+                "login_perf": {"avg_auth_ms": 800.0, "p95_auth_ms": 1500.0},
+            },
+        },
+    }
+
+
+@pytest.fixture
+def checkin() -> Callable[..., Dict[str, Any]]:
+    return make_checkin
+
+
+@pytest.fixture
+def history(db_path) -> int:
+    """
+    13 stored check-ins around a 90-day retention cutoff: 8 older than it
+    (6 long gone, one an hour before; both devices keep a newer row) and
+    5 after it, one red. Returns the "now" they were written against.
+    """
+    cutoff_ms = HISTORY_NOW_MS - 90 * DAY_MS
+
+    def store(device_id, times_ms, **kw):
+        store_checkins([decode_checkin(make_checkin(device_id, ts, **kw)) for ts in times_ms])
+
+    store("PC-1", [cutoff_ms - 10 * DAY_MS + k * 300_000 for k in range(6)])
+    store("PC-1", [cutoff_ms - HOUR_MS, cutoff_ms + HOUR_MS], disk_pct=5.0)
+    store("PC-1", [HISTORY_NOW_MS - DAY_MS + k * 300_000 for k in range(3)])
+    store("PC-2", [cutoff_ms - 2 * DAY_MS, HISTORY_NOW_MS - 2 * HOUR_MS], location_tag="Lab")
+    return HISTORY_NOW_MS
+
+
+def rollup_rows():
+    """Every rollup row, keyed (scope, scope_key, bucket_s, bucket_start)."""
+    with db.connection() as conn:
+        return {
+            tuple(r[:4]): dict(r)
+            for r in conn.execute("SELECT * FROM rollups").fetchall()
+        }
+
+
+@pytest.fixture
+def rollups() -> Callable[[], Dict[tuple, Dict[str, Any]]]:
+    return rollup_rows
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+import pytest
+
+from app.alerts import AlertEngine, AlertSettings, AlertSink, SinkWorker
+
+
+MIN_MS = 60 * 1000
+
+
+class ListSink(AlertSink):
+    name = "list"
+
+    def __init__(self, fail_first: int = 0) -> None:
+        self.sent: List[Dict[str, Any]] = []
+        self.fail_first = fail_first
+        self.lock = threading.Lock()
+
+    def send(self, notification: Dict[str, Any]) -> None:
+        with self.lock:
+            if self.fail_first:
+                self.fail_first -= 1
+                raise OSError("receiver down")
+            self.sent.append(notification)
+
+    def events(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [e for n in self.sent for e in n["events"]]
+
+
+def settings(**kw: Any) -> AlertSettings:
+    base = dict(group_window_s=0, rate_per_min=6000, retry_backoff_s=0.01, drain_s=5)
+    base.update(kw)
+    return AlertSettings(**base)
+
+
+def row(ts_min: int, status: str, reasons=(), device_id="PC-1", location="Library"):
+    return SimpleNamespace(
+        device_id=device_id,
+        timestamp_utc=ts_min * MIN_MS,
+        location_tag=location,
+        computed_status=status,
+        computed_reasons_json=json.dumps(list(reasons)),
+    )
+
+
+@pytest.fixture
+def engine_events():
+    """Run check-ins through an engine and return the events it sends."""
+    def run(rows, seed=(), **kw):
+        sink = ListSink()
+        engine = AlertEngine(settings(**kw), [sink])
+        engine.seed(seed)
+        engine.start()
+        engine.observe(rows)
+        engine.stop()
+        return [(e["event"], e["status"], e["reasons"], e["location_tag"]) for e in sink.events()]
+    return run
+
+
+def test_fires_once_after_raise_after_and_resolves(engine_events):
+    rows = [row(t, "red", ["Low disk"]) for t in range(5)] + [row(5, "green"), row(6, "green")]
+    assert engine_events(rows) == [
+        ("firing", "red", ["Low disk"], "Library"),
+        ("resolved", "green", [], "Library"),
+    ]
+
+
+def test_one_odd_check_in_does_not_page(engine_events):
+    rows = [row(0, "red"), row(1, "red"), row(2, "green"), row(3, "red"), row(4, "green")]
+    assert engine_events(rows) == []
+
+
+def test_missing_location_falls_back_to_the_device(engine_events):
+    seed = [("PC-1", 0, "Lab", "green", "[]")]
+    rows = [row(t, "red", location=None) for t in range(1, 4)]
+    assert engine_events(rows, seed=seed) == [("firing", "red", [], "Lab")]
+
+
+def test_new_reasons_while_red_send_changed(engine_events):
+    rows = [row(t, "red", ["Low disk"]) for t in range(3)]
+    # A single different report is noise; three in a row are news
+    rows += [row(3, "red", ["AV off"]), row(4, "red", ["Low disk"])]
+    rows += [row(t, "red", ["Low disk", "AV off"]) for t in range(5, 8)]
+    rows += [row(t, "red", ["Low disk", "AV off"]) for t in range(8, 10)]
+    assert engine_events(rows) == [
+        ("firing", "red", ["Low disk"], "Library"),
+        ("changed", "red", ["Low disk", "AV off"], "Library"),
+    ]
+
+
+def test_restart_does_not_repage_or_report_unchanged_reasons(engine_events):
+    seed = [("PC-1", 0, "Library", "red", json.dumps(["Low disk"]))]
+    assert engine_events([row(t, "red", ["Low disk"]) for t in range(1, 6)], seed=seed) == []
+
+
+def test_flapping_sends_one_event_then_the_settled_state(engine_events):
+    kw = dict(raise_after=1, clear_after=1, flap_threshold=4, flap_window_s=3600)
+    rows = [row(t, "red" if t % 2 == 0 else "green") for t in range(8)]
+    # Quiet (green) for a whole window afterwards
+    rows += [row(7 + 61, "green")]
+    assert [e[0] for e in engine_events(rows, **kw)] == ["firing", "resolved", "firing", "flapping", "resolved"]
+
+
+def test_late_check_ins_are_ignored(engine_events):
+    rows = [row(10, "green"), row(1, "red"), row(2, "red"), row(3, "red")]
+    assert engine_events(rows) == []
+
+
+def test_retries_failed_sends():
+    sink = ListSink(fail_first=2)
+    worker = SinkWorker(sink, settings())
+    worker.start()
+    worker.submit([{"location_tag": "Lab", "event": "firing"}])
+    worker.stop()
+    assert len(sink.sent) == 1
+    assert worker.stats()["retries"] == 2
+
+
+def test_stop_drains_without_waiting_for_the_group_window():
+    sink = ListSink()
+    worker = SinkWorker(sink, settings(group_window_s=60))
+    worker.start()
+    worker.submit([{"location_tag": loc, "event": "firing"} for loc in ("Lab", "Library", "Lab")])
+    start = time.monotonic()
+    worker.stop()
+    assert time.monotonic() - start < 5
+    # One notification per location
+    assert [(n["location_tag"], len(n["events"])) for n in sink.sent] == [("Lab", 2), ("Library", 1)]
+    assert worker.stats()["lost"] == 0
+
+
+def test_rate_limit_holds_during_drain_and_counts_what_is_lost():
+    sink = ListSink()
+    # Two notifications in the bucket, the next token 30 s away
+    worker = SinkWorker(sink, settings(rate_per_min=2, drain_s=0.2))
+    worker.start()
+    worker.submit([{"location_tag": loc, "event": "firing"} for loc in ("A", "B", "C", "D")])
+    worker.stop()
+    stats = worker.stats()
+    assert len(sink.sent) == 2
+    assert stats["rate_limited"] >= 1
+    assert stats["lost"] == 2
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+from app import db
+from app.main import MAX_BATCH_SIZE
+
+
+NOW_MS = 1780000000000
+
+
+def _count_checkins() -> int:
+    with db.connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM checkins").fetchone()[0]
+
+
+def test_batch_reports_each_item_in_order(client, checkin):
+    bad = checkin("PC-2", NOW_MS)
+    del bad["agent_version"]
+    payloads = [
+        checkin("PC-1", NOW_MS, disk_pct=5.0),
+        bad,
+        checkin("PC-3", NOW_MS),
+        checkin("PC-1", NOW_MS, disk_pct=5.0),  # repeated in the same batch
+    ]
+    r = client.post("/api/checkins/batch", json=payloads)
+    assert r.status_code == 200
+    body = r.json()
+    assert (body["accepted"], body["rejected"]) == (3, 1)
+
+    first, invalid, other, repeat = body["results"]
+    assert first["ok"] and first["computed_status"] == "red"
+    assert invalid["ok"] is False
+    assert invalid["error"][0]["loc"] == ["agent_version"]
+    assert other["ok"] and other["computed_status"] == "green"
+    assert repeat["checkin_id"] == first["checkin_id"]
+    assert _count_checkins() == 2
+
+
+def test_oversized_batch_is_refused(client, checkin):
+    r = client.post("/api/checkins/batch", json=[checkin("PC-1", NOW_MS)] * (MAX_BATCH_SIZE + 1))
+    assert r.status_code == 413
+    assert _count_checkins() == 0
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import sqlite3
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import db, main, writer
+from app.delta import delta_states
+from app.main import app
+from app.timeutil import from_epoch_ms
+from app.writer import get_writer
+
+
+NOW_MS = 1780000000000
+
+
+def _stored_disk_pcts(device_id: str):
+    with db.connection() as conn:
+        return [
+            r[0] for r in conn.execute(
+                "SELECT disk_c_free_pct FROM checkins WHERE device_id = ? ORDER BY timestamp_utc",
+                (device_id,),
+            ).fetchall()
+        ]
+
+
+def _patch(ts_ms: int, disk_pct: float):
+    return {"timestamp_utc": from_epoch_ms(ts_ms), "metrics": {"storage": {"disk_c_free_pct": disk_pct}}}
+
+
+@pytest.fixture
+def seeded(client, checkin):
+    """PC-1 with a full check-in acknowledged as seq 1."""
+    r = client.post("/api/checkin/delta", json={"device_id": "PC-1", "seq": 1, "checkin": checkin("PC-1", NOW_MS)})
+    assert r.status_code == 200 and r.json()["seq"] == 1
+    return client
+
+
+def test_delta_is_rebuilt_and_stored(seeded):
+    r = seeded.post(
+        "/api/checkin/delta",
+        json={"device_id": "PC-1", "seq": 2, "base_seq": 1, "checkin": _patch(NOW_MS + 300_000, 5.0)},
+    )
+    assert r.status_code == 200
+    assert r.json()["seq"] == 2 and r.json()["computed_status"] == "red"
+    assert _stored_disk_pcts("PC-1") == [60.0, 5.0]
+    assert delta_states.get("PC-1")[0] == 2
+
+
+def test_resend_of_last_seq_is_a_duplicate(seeded):
+    body = {"device_id": "PC-1", "seq": 2, "base_seq": 1, "checkin": _patch(NOW_MS + 300_000, 5.0)}
+    first = seeded.post("/api/checkin/delta", json=body).json()
+    again = seeded.post("/api/checkin/delta", json=body).json()
+    assert again == {**first, "duplicate": True}
+    assert _stored_disk_pcts("PC-1") == [60.0, 5.0]
+
+
+def test_wrong_base_seq_asks_for_resync(seeded):
+    r = seeded.post(
+        "/api/checkin/delta",
+        json={"device_id": "PC-1", "seq": 5, "base_seq": 4, "checkin": _patch(NOW_MS + 300_000, 5.0)},
+    )
+    assert r.status_code == 409
+    assert r.json()["detail"] == {"resync": True, "seq": 1}
+    assert _stored_disk_pcts("PC-1") == [60.0]
+
+
+def test_restart_forgets_state(seeded):
+    with TestClient(app, headers=seeded.headers) as restarted:
+        r = restarted.post(
+            "/api/checkin/delta",
+            json={"device_id": "PC-1", "seq": 2, "base_seq": 1, "checkin": _patch(NOW_MS + 300_000, 5.0)},
+        )
+    assert r.status_code == 409
+    assert r.json()["detail"] == {"resync": True, "seq": None}
+
+
+@pytest.mark.parametrize("ts_offset_ms", [0, -300_000, None])
+def test_timestamp_must_advance(seeded, ts_offset_ms):
+    patch = _patch(NOW_MS + (ts_offset_ms or 0), 5.0)
+    if ts_offset_ms is None:
+        del patch["timestamp_utc"]  # carried over from the base
+    r = seeded.post("/api/checkin/delta", json={"device_id": "PC-1", "seq": 2, "base_seq": 1, "checkin": patch})
+    assert r.status_code == 422
+    assert r.json()["detail"][0]["loc"] == ["body", "checkin", "timestamp_utc"]
+    assert delta_states.get("PC-1")[0] == 1
+    assert _stored_disk_pcts("PC-1") == [60.0]
+
+
+def test_invalid_rebuilt_payload_keeps_state(seeded):
+    r = seeded.post(
+        "/api/checkin/delta",
+        json={"device_id": "PC-1", "seq": 2, "base_seq": 1, "checkin": {"timestamp_utc": "yesterday-ish"}},
+    )
+    assert r.status_code == 422
+    assert delta_states.get("PC-1")[0] == 1
+
+
+def test_failed_store_keeps_state(seeded, monkeypatch):
+    def locked(records):
+        raise sqlite3.OperationalError("database is locked")
+
+    body = {"device_id": "PC-1", "seq": 2, "base_seq": 1, "checkin": _patch(NOW_MS + 300_000, 5.0)}
+    monkeypatch.setattr(main, "store_checkins", locked)
+    with pytest.raises(sqlite3.OperationalError):
+        seeded.post("/api/checkin/delta", json=body)
+    assert delta_states.get("PC-1")[0] == 1
+
+    # The agent's retry still patches against seq 1
+    monkeypatch.undo()
+    r = seeded.post("/api/checkin/delta", json=body)
+    assert r.status_code == 200 and "duplicate" not in r.json()
+    assert _stored_disk_pcts("PC-1") == [60.0, 5.0]
+
+
+def _wait_for(writer_stat: str, n: int) -> None:
+    deadline = time.monotonic() + 5
+    while get_writer().stats()[writer_stat] < n:
+        assert time.monotonic() < deadline, f"writer never reached {writer_stat}={n}"
+        time.sleep(0.01)
+
+
+def test_dropped_queued_delta_forgets_state(db_path, checkin, monkeypatch):
+    def broken(rows, devices):
+        raise ValueError("can't write this")
+
+    monkeypatch.setattr(main, "INGEST_MODE", "async")
+    with TestClient(app, headers={"x-api-key": "dev-secret-key"}) as c:
+        r = c.post("/api/checkin/delta", json={"device_id": "PC-1", "seq": 1, "checkin": checkin("PC-1", NOW_MS)})
+        assert r.status_code == 202
+        _wait_for("committed", 1)
+
+        monkeypatch.setattr(writer, "commit_checkins", broken)
+        r = c.post(
+            "/api/checkin/delta",
+            json={"device_id": "PC-1", "seq": 2, "base_seq": 1, "checkin": _patch(NOW_MS + 300_000, 5.0)},
+        )
+        assert r.status_code == 202
+        _wait_for("failed", 1)
+        assert delta_states.get("PC-1") is None
+
+        r = c.post(
+            "/api/checkin/delta",
+            json={"device_id": "PC-1", "seq": 3, "base_seq": 2, "checkin": _patch(NOW_MS + 600_000, 5.0)},
+        )
+        assert r.status_code == 409
+    assert _stored_disk_pcts("PC-1") == [60.0]
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import json
+
+NOW_MS = 1780000000000
+
+
+def test_unchanged_fleet_is_answered_with_304(client, checkin):
+    client.post("/api/checkin", json=checkin("PC-1", NOW_MS))
+    first = client.get("/api/devices")
+    etag = first.headers["ETag"]
+    assert etag == f'W/"fleet-{first.json()["version"]}"'
+
+    again = client.get("/api/devices", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.content == b""
+    assert again.headers["ETag"] == etag
+
+    client.post("/api/checkin", json=checkin("PC-1", NOW_MS + 300_000))
+    changed = client.get("/api/devices", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+
+def test_since_returns_only_changed_devices(client, checkin):
+    client.post("/api/checkin", json=checkin("PC-1", NOW_MS))
+    client.post("/api/checkin", json=checkin("PC-2", NOW_MS))
+    version = client.get("/api/devices").json()["version"]
+
+    client.post("/api/checkin", json=checkin("PC-2", NOW_MS + 300_000, disk_pct=5.0))
+    delta = client.get("/api/devices", params={"since": version}).json()
+    assert delta["full"] is False
+    assert [(d["device_id"], d["computed_status"]) for d in delta["devices"]] == [("PC-2", "red")]
+
+    nothing = client.get("/api/devices", params={"since": delta["version"]}).json()
+    assert nothing["full"] is False and nothing["devices"] == []
+
+
+def test_unknown_since_gets_the_full_list(client, checkin):
+    client.post("/api/checkin", json=checkin("PC-1", NOW_MS))
+    client.post("/api/checkin", json=checkin("PC-2", NOW_MS))
+    # e.g. a dashboard that outlived a database reset
+    r = client.get("/api/devices", params={"since": 10**9}).json()
+    assert r["full"] is True
+    assert sorted(d["device_id"] for d in r["devices"]) == ["PC-1", "PC-2"]
+
+
+def test_fields_project_columns(client, checkin):
+    sent = checkin("PC-1", NOW_MS)
+    client.post("/api/checkin", json=sent)
+
+    def device(fields):
+        r = client.get("/api/devices", params={"fields": fields})
+        assert r.status_code == 200
+        return r.json()["devices"][0]
+
+    default = client.get("/api/devices").json()["devices"][0]
+    assert "raw_json" not in default and "agent_version" not in default
+    # device_id always comes along; liveness and trend are attached per device
+    assert set(device("disk_c_free_pct")) == {"device_id", "disk_c_free_pct", "liveness", "trend"}
+    assert "raw_json" not in device("all") and device("all")["agent_version"] == "test-1.0"
+    # The stored raw payload, normalized (optional metrics filled in as null)
+    raw = json.loads(device("raw_json")["raw_json"])
+    assert raw["metrics"]["storage"]["disk_c_free_pct"] == sent["metrics"]["storage"]["disk_c_free_pct"]
+
+
+def test_unknown_field_is_a_400(client, checkin):
+    client.post("/api/checkin", json=checkin("PC-1", NOW_MS))
+    for path in ("/api/devices", "/api/devices/PC-1", "/api/export"):
+        r = client.get(path, params={"fields": "disk_c_free_pct,password"})
+        assert r.status_code == 400
+        assert r.json()["detail"] == "Unknown field: password"
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+from contextlib import ExitStack
+
+import pytest
+
+from app import db, export
+from app.decode import decode_checkin
+from app.export import ExportFilter, export_columns, iter_export
+from app.ingest import store_checkins
+from app.timeutil import from_epoch_ms
+
+
+NOW_MS = 1780000000000
+
+
+def test_paused_export_holds_no_connection(db_path, checkin, monkeypatch):
+    monkeypatch.setattr(export, "PAGE_ROWS", 2)
+    store_checkins([decode_checkin(checkin("PC-1", NOW_MS + k * 300_000)) for k in range(5)])
+
+    chunks = iter_export(ExportFilter(), "ndjson", export_columns(None))
+    first = next(chunks)
+    assert first.count("\n") == 2
+    # A slow client: every pooled connection is still free for ingest
+    with ExitStack() as stack:
+        for _ in range(db._settings.pool_size):
+            stack.enter_context(db.connection())
+    assert sum(c.count("\n") for c in chunks) == 3
+
+
+@pytest.fixture
+def exported(client, checkin):
+    """PC-1 (Library) and PC-2 (Lab) every 5 minutes for 30 minutes; PC-2 red from the 4th."""
+    for k in range(6):
+        ts = NOW_MS + k * 300_000
+        client.post("/api/checkin", json=checkin("PC-1", ts))
+        client.post("/api/checkin", json=checkin("PC-2", ts, location_tag="Lab", disk_pct=5.0 if k >= 3 else 60.0))
+    return client
+
+
+def _csv(client, **params):
+    r = client.get("/api/export", params={"format": "csv", **params})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/csv")
+    return list(csv.DictReader(io.StringIO(r.text)))
+
+
+def test_csv_is_oldest_first_with_location(exported):
+    rows = _csv(exported)
+    assert len(rows) == 12
+    assert [r["timestamp_utc"] for r in rows] == sorted(r["timestamp_utc"] for r in rows)
+    assert {(r["device_id"], r["location_tag"]) for r in rows} == {("PC-1", "Library"), ("PC-2", "Lab")}
+    assert "raw_json" not in rows[0]
+
+
+def test_filters_combine(exported):
+    red = _csv(exported, status="red")
+    assert [(r["device_id"], r["computed_status"]) for r in red] == [("PC-2", "red")] * 3
+
+    window = _csv(exported, **{"from": from_epoch_ms(NOW_MS + 300_000), "to": from_epoch_ms(NOW_MS + 600_000)})
+    assert len(window) == 4
+
+    assert {r["device_id"] for r in _csv(exported, location="Lab")} == {"PC-2"}
+    assert _csv(exported, device_id=["PC-1", "PC-3"], status=["yellow", "red"]) == []
+
+
+def test_ndjson_with_fields_and_raw_payload(exported):
+    r = exported.get("/api/export", params={"format": "ndjson", "fields": "disk_c_free_pct,raw_json", "device_id": "PC-2"})
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert len(lines) == 6
+    # The paging key and location come along with the requested fields
+    assert set(lines[0]) == {"id", "device_id", "location_tag", "timestamp_utc", "disk_c_free_pct", "raw_json"}
+    assert json.loads(lines[-1]["raw_json"])["metrics"]["storage"]["disk_c_free_pct"] == 5.0
+
+
+def test_empty_export_and_bad_parameters(client):
+    r = client.get("/api/export", params={"format": "csv"})
+    assert r.text.splitlines() == [",".join(export_columns(None))]
+    assert client.get("/api/export", params={"format": "xml"}).status_code == 400
+    assert client.get("/api/export", params={"status": "purple"}).status_code == 400
+    assert client.get("/api/export", params={"from": "last tuesday"}).status_code == 400
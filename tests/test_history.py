@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import pytest
+
+from app.decode import decode_checkin
+from app.ingest import store_checkins
+from app.timeutil import from_epoch_ms
+
+
+NOW_MS = 1780000000000
+STEP_MS = 300_000
+
+
+@pytest.fixture
+def seven(client, checkin):
+    """PC-1 with 7 check-ins STEP_MS apart (and PC-2 with one); returns their times, newest first."""
+    times = [NOW_MS + k * STEP_MS for k in range(7)]
+    for ts in times:
+        assert client.post("/api/checkin", json=checkin("PC-1", ts)).status_code == 200
+    client.post("/api/checkin", json=checkin("PC-2", NOW_MS + STEP_MS))
+    return [from_epoch_ms(ts) for ts in reversed(times)]
+
+
+def _walk(client, **params):
+    pages, cursor = [], None
+    while True:
+        q = dict(params, **({"cursor": cursor} if cursor else {}))
+        page = client.get("/api/devices/PC-1/history", params=q).json()
+        pages.append(page)
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+def test_pages_cover_history_once_newest_first(client, seven):
+    pages = _walk(client, page_size=3)
+    assert [len(p["history"]) for p in pages] == [3, 3, 1]
+    assert [r["timestamp_utc"] for p in pages for r in p["history"]] == seven
+    assert pages[0]["latest"]["timestamp_utc"] == seven[0]
+    assert all(p["latest"] is None for p in pages[1:])
+
+
+def test_time_window_is_inclusive(client, seven):
+    pages = _walk(client, page_size=2, **{"from": seven[4], "to": seven[1]})
+    assert [r["timestamp_utc"] for p in pages for r in p["history"]] == seven[1:5]
+    assert pages[0]["latest"] is None
+
+
+def test_bad_cursor_is_rejected(client, seven):
+    r = client.get("/api/devices/PC-1/history", params={"cursor": "not-a-cursor"})
+    assert r.status_code == 400
+
+
+def test_detail_limit_is_not_capped_like_pages(client, checkin):
+    store_checkins([decode_checkin(checkin("PC-1", NOW_MS + k * STEP_MS)) for k in range(520)])
+
+    def detail(**params):
+        return client.get("/api/devices/PC-1", params=params).json()
+
+    assert len(detail()["history"]) == 20
+    assert len(detail(limit=510)["history"]) == 510
+    assert len(detail(limit=-1)["history"]) == 520
+    empty = detail(limit=0)
+    assert empty["history"] == []
+    assert empty["latest"]["timestamp_utc"] == from_epoch_ms(NOW_MS + 519 * STEP_MS)
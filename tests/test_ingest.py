@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from fastapi.testclient import TestClient
+
+from app import db
+from app.main import app
+
+
+NOW_MS = 1780000000000
+
+
+def _count_checkins() -> int:
+    with db.connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM checkins").fetchone()[0]
+
+
+def test_retry_is_answered_with_stored_result(client, checkin):
+    body = checkin("PC-1", NOW_MS, disk_pct=5.0)
+    first = client.post("/api/checkin", json=body).json()
+    assert first["computed_status"] == "red" and "duplicate" not in first
+
+    again = client.post("/api/checkin", json=body).json()
+    assert again == {**first, "duplicate": True}
+    assert _count_checkins() == 1
+
+
+def test_retry_after_restart_hits_the_unique_index(client, checkin):
+    body = checkin("PC-1", NOW_MS)
+    first = client.post("/api/checkin", json=body).json()
+
+    # Startup forgets the in-memory keys; the database still knows the row
+    with TestClient(app, headers=client.headers) as restarted:
+        again = restarted.post("/api/checkin", json=body).json()
+    assert again["duplicate"] is True
+    assert again["checkin_id"] == first["checkin_id"]
+    assert _count_checkins() == 1
+
+
+def test_new_database_does_not_see_cached_results(client, checkin, tmp_path, monkeypatch):
+    body = checkin("PC-1", NOW_MS)
+    client.post("/api/checkin", json=body)
+
+    monkeypatch.setenv("DASHBOARD_DB_PATH", str(tmp_path / "other.db"))
+    with TestClient(app, headers=client.headers) as other:
+        result = other.post("/api/checkin", json=body).json()
+        assert "duplicate" not in result
+        assert _count_checkins() == 1
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import time
+
+from app.liveness import LivenessSettings, LivenessTracker, get_liveness
+
+
+NOW_MS = 1780000000000
+T0 = 1_000_000.0  # wall clock for the tracker's "now"
+
+
+def test_interval_is_learned_from_gaps():
+    tracker = LivenessTracker(LivenessSettings(default_interval_s=300, stale_factor=3, offline_factor=10))
+    tracker.observe([("PC-1", NOW_MS)], now=T0)
+    tracker.observe([("PC-1", NOW_MS + 60_000)], now=T0 + 60)
+
+    # 60 s cadence: stale after 3 missed intervals, offline after 10
+    assert tracker.expire(now=T0 + 60 + 179) == []
+    assert tracker.expire(now=T0 + 60 + 180) == [("PC-1", NOW_MS + 60_000, "stale")]
+    assert tracker.expire(now=T0 + 60 + 600) == [("PC-1", NOW_MS + 60_000, "offline")]
+    assert tracker.stats() == {"devices": 1, "stale": 0, "offline": 1}
+
+    # Reporting again clears the mark; the outage doesn't teach the cadence
+    tracker.observe([("PC-1", NOW_MS + 3600_000)], now=T0 + 3600)
+    assert tracker.stats()["offline"] == 0
+    assert tracker.expire(now=T0 + 3600 + 180) == [("PC-1", NOW_MS + 3600_000, "stale")]
+
+
+def test_long_silence_passes_both_deadlines_at_once():
+    tracker = LivenessTracker(LivenessSettings(default_interval_s=300))
+    tracker.observe([("PC-1", NOW_MS), ("PC-2", NOW_MS)], now=T0)
+    tracker.observe([("PC-2", NOW_MS - 60_000)], now=T0 + 1000)  # late: ignored
+    assert sorted(tracker.expire(now=T0 + 86400)) == [
+        ("PC-1", NOW_MS, "offline"),
+        ("PC-2", NOW_MS, "offline"),
+    ]
+
+
+def test_stale_and_offline_devices_in_fleet_view(client, checkin):
+    client.post("/api/checkin", json=checkin("PC-1", NOW_MS))
+    client.post("/api/checkin", json=checkin("PC-2", NOW_MS, disk_pct=5.0))
+    tracker = get_liveness()
+
+    def fleet():
+        return [(d["device_id"], d["liveness"]) for d in client.get("/api/devices").json()["devices"]]
+
+    # Default 300 s interval: stale after 3 missed, offline after 10
+    assert tracker.sweep(now=time.time() + 3 * 300 + 1) == 2
+    # Stale ranks with yellow, below the red device
+    assert fleet() == [("PC-2", "stale"), ("PC-1", "stale")]
+    assert tracker.sweep(now=time.time() + 10 * 300 + 1) == 2
+
+    # Reporting again clears the mark; offline sorts above red
+    client.post("/api/checkin", json=checkin("PC-2", NOW_MS + 300_000, disk_pct=5.0))
+    assert fleet() == [("PC-1", "offline"), ("PC-2", None)]
+    assert tracker.stats() == {"devices": 2, "stale": 0, "offline": 1}
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import re
+
+from app.metrics import Counter, Histogram
+
+
+NOW_MS = 1780000000000
+
+
+def _sample(text: str, name: str, **labels: str) -> float:
+    """Value of the sample with exactly these labels (any order)."""
+    for line in text.splitlines():
+        m = re.match(r"^(\w+)(?:\{(.*)\})? (\S+)$", line)
+        if not m or m.group(1) != name:
+            continue
+        got = dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', m.group(2) or ""))
+        if got == labels:
+            return float(m.group(3))
+    raise AssertionError(f"no sample {name} {labels}")
+
+
+def test_histogram_buckets_are_cumulative():
+    h = Histogram("t_seconds", "test", ("stage",), buckets=(0.1, 1.0))
+    for v in (0.05, 0.5, 0.5, 5.0):
+        h.observe(v, stage="x")
+    text = "\n".join(h.header() + h.samples())
+    assert "# TYPE t_seconds histogram" in text
+    assert _sample(text, "t_seconds_bucket", stage="x", le="0.1") == 1
+    assert _sample(text, "t_seconds_bucket", stage="x", le="1") == 3
+    assert _sample(text, "t_seconds_bucket", stage="x", le="+Inf") == 4
+    assert _sample(text, "t_seconds_count", stage="x") == 4
+    assert _sample(text, "t_seconds_sum", stage="x") == 6.05
+
+
+def test_label_values_are_escaped():
+    c = Counter("t_total", "test", ("route",))
+    c.inc(route='a"b\\c\nd')
+    assert c.samples() == ['t_total{route="a\\"b\\\\c\\nd"} 1']
+
+
+def test_metrics_endpoint(client, checkin):
+    client.post("/api/checkin", json=checkin("PC-1", NOW_MS))
+    client.get("/api/devices/PC-1")
+    client.get("/api/devices/PC-2")
+
+    # Unauthenticated, like /health
+    r = client.get("/metrics", headers={"x-api-key": ""})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = r.text
+    # Routes are labelled by template, so device ids don't add series
+    route = "/api/devices/{device_id}"
+    assert _sample(text, "dashboard_http_requests_total", method="GET", route=route, status="200") >= 2
+    assert _sample(text, "dashboard_stage_duration_seconds_count", stage="classify") >= 1
+    assert "PC-2" not in text
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+from pathlib import Path
+
+from app import db
+from app.main import SCHEMA_PATH
+
+
+LEGACY_SCHEMA = Path(__file__).with_name("legacy_schema.sql")
+
+
+def _legacy_checkin(device_id, ts, status="green", boot="2026-01-01T00:00:00Z"):
+    return {
+        "device_id": device_id, "timestamp_utc": ts, "agent_version": "0.9",
+        "last_boot_utc": boot, "uptime_seconds": 60,
+        "unexpected_shutdowns": 0, "app_crashes": 0, "service_restarts": 0,
+        "disk_c_free_gb": 50.0, "disk_c_free_pct": 40.0,
+        "av_enabled": 1, "av_sig_age_days": 0, "pending_reboot": 0,
+        "dns_ok": 1, "gateway_ok": 1,
+        "mypc_auth_attempts": 0, "mypc_auth_successes": 0, "mypc_auth_failures": 0,
+        "mypc_auth_failures_by_reason_json": "{}",
+        "mypc_service_connect_failures": 0,
+        "computed_status": status, "computed_reasons_json": json.dumps([]),
+    }
+
+
+def _make_legacy_db(path: Path) -> None:
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_SCHEMA.read_text(encoding="utf-8"))
+    conn.executemany(
+        "INSERT INTO devices VALUES (?, ?, ?, ?, ?)",
+        [
+            ("PC-1", "Library", "10.0.0.1", "2026-01-01T00:00:00Z", "2026-01-02T08:00:00+00:00"),
+            ("PC-2", "Lab", "10.0.0.2", "2026-01-01T00:00:00Z", "2026-01-01T09:30:00Z"),
+        ],
+    )
+    rows = [
+        _legacy_checkin("PC-1", "2026-01-01T08:00:00Z"),
+        # The same instant written two ways: one row after conversion
+        _legacy_checkin("PC-1", "2026-01-02T08:00:00+00:00", status="red"),
+        _legacy_checkin("PC-1", "2026-01-02T08:00:00.000Z", status="yellow"),
+        _legacy_checkin("PC-2", "2026-01-01T09:30:00Z"),
+    ]
+    columns = list(rows[0])
+    conn.executemany(
+        f"INSERT INTO checkins ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+        [tuple(r[c] for c in columns) for r in rows],
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_init_db_migrates_text_timestamps(tmp_path, monkeypatch, capsys):
+    path = tmp_path / "dashboard.db"
+    _make_legacy_db(path)
+    monkeypatch.setenv("DASHBOARD_DB_PATH", str(path))
+    db.configure(db.DBSettings.from_env())
+    try:
+        db.init_db(SCHEMA_PATH)
+        assert "removed 1 duplicate check-ins" in capsys.readouterr().out
+
+        with db.connection() as conn:
+            checkins = conn.execute(
+                "SELECT id, device_id, timestamp_utc, last_boot_utc, computed_status FROM checkins ORDER BY id"
+            ).fetchall()
+            assert [tuple(r) for r in checkins] == [
+                (1, "PC-1", 1767254400000, 1767225600000, "green"),
+                (2, "PC-1", 1767340800000, 1767225600000, "red"),  # first copy kept
+                (4, "PC-2", 1767259800000, 1767225600000, "green"),
+            ]
+            devices = conn.execute("SELECT device_id, first_seen_utc, last_seen_utc FROM devices ORDER BY 1").fetchall()
+            assert [tuple(r) for r in devices] == [
+                ("PC-1", 1767225600000, 1767340800000),
+                ("PC-2", 1767225600000, 1767259800000),
+            ]
+            latest = conn.execute("SELECT device_id, checkin_id FROM device_latest ORDER BY 1").fetchall()
+            assert [tuple(r) for r in latest] == [("PC-1", 2), ("PC-2", 4)]
+            assert not conn.execute(
+                "SELECT name FROM sqlite_master WHERE name LIKE '%\\_text' ESCAPE '\\'"
+            ).fetchall()
+
+        # Running it again on the converted database is a no-op
+        db.init_db(SCHEMA_PATH)
+        assert "converted" not in capsys.readouterr().out
+        _, latest = db.get_devices_latest()
+        assert {d["device_id"]: d["timestamp_utc"] for d in latest} == {
+            "PC-1": "2026-01-02T08:00:00.000+00:00",
+            "PC-2": "2026-01-01T09:30:00.000+00:00",
+        }
+    finally:
+        db.close_pool()
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import pytest
+
+from app import db, health_rules
+from app.decode import decode_checkin
+from app.ingest import store_checkins
+from app.reclassify import reclassify_checkins
+from app.retention import RetentionPolicy, run_retention
+from app.rollups import rebuild_rollups
+
+
+DAY_MS = 24 * 3600 * 1000
+
+
+@pytest.fixture
+def stricter_disk_rules(tmp_path, monkeypatch):
+    """Current rules with disk_low raised to 70%: every seeded check-in turns red."""
+    spec = json.loads(health_rules.RULES_PATH.read_text(encoding="utf-8"))
+    for rule in spec["rules"]:
+        if rule["id"] == "disk_low":
+            rule["value"] = 70
+    path = tmp_path / "health_rules.json"
+    path.write_text(json.dumps(spec), encoding="utf-8")
+    monkeypatch.setattr(health_rules, "_rules", health_rules.RuleSet(Path(path)))
+
+
+def test_reclassify_moves_status_counts_after_retention(history, rollups, stricter_disk_rules):
+    now_ms = history
+    run_retention(RetentionPolicy(keep_days=90), now_ms=now_ms)
+    before = rollups()
+
+    report = reclassify_checkins()
+    assert report["rows_scanned"] == 5
+    # The red one only changes its reason text
+    assert report["rows_changed"] == 5
+    assert report["rollup_buckets_updated"] > 0
+
+    after = rollups()
+    assert after.keys() == before.keys()
+    for key, row in after.items():
+        old = before[key]
+        # Only the status split moves; n and the metrics stay as they were
+        assert {k: v for k, v in row.items() if k not in ("green", "yellow", "red")} == {
+            k: v for k, v in old.items() if k not in ("green", "yellow", "red")
+        }
+        assert row["green"] + row["yellow"] + row["red"] == old["green"] + old["yellow"] + old["red"]
+
+    # The day whose check-ins retention deleted keeps its counts
+    old_day = ("device", "PC-1", 86400, (now_ms - 100 * DAY_MS) // DAY_MS * 86400)
+    assert after[old_day] == before[old_day]
+    # Rebuildable buckets now agree with a recount of the stored rows
+    rebuild_rollups()
+    assert rollups() == after
+    with db.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM checkins WHERE computed_status != 'red'").fetchone()[0] == 0
+
+
+def test_reclassify_without_changes_leaves_rollups(history, rollups):
+    before = rollups()
+    report = reclassify_checkins()
+    assert report["rows_changed"] == 0
+    assert report["rollup_buckets_updated"] == 0
+    assert rollups() == before
+
+
+def test_reclassify_after_untagged_checkin(db_path, checkin, rollups, stricter_disk_rules):
+    day_ms = 1780000000000 // DAY_MS * DAY_MS
+    store_checkins([decode_checkin(checkin("PC-1", day_ms + 3600_000))])
+    store_checkins([decode_checkin(checkin("PC-1", day_ms + 7200_000, location_tag=None))])
+
+    reclassify_checkins()
+    after = rollups()
+    day = after[("location", "Library", 86400, day_ms // 1000)]
+    assert (day["green"], day["yellow"], day["red"]) == (0, 0, 2)
+    assert all(min(r["green"], r["yellow"], r["red"]) >= 0 for r in after.values())
+    rebuild_rollups()
+    assert rollups() == after
+
+
+def test_rules_reloaded_during_run_apply_next_run(history, stricter_disk_rules):
+    path = health_rules._rules.path
+    spec = json.loads(path.read_text(encoding="utf-8"))
+    # Reads a column the running version doesn't select
+    spec["rules"].append(
+        {"id": "disk_gb_low", "field": "disk_c_free_gb", "op": "<", "value": 1000, "status": "red", "reason": "Low disk (GB)"}
+    )
+
+    def reload_once(report):
+        if report["rows_scanned"] == 2:
+            path.write_text(json.dumps(spec), encoding="utf-8")
+            health_rules.reload_rules()
+
+    report = reclassify_checkins(chunk_size=2, progress=reload_once)
+    assert report["rows_scanned"] == 13
+    with db.connection() as conn:
+        reasons = [r[0] for r in conn.execute("SELECT computed_reasons_json FROM checkins")]
+    assert not [r for r in reasons if "Low disk (GB)" in r]
+
+    reclassify_checkins()
+    with db.connection() as conn:
+        reasons = [r[0] for r in conn.execute("SELECT computed_reasons_json FROM checkins")]
+    assert all("Low disk (GB)" in r for r in reasons)
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+from app.decode import decode_checkin
+from app.ingest import store_checkins
+from app.retention import RetentionPolicy, run_retention
+from app.rollups import rebuild_rollups
+
+
+HOUR_MS = 3600 * 1000
+DAY_MS = 24 * HOUR_MS
+
+
+def test_rebuild_matches_ingest(history, rollups):
+    before = rollups()
+
+    assert rebuild_rollups() == 13
+    assert rollups() == before
+
+
+def test_rebuild_after_retention_keeps_history(history, rollups):
+    now_ms = history
+    report = run_retention(RetentionPolicy(keep_days=90, rollup_5m_days=30), now_ms=now_ms)
+    assert report["checkins_deleted"] == 8
+    after_retention = rollups()
+    # Old 5-minute buckets are pruned; hourly and daily ones outlive the rows
+    assert not [k for k in after_retention if k[2] == 300 and k[3] * 1000 < now_ms - 30 * DAY_MS]
+    old_day = ("device", "PC-1", 86400, (now_ms - 100 * DAY_MS) // DAY_MS * 86400)
+    assert after_retention[old_day]["n"] == 6
+
+    rebuild_rollups()
+    assert rollups() == after_retention
+
+    # An explicit since before the cutoff is clamped the same way
+    rebuild_rollups(since="2020-01-01T00:00:00Z")
+    assert rollups() == after_retention
+
+
+def test_untagged_checkin_counts_for_stored_location(db_path, checkin, rollups):
+    day_ms = 1780000000000 // DAY_MS * DAY_MS
+    store_checkins([decode_checkin(checkin("PC-1", day_ms + HOUR_MS))])
+    store_checkins([decode_checkin(checkin("PC-1", day_ms + 2 * HOUR_MS, location_tag=None))])
+    after_ingest = rollups()
+    assert after_ingest[("location", "Library", 86400, day_ms // 1000)]["n"] == 2
+
+    rebuild_rollups()
+    assert rollups() == after_ingest
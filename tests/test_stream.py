@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+from app import events
+from app.events import FleetBroker
+from app.timeutil import from_epoch_ms
+
+
+NOW_MS = 1780000000000
+
+
+def _row(ts_ms, status="green", disk_pct=60.0):
+    return {
+        "device_id": "PC-1",
+        "timestamp_utc": ts_ms,
+        "computed_status": status,
+        "computed_reasons_json": "[]",
+        "disk_c_free_pct": disk_pct,
+    }
+
+
+def test_only_state_changes_are_pushed():
+    async def run():
+        broker = FleetBroker()
+        q = broker.subscribe()
+        assert broker.publish_checkin(_row(NOW_MS)) is True
+        # A newer check-in that changes nothing the dashboard shows
+        assert broker.publish_checkin(_row(NOW_MS + 300_000)) is False
+        # A late one doesn't replace the latest state
+        assert broker.publish_checkin(_row(NOW_MS - 300_000, status="red")) is False
+        assert broker.publish_checkin(_row(NOW_MS + 600_000, status="red", disk_pct=5.0)) is True
+
+        got = [json.loads(await asyncio.wait_for(q.get(), 1)) for _ in range(2)]
+        assert [(e["computed_status"], e["disk_c_free_pct"]) for e in got] == [("green", 60.0), ("red", 5.0)]
+        # Same ISO form as /api/devices
+        assert got[1]["timestamp_utc"] == from_epoch_ms(NOW_MS + 600_000)
+        assert q.empty()
+
+    asyncio.run(run())
+
+
+def test_subscriber_that_falls_behind_is_dropped(monkeypatch):
+    monkeypatch.setattr(events, "SUBSCRIBER_QUEUE_SIZE", 2)
+
+    async def run():
+        broker = FleetBroker()
+        q = broker.subscribe()
+        for k in range(3):
+            broker.publish_checkin(_row(NOW_MS + k, disk_pct=float(k)))
+        await asyncio.sleep(0)  # let the deliveries run on the loop
+        assert broker.subscriber_count() == 0
+        # The stream ends on the sentinel and EventSource reconnects
+        assert await q.get() is None
+
+    asyncio.run(run())
+
+
+def test_stream_needs_the_api_key(client):
+    assert client.get("/api/stream/devices", headers={"x-api-key": ""}).status_code == 401
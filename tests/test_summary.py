@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+from app.summary import QuantileSketch, fleet_summary
+
+
+NOW_MS = 1780000000000
+
+
+def test_summary_follows_latest_state_per_location(client, checkin):
+    client.post("/api/checkin", json=checkin("PC-1", NOW_MS))
+    client.post("/api/checkin", json=checkin("PC-2", NOW_MS, disk_pct=5.0))
+    client.post("/api/checkin", json=checkin("PC-3", NOW_MS, location_tag="Lab"))
+    # PC-1 turns red; its check-in leaves location_tag out
+    client.post("/api/checkin", json=checkin("PC-1", NOW_MS + 300_000, location_tag=None, av_enabled=False))
+    # A late check-in doesn't replace the latest state
+    client.post("/api/checkin", json=checkin("PC-3", NOW_MS - 300_000, disk_pct=5.0, location_tag="Lab"))
+
+    summary = client.get("/api/fleet/summary").json()
+    fleet, library, lab = summary["fleet"], summary["locations"]["Library"], summary["locations"]["Lab"]
+    assert set(summary["locations"]) == {"Library", "Lab"}
+    assert fleet["devices"] == 3
+    assert fleet["status"] == {"green": 1, "yellow": 0, "red": 2, "stale": 0, "offline": 0}
+    assert (library["status"]["red"], lab["status"]["green"]) == (2, 1)
+    assert sum(r["devices"] for r in library["top_reasons"]) == 2
+    # One invalid_credentials failure per latest check-in
+    assert fleet["auth_failures_by_reason"] == {"invalid_credentials": 3}
+    assert library["disk_c_free_pct"]["p5"] < 6 and lab["disk_c_free_pct"]["p50"] > 59
+
+    # Incremental counters agree with a fresh pass over device_latest
+    fleet_summary.seed()
+    assert client.get("/api/fleet/summary").json() == summary
+
+
+def test_sketch_quantiles_are_within_relative_accuracy():
+    sketch = QuantileSketch(relative_accuracy=0.01)
+    values = range(1, 1001)
+    for v in values:
+        sketch.add_index(sketch.index(v))
+    q = sketch.quantiles()
+    assert abs(q["p50"] - 500) <= 5.01 and abs(q["p95"] - 950) <= 9.51
+
+    # Values can be taken out again
+    for v in values:
+        sketch.add_index(sketch.index(v), -1)
+    assert sketch.n == 0 and sketch.counts == {}
+    assert sketch.quantiles()["p50"] is None
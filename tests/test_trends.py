@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+from app.decode import decode_checkin
+from app.ingest import store_checkins
+from app.trends import TrendStore, trend_store
+
+
+NOW_MS = 1780000000000
+STEP_MS = 300_000
+
+
+def _row(ts_ms, disk_pct, attempts=4, failures=1):
+    return {
+        "device_id": "PC-1",
+        "timestamp_utc": ts_ms,
+        "disk_c_free_pct": disk_pct,
+        "mypc_auth_attempts": attempts,
+        "mypc_auth_failures": failures,
+    }
+
+
+def test_disk_filling_up_over_the_last_hour():
+    store = TrendStore()
+    # 0.5 points lost every 5 minutes: 6 per hour
+    store.observe([_row(NOW_MS + k * STEP_MS, 60.0 - 0.5 * k) for k in range(13)])
+    trend = store.get("PC-1")
+    assert trend["disk_delta_1h"] == -6.0
+    assert trend["disk_slope_1h"] == -6.0
+    # Less than half a day of samples: no 24h figures yet
+    assert trend["disk_delta_24h"] is None and trend["disk_slope_24h"] is None
+    # 54% left at 6 points an hour
+    assert trend["disk_days_to_full"] == 0.4
+    assert trend["auth_fail_rate_1h"] == 0.25 and trend["auth_fail_rate_change"] == 0.0
+
+
+def test_window_ends_at_the_newest_checkin():
+    store = TrendStore()
+    store.observe([_row(NOW_MS + k * STEP_MS, 60.0) for k in range(13)])
+    before = store.get("PC-1")
+    # A late check-in doesn't move the window or the latest disk value
+    store.observe([_row(NOW_MS - 3 * 3600_000, 10.0, failures=4)])
+    assert store.get("PC-1")["disk_delta_1h"] == before["disk_delta_1h"] == 0.0
+    assert store.get("PC-1")["auth_fail_rate_1h"] == 0.25
+    assert store.get("PC-2") is None
+
+
+def test_restart_seeds_the_same_trends_from_rollups(client, checkin):
+    store_checkins([
+        decode_checkin(checkin("PC-1", NOW_MS + k * STEP_MS, disk_pct=60.0 - 0.1 * k))
+        for k in range(30)
+    ])
+    live = trend_store.get("PC-1")
+    assert live["disk_slope_1h"] == -1.2
+
+    assert trend_store.seed_from_rollups() == 1
+    assert trend_store.get("PC-1") == live
+    assert client.get("/api/devices").json()["devices"][0]["trend"] == live
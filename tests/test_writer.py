@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import db, main, writer
+from app.decode import decode_checkin
+from app.ingest import prepare_checkin
+from app.main import app
+from app.writer import CheckinWriter, WriterSettings
+
+
+NOW_MS = 1780000000000
+
+
+def _items(checkin, n):
+    records = [decode_checkin(checkin(f"PC-{k}", NOW_MS)) for k in range(n)]
+    return [(r, prepare_checkin(r)[0]) for r in records]
+
+
+def _count_checkins() -> int:
+    with db.connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM checkins").fetchone()[0]
+
+
+def test_fan_out_error_is_not_a_failed_write(db_path, checkin, monkeypatch):
+    def broken(rows, ids, inserted):
+        raise RuntimeError("consumer broke")
+
+    monkeypatch.setattr(writer, "fan_out_checkins", broken)
+    w = CheckinWriter(WriterSettings(linger_ms=0))
+    assert w.submit(_items(checkin, 3)) == [1, 2, 3]
+    w.start()
+    assert w.stop() is True
+
+    stats = w.stats()
+    assert (stats["committed"], stats["failed"], stats["batches"]) == (3, 0, 1)
+    assert stats["fan_out_errors"] == 1
+    assert stats["last_committed_ack"] == 3
+    assert _count_checkins() == 3
+
+
+@pytest.fixture
+def async_client(db_path, monkeypatch):
+    monkeypatch.setattr(main, "INGEST_MODE", "async")
+    monkeypatch.setenv("DASHBOARD_INGEST_QUEUE_SIZE", "2")
+    with TestClient(app, headers={"x-api-key": "dev-secret-key"}) as c:
+        yield c
+
+
+def _wait_committed(client, n):
+    deadline = time.monotonic() + 5
+    while client.get("/api/ingest/stats").json()["committed"] < n:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_async_checkin_is_acked_then_written(async_client, checkin):
+    body = checkin("PC-1", NOW_MS, disk_pct=5.0)
+    r = async_client.post("/api/checkin", json=body)
+    assert r.status_code == 202
+    assert r.json()["queued"] is True and r.json()["computed_status"] == "red"
+    ack = r.json()["ack_id"]
+
+    _wait_committed(async_client, 1)
+    stats = async_client.get("/api/ingest/stats").json()
+    assert stats["mode"] == "async" and stats["last_committed_ack"] >= ack
+    assert _count_checkins() == 1
+
+    # Once written, a retry is answered from the stored result, not queued
+    again = async_client.post("/api/checkin", json=body)
+    assert again.status_code == 200 and again.json()["duplicate"] is True
+    assert async_client.get("/api/ingest/stats").json()["enqueued"] == 1
+
+
+def test_full_queue_is_a_429_and_queues_nothing(async_client, checkin):
+    r = async_client.post("/api/checkins/batch", json=[checkin(f"PC-{k}", NOW_MS) for k in range(3)])
+    assert r.status_code == 429
+    assert r.headers["Retry-After"] == str(main.QUEUE_FULL_RETRY_AFTER_S)
+    stats = async_client.get("/api/ingest/stats").json()
+    assert (stats["enqueued"], stats["rejected_full"]) == (0, 3)